@@ -0,0 +1,457 @@
+import asyncio
+import importlib
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+# Compare the orchestration overhead of the frameworks on the same tool-using tasks.
+#
+# Every framework talks to the same local stub model (common/stub_model.py) and the
+# same local MCP server (common/stub_mcp.py), so the time not spent in the model is
+# the framework: prompt building, tool dispatch, MCP client, parsing, bookkeeping.
+#
+# Each framework runs in its own subprocess so the import time and memory are its own.
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "common"))
+sys.path.append(str(ROOT / "google-adk"))
+
+MODEL = "gpt-4.1-nano"
+
+INSTRUCTIONS = "You are a clinical trial expert. Use the tools if necessary to answer the questions."
+
+TASKS = {
+    # no tools, one model call: the overhead of a turn
+    "hello": "Say hello.",
+    # the flow of openai-agent-sdk/main.py over MCP: get_paper_abstract, then extract_nct_id
+    "pmid_nct": "What is the NCT ID for the paper PMID: 36990608?",
+    # the agent of google-adk/agent.py with function tools: get_weather and get_current_time
+    "weather_time": "What is the weather and the current time in New York?",
+}
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def weather_tools():
+    from weather_tools import get_current_time, get_weather
+    return [get_weather, get_current_time]
+
+
+###########################################################
+# Frameworks
+###########################################################
+
+class FrameworkRunner:
+    '''
+    Run a task with one framework. `modules` are imported first to measure the import time.
+    '''
+    modules = []
+
+    def __init__(self, base_url, mcp_url):
+        self.base_url = base_url
+        self.mcp_url = mcp_url
+        self.stack = AsyncExitStack()
+
+    async def setup(self, task):
+        raise NotImplementedError
+
+    async def run(self, prompt):
+        raise NotImplementedError
+
+    async def close(self):
+        await self.stack.aclose()
+
+
+class OpenAIAgentsRunner(FrameworkRunner):
+    modules = ["agents", "agents.mcp"]
+
+    async def setup(self, task):
+        from agents import Agent, OpenAIChatCompletionsModel, function_tool, set_tracing_disabled
+        from agents.mcp import MCPServerSse
+        from openai import AsyncOpenAI
+
+        set_tracing_disabled(True)
+        mcp_servers = []
+        tools = []
+        if task == "pmid_nct":
+            server = MCPServerSse(name="MCP/Stub", params={"url": self.mcp_url}, cache_tools_list=True)
+            mcp_servers.append(await self.stack.enter_async_context(server))
+        elif task == "weather_time":
+            tools = [function_tool(tool) for tool in weather_tools()]
+
+        self.agent = Agent(
+            name="Assistant",
+            instructions=INSTRUCTIONS,
+            model=OpenAIChatCompletionsModel(
+                model=MODEL,
+                openai_client=AsyncOpenAI(base_url=self.base_url, api_key="stub"),
+            ),
+            mcp_servers=mcp_servers,
+            tools=tools,
+        )
+
+    async def run(self, prompt):
+        from agents import Runner
+
+        result = await Runner.run(starting_agent=self.agent, input=prompt)
+        return result.final_output
+
+
+class SmolagentsRunner(FrameworkRunner):
+    modules = ["smolagents", "smolagents.mcp_client"]
+
+    async def setup(self, task):
+        from smolagents import OpenAIServerModel, ToolCallingAgent, tool
+        from smolagents.mcp_client import MCPClient
+
+        tools = []
+        self.mcp_client = None
+        if task == "pmid_nct":
+            self.mcp_client = MCPClient({"url": self.mcp_url})
+            tools = self.mcp_client.get_tools()
+        elif task == "weather_time":
+            tools = [tool(t) for t in weather_tools()]
+
+        self.agent = ToolCallingAgent(
+            tools=tools,
+            model=OpenAIServerModel(model_id=MODEL, api_base=self.base_url, api_key="stub"),
+            max_steps=5,
+            verbosity_level=0,
+        )
+
+    async def run(self, prompt):
+        # smolagents is sync, like in the examples
+        return str(self.agent.run(prompt))
+
+    async def close(self):
+        if self.mcp_client is not None:
+            self.mcp_client.disconnect()
+
+
+class AutogenRunner(FrameworkRunner):
+    modules = ["autogen_agentchat.agents", "autogen_ext.models.openai", "autogen_ext.tools.mcp"]
+
+    async def setup(self, task):
+        from autogen_agentchat.agents import AssistantAgent
+        from autogen_ext.models.openai import OpenAIChatCompletionClient
+        from autogen_ext.tools.mcp import SseServerParams, create_mcp_server_session, mcp_server_tools
+
+        tools = None
+        if task == "pmid_nct":
+            server_params = SseServerParams(url=self.mcp_url)
+            session = await self.stack.enter_async_context(create_mcp_server_session(server_params))
+            await session.initialize()
+            tools = await mcp_server_tools(server_params, session=session)
+        elif task == "weather_time":
+            tools = weather_tools()
+
+        self.model_client = OpenAIChatCompletionClient(model=MODEL, base_url=self.base_url, api_key="stub")
+        self.agent = AssistantAgent(
+            name="assistant",
+            model_client=self.model_client,
+            tools=tools,
+            system_message=INSTRUCTIONS,
+            # the agent stops after one round of tool calls, run() loops instead of reflecting
+            reflect_on_tool_use=False,
+        )
+
+    async def run(self, prompt):
+        from autogen_agentchat.messages import ToolCallSummaryMessage
+        from autogen_core import CancellationToken
+
+        await self.agent.on_reset(CancellationToken())
+        result = await self.agent.run(task=prompt)
+        # the same steps as the other frameworks: call the tools until the model answers,
+        # e.g., extract_nct_id after get_paper_abstract, at most 5 steps like smolagents
+        for _ in range(4):
+            if not isinstance(result.messages[-1], ToolCallSummaryMessage):
+                break
+            result = await self.agent.run()
+        return result.messages[-1].to_text()
+
+    async def close(self):
+        await self.model_client.close()
+        await super().close()
+
+
+class LangGraphRunner(FrameworkRunner):
+    modules = ["langgraph.prebuilt", "langchain_openai"]
+
+    async def setup(self, task):
+        from langchain_openai import ChatOpenAI
+        from langgraph.prebuilt import create_react_agent
+
+        tools = []
+        if task == "pmid_nct":
+            tools = await self.mcp_tools()
+        elif task == "weather_time":
+            tools = weather_tools()
+
+        self.agent = create_react_agent(
+            model=ChatOpenAI(model=MODEL, base_url=self.base_url, api_key="stub"),
+            tools=tools,
+            prompt=INSTRUCTIONS,
+        )
+
+    async def mcp_tools(self):
+        # there is no MCP adapter in the dependencies, so wrap the MCP tools as LangChain tools
+        from langchain_core.tools import StructuredTool
+        from mcp import ClientSession
+        from mcp.client.sse import sse_client
+
+        streams = await self.stack.enter_async_context(sse_client(self.mcp_url))
+        session = await self.stack.enter_async_context(ClientSession(*streams))
+        await session.initialize()
+
+        def make_tool(mcp_tool):
+            async def call_tool(**kwargs):
+                result = await session.call_tool(mcp_tool.name, kwargs)
+                return "\n".join(content.text for content in result.content if content.type == "text")
+
+            return StructuredTool(
+                name=mcp_tool.name,
+                description=mcp_tool.description or "",
+                args_schema=mcp_tool.inputSchema,
+                coroutine=call_tool,
+            )
+
+        return [make_tool(mcp_tool) for mcp_tool in (await session.list_tools()).tools]
+
+    async def run(self, prompt):
+        result = await self.agent.ainvoke({"messages": [("user", prompt)]})
+        return result["messages"][-1].content
+
+
+class GoogleADKRunner(FrameworkRunner):
+    modules = ["google.adk.agents", "google.adk.models.lite_llm", "google.adk.runners"]
+
+    async def setup(self, task):
+        from google.adk.agents import Agent
+        from google.adk.models.lite_llm import LiteLlm
+        from google.adk.runners import InMemoryRunner
+        from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, SseServerParams
+
+        tools = []
+        if task == "pmid_nct":
+            tools, exit_stack = await MCPToolset.from_server(connection_params=SseServerParams(url=self.mcp_url))
+            self.stack.push_async_exit(exit_stack)
+        elif task == "weather_time":
+            tools = weather_tools()
+
+        agent = Agent(
+            name="bench_agent",
+            model=LiteLlm(model=f"openai/{MODEL}", api_base=self.base_url, api_key="stub"),
+            instruction=INSTRUCTIONS,
+            tools=tools,
+        )
+        self.runner = InMemoryRunner(agent=agent, app_name="bench")
+
+    async def run(self, prompt):
+        from google.genai import types
+
+        session = self.runner.session_service.create_session(app_name="bench", user_id="bench")
+        final_output = None
+        async for event in self.runner.run_async(
+            user_id="bench",
+            session_id=session.id,
+            new_message=types.Content(role="user", parts=[types.Part(text=prompt)]),
+        ):
+            if event.is_final_response() and event.content and event.content.parts:
+                final_output = event.content.parts[0].text
+        return final_output
+
+
+FRAMEWORKS = {
+    "openai-agents": OpenAIAgentsRunner,
+    "smolagents": SmolagentsRunner,
+    "autogen": AutogenRunner,
+    "langgraph": LangGraphRunner,
+    "google-adk": GoogleADKRunner,
+}
+
+
+###########################################################
+# Worker: one framework, one task, in its own process
+###########################################################
+
+def stub_stats(base_url):
+    with urllib.request.urlopen(base_url.removesuffix("/v1") + "/stats") as response:
+        return json.load(response)
+
+
+async def worker(framework, task, base_url, mcp_url, runs):
+    rss_before_import = rss_mb()
+    started = time.perf_counter()
+    for module in FRAMEWORKS[framework].modules:
+        importlib.import_module(module)
+    import_seconds = time.perf_counter() - started
+    rss_after_import = rss_mb()
+
+    runner = FRAMEWORKS[framework](base_url, mcp_url)
+    started = time.perf_counter()
+    await runner.setup(task)
+    setup_seconds = time.perf_counter() - started
+
+    # warm up, e.g., lazy imports and connection pools
+    output = await runner.run(TASKS[task])
+
+    seconds = []
+    overhead = []
+    model_calls = []
+    tool_calls = []
+    for _ in range(runs):
+        before = stub_stats(base_url)
+        started = time.perf_counter()
+        await runner.run(TASKS[task])
+        elapsed = time.perf_counter() - started
+        after = stub_stats(base_url)
+
+        seconds.append(elapsed)
+        overhead.append(elapsed - (after["seconds"] - before["seconds"]))
+        model_calls.append(after["requests"] - before["requests"])
+        tool_calls.append(after["tool_calls"] - before["tool_calls"])
+    await runner.close()
+
+    return dict(
+        framework=framework,
+        task=task,
+        import_seconds=import_seconds,
+        setup_seconds=setup_seconds,
+        seconds=statistics.median(seconds),
+        overhead_seconds=statistics.median(overhead),
+        model_calls=statistics.median(model_calls),
+        tool_calls=statistics.median(tool_calls),
+        rss_before_import_mb=rss_before_import,
+        rss_after_import_mb=rss_after_import,
+        peak_rss_mb=peak_rss_mb(),
+        output=str(output)[:200],
+    )
+
+
+###########################################################
+# Report
+###########################################################
+
+def run_worker(framework, task, base_url, mcp_url, runs):
+    command = [
+        sys.executable, __file__, "worker",
+        "--framework", framework,
+        "--task", task,
+        "--base-url", base_url,
+        "--mcp-url", mcp_url,
+        "--runs", str(runs),
+    ]
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        print(f"* {framework}/{task} failed:\n{process.stderr[-2000:]}")
+        return None
+    # the result is the last line, frameworks may print to stdout
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def start_stub_mcp(port):
+    '''
+    Start the stub MCP server in its own process, it's shared by all the workers.
+    '''
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / "common" / "stub_mcp.py"), "run", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"failed to start the stub MCP server on port {port}")
+
+
+def report(results):
+    print()
+    print(f"{'framework':<14} {'task':<13} {'s/run':>7} {'overhead':>9} {'model':>6} {'tools':>6} "
+          f"{'ms/turn':>8} {'ms/tool':>8} {'import s':>9} {'RSS MB':>7} {'peak MB':>8}")
+
+    by_framework = {}
+    for result in results:
+        by_framework.setdefault(result["framework"], {})[result["task"]] = result
+
+    for framework, tasks in by_framework.items():
+        # the overhead of a turn comes from the no-tool task, the rest of a tool task's overhead is the tools'
+        hello = tasks.get("hello")
+        ms_per_turn = hello["overhead_seconds"] / max(hello["model_calls"], 1) * 1000 if hello else None
+
+        for task, result in tasks.items():
+            ms_per_tool = None
+            if ms_per_turn is not None and result["tool_calls"]:
+                tool_overhead = result["overhead_seconds"] * 1000 - ms_per_turn * result["model_calls"]
+                # below zero, the tools cost less than the noise of the per-turn estimate
+                ms_per_tool = max(tool_overhead, 0.0) / result["tool_calls"]
+
+            print(
+                f"{framework:<14} {task:<13} {result['seconds']:>7.3f} {result['overhead_seconds']:>9.3f} "
+                f"{result['model_calls']:>6} {result['tool_calls']:>6} "
+                f"{ms_per_turn if ms_per_turn is not None else float('nan'):>8.1f} "
+                f"{ms_per_tool if ms_per_tool is not None else float('nan'):>8.1f} "
+                f"{result['import_seconds']:>9.2f} {result['rss_after_import_mb']:>7.0f} {result['peak_rss_mb']:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["run", "worker"], nargs="?", default="run")
+    parser.add_argument("--framework", type=str, action="append", choices=list(FRAMEWORKS))
+    parser.add_argument("--task", type=str, action="append", choices=list(TASKS))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--model-port", type=int, default=8765)
+    parser.add_argument("--mcp-port", type=int, default=50009)
+    parser.add_argument("--base-url", type=str)
+    parser.add_argument("--mcp-url", type=str)
+    parser.add_argument("--output", type=str, default=None, help="save the results as JSON")
+    args = parser.parse_args()
+
+    if args.action == "worker":
+        result = asyncio.run(worker(args.framework[0], args.task[0], args.base_url, args.mcp_url, args.runs))
+        print(json.dumps(result))
+
+    elif args.action == "run":
+        from stub_model import StubServer
+
+        mcp_process = start_stub_mcp(args.mcp_port)
+        mcp_url = f"http://127.0.0.1:{args.mcp_port}/sse"
+        try:
+            # no model latency at all, everything measured is the framework
+            with StubServer(port=args.model_port, latency_ms=0, ms_per_token=0) as model_server:
+                results = []
+                for framework in args.framework or list(FRAMEWORKS):
+                    for task in args.task or list(TASKS):
+                        print(f"* running {framework}/{task}")
+                        result = run_worker(framework, task, model_server.base_url, mcp_url, args.runs)
+                        if result is not None:
+                            results.append(result)
+        finally:
+            mcp_process.terminate()
+
+        report(results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
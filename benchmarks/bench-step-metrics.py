@@ -0,0 +1,171 @@
+import asyncio
+import functools
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# The per-step metrics of the same task in each framework, and what measuring them costs.
+#
+# Every framework runs the weather_time task of bench-frameworks.py (get_weather and
+# get_current_time for New York) against the stub model, streamed where the framework
+# streams with one setting, so the time to first token is measured. The runs are saved to
+# a metrics store (common/step_metrics.py) and compared step by step, autogen's run is the
+# baseline. Then each framework runs the task again without the metrics, to measure the
+# overhead of the instrumentation.
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "common"))
+sys.path.append(str(ROOT / "google-adk"))
+
+from step_metrics import StepMetrics, report
+from stub_model import StubServer
+
+MODEL = "gpt-4.1-nano"
+INSTRUCTIONS = "You are a clinical trial expert. Use the tools if necessary to answer the questions."
+TASK = "What is the weather and the current time in New York?"
+
+
+def weather_tools(tool_ms):
+    '''
+    The tools of google-adk/agent.py, with a latency like a real API.
+    '''
+    from weather_tools import get_current_time, get_weather
+
+    def slow(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            time.sleep(tool_ms / 1000)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    return [slow(get_weather), slow(get_current_time)]
+
+
+###########################################################
+# Frameworks: a run function per framework, given the http clients and the tools
+###########################################################
+
+async def run_autogen(base_url, http_client, async_http_client, tools):
+    from autogen_agentchat.agents import AssistantAgent
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+    model_client = OpenAIChatCompletionClient(model=MODEL, base_url=base_url, api_key="stub", http_client=async_http_client)
+    agent = AssistantAgent(
+        name="assistant",
+        model_client=model_client,
+        tools=tools,
+        system_message=INSTRUCTIONS,
+        reflect_on_tool_use=True,
+        model_client_stream=True,  # like test-streaming.py
+    )
+    await agent.run(task=TASK)
+    await model_client.close()
+
+
+async def run_openai_agents(base_url, http_client, async_http_client, tools):
+    from agents import Agent, OpenAIChatCompletionsModel, Runner, function_tool, set_tracing_disabled
+    from openai import AsyncOpenAI
+
+    set_tracing_disabled(True)
+    agent = Agent(
+        name="Assistant",
+        instructions=INSTRUCTIONS,
+        model=OpenAIChatCompletionsModel(
+            model=MODEL,
+            openai_client=AsyncOpenAI(base_url=base_url, api_key="stub", http_client=async_http_client),
+        ),
+        tools=[function_tool(tool) for tool in tools],
+    )
+    result = Runner.run_streamed(starting_agent=agent, input=TASK)
+    async for _ in result.stream_events():
+        pass
+
+
+async def run_smolagents(base_url, http_client, async_http_client, tools):
+    from smolagents import OpenAIServerModel, ToolCallingAgent, tool
+
+    agent = ToolCallingAgent(
+        tools=[tool(t) for t in tools],
+        model=OpenAIServerModel(model_id=MODEL, api_base=base_url, api_key="stub", client_kwargs={"http_client": http_client}),
+        max_steps=5,
+        verbosity_level=0,
+    )
+    # smolagents is sync and does not stream the tool calling agent's model calls
+    await asyncio.to_thread(agent.run, TASK)
+
+
+async def run_langgraph(base_url, http_client, async_http_client, tools):
+    from langchain_openai import ChatOpenAI
+    from langgraph.prebuilt import create_react_agent
+
+    agent = create_react_agent(
+        model=ChatOpenAI(model=MODEL, base_url=base_url, api_key="stub", streaming=True, stream_usage=True,
+                         http_client=http_client, http_async_client=async_http_client),
+        tools=tools,
+        prompt=INSTRUCTIONS,
+    )
+    await agent.ainvoke({"messages": [("user", TASK)]})
+
+
+FRAMEWORKS = {
+    "autogen": run_autogen,
+    "openai-agents": run_openai_agents,
+    "smolagents": run_smolagents,
+    "langgraph": run_langgraph,
+}
+
+
+async def bench(args, server, metrics):
+    import httpx
+
+    # the metrics of each framework, the first run warms it up
+    runs = []
+    for framework, run_task in FRAMEWORKS.items():
+        tools = [metrics.tool(tool) for tool in weather_tools(args.tool_ms)]
+        for i in range(2):
+            with metrics.run("weather_time", framework=framework, warmup=i == 0) as run:
+                await run_task(server.base_url, metrics.http_client(), metrics.async_http_client(), tools)
+        runs.append(metrics.runs(ids=[run.id])[0])
+        print(f"* {framework}: {run.seconds * 1000:.0f}ms, {runs[-1]['steps']} steps")
+    print()
+    report(metrics, runs)
+
+    # the cost of the instrumentation: the same runs with plain clients and tools
+    print()
+    print(f"{'framework':<14} {'plain ms':>9} {'metered ms':>11} {'overhead ms':>12}")
+    for framework, run_task in FRAMEWORKS.items():
+        seconds = {}
+        for metered in (False, True):
+            tools = weather_tools(args.tool_ms)
+            samples = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                if metered:
+                    with metrics.run("overhead", framework=framework):
+                        await run_task(server.base_url, metrics.http_client(), metrics.async_http_client(),
+                                       [metrics.tool(tool) for tool in tools])
+                else:
+                    await run_task(server.base_url, httpx.Client(), httpx.AsyncClient(), tools)
+                samples.append(time.perf_counter() - started)
+            seconds[metered] = statistics.median(samples)
+        print(f"{framework:<14} {seconds[False] * 1000:>9.1f} {seconds[True] * 1000:>11.1f} "
+              f"{(seconds[True] - seconds[False]) * 1000:>+12.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", type=str, default=None, help="the metrics store, a temporary one by default")
+    parser.add_argument("--runs", type=int, default=5, help="runs per framework, to measure the overhead")
+    parser.add_argument("--tool-ms", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--ms-per-token", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            StubServer(port=args.port, latency_ms=args.latency_ms, ms_per_token=args.ms_per_token) as server:
+        asyncio.run(bench(args, server, StepMetrics(args.store or tmpdir)))
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import httpx
+
+# An exact-match response cache for the model clients of all the frameworks.
+#
+# autogen's OpenAIChatCompletionClient, smolagents' OpenAIServerModel and LangChain's
+# ChatOpenAI (used by LangGraph's create_react_agent) all talk to the model through the
+# `openai` package, which accepts a custom httpx client. So the cache sits in the httpx
+# transport: the key is a hash of the canonical request (URL, model, messages, tools and
+# all the other settings), the value is the response body.
+#
+#   cache = ResponseCache("~/.cache/mcp-quick-start/llm")
+#
+#   # autogen
+#   OpenAIChatCompletionClient(model="gpt-4.1-nano", http_client=cache.async_http_client())
+#   # smolagents
+#   OpenAIServerModel(model_id="gpt-4.1-nano", client_kwargs={"http_client": cache.http_client()})
+#   # LangGraph
+#   create_react_agent(model=ChatOpenAI(model="gpt-4.1-nano", http_client=cache.http_client(),
+#                                       http_async_client=cache.async_http_client()), ...)
+
+# only the endpoints whose response is a pure function of the request are cached
+CACHEABLE_PATHS = ("/chat/completions", "/completions", "/embeddings", "/responses")
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def canonical_request(method, url, body):
+    '''
+    Get the canonical form of a model request.
+
+    The JSON body is re-serialized with sorted keys, so two requests with the same
+    model, messages, tools and settings are equal regardless of the key order.
+    '''
+    payload = json.loads(body) if body else None
+    return json.dumps([method, url, payload], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def request_key(method, url, body):
+    return hashlib.sha256(canonical_request(method, url, body).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    '''
+    A size-bounded, on-disk cache of model responses with a TTL.
+
+    The entries are in one SQLite file, so the cache survives reruns and can be
+    shared by processes. When the total size is over `max_bytes`, the least recently
+    used entries are evicted.
+    '''
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        '''
+        :param path: The cache folder.
+        :param ttl: Seconds an entry is valid, None for no expiry.
+        :param max_bytes: The max total size of the cached responses.
+        '''
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.path, "responses.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                elapsed REAL NOT NULL,
+                content_type TEXT,
+                body BLOB NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        '''
+        Get a cached response.
+
+        :return: A tuple of (content type, body), or None on a miss.
+        '''
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT created, elapsed, content_type, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            created, elapsed, content_type, body = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self._total_bytes -= len(body)
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            self.saved_seconds += elapsed
+            return content_type, body
+
+    def set(self, key, content_type, body, elapsed):
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT LENGTH(body) FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, now, now, elapsed, content_type, body),
+            )
+            self._total_bytes += len(body) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # drop the expired entries first, then the least recently used ones
+        if self.ttl is not None and self._total_bytes > self.max_bytes:
+            deadline = time.time() - self.ttl
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM responses WHERE created < ?", (deadline,)
+            ).fetchone()
+            self._db.execute("DELETE FROM responses WHERE created < ?", (deadline,))
+            self._total_bytes -= size
+            self.expired += count
+
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, LENGTH(body) FROM responses ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evicted += 1
+
+    def key_for(self, request):
+        '''
+        Get the cache key of an httpx request, or None if the request can't be cached.
+        '''
+        if request.method != "POST" or not request.url.path.endswith(CACHEABLE_PATHS):
+            return None
+
+        body = request.read()
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        # a streamed response is consumed as it arrives, caching it would delay the first token
+        if payload.get("stream"):
+            return None
+
+        return request_key(request.method, str(request.url), body)
+
+    def http_client(self, **kwargs):
+        '''
+        Get an httpx client that serves the cached responses, for the sync `openai` client.
+        '''
+        return httpx.Client(transport=CachingTransport(self), **kwargs)
+
+    def async_http_client(self, **kwargs):
+        '''
+        Get an httpx client that serves the cached responses, for the async `openai` client.
+        '''
+        return httpx.AsyncClient(transport=AsyncCachingTransport(self), **kwargs)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            bypassed=self.bypassed,
+            hit_rate=self.hit_rate,
+            expired=self.expired,
+            evicted=self.evicted,
+            saved_seconds=self.saved_seconds,
+            entries=self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+            bytes=self._total_bytes,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        self._db.close()
+
+
+def cached_response(request, cached):
+    content_type, body = cached
+    return httpx.Response(
+        200,
+        headers={"content-type": content_type or "application/json", "x-llm-cache": "hit"},
+        content=body,
+        request=request,
+    )
+
+
+class CachingTransport(httpx.BaseTransport):
+    def __init__(self, cache, transport=None):
+        self.cache = cache
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        key = self.cache.key_for(request)
+        if key is None:
+            self.cache.bypassed += 1
+            return self.transport.handle_request(request)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached_response(request, cached)
+
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        if response.status_code == 200:
+            body = response.read()
+            self.cache.set(key, response.headers.get("content-type"), body, time.perf_counter() - started)
+            logging.debug(f"cached the response of {request.url}")
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCachingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cache, transport=None):
+        self.cache = cache
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        key = self.cache.key_for(request)
+        if key is None:
+            self.cache.bypassed += 1
+            return await self.transport.handle_async_request(request)
+
+        # the SQLite reads and writes block, they run in a thread so the event loop does not wait on the disk
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached_response(request, cached)
+
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        if response.status_code == 200:
+            body = await response.aread()
+            await asyncio.to_thread(self.cache.set, key, response.headers.get("content-type"), body,
+                                    time.perf_counter() - started)
+            logging.debug(f"cached the response of {request.url}")
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["stats", "clear", "test"])
+    parser.add_argument("--path", type=str, default="~/.cache/mcp-quick-start/llm")
+    args = parser.parse_args()
+
+    if args.action == "stats":
+        print(ResponseCache(args.path).stats())
+    elif args.action == "clear":
+        ResponseCache(args.path).clear()
+    elif args.action == "test":
+        import tempfile
+        from openai import OpenAI
+        from stub_model import StubServer
+
+        cache = ResponseCache(tempfile.mkdtemp())
+        with StubServer(latency_ms=200) as server:
+            client = OpenAI(base_url=server.base_url, api_key="stub", http_client=cache.http_client())
+            for _ in range(3):
+                started = time.perf_counter()
+                response = client.chat.completions.create(
+                    model="stub",
+                    messages=[{"role": "user", "content": "Summarize PMID: 36990608"}],
+                )
+                print(f"* {time.perf_counter() - started:.3f}s: {response.choices[0].message.content[:40]}...")
+        print(cache.stats())
@@ -0,0 +1,323 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+# On-demand profiling of the tools of a server, without a restart under a profiler.
+#
+# A fraction of the tool calls is profiled, 0 (the default) to 1, and the rate can be
+# changed while the server runs, e.g., with `kill -USR1 <pid>`. A call that is not sampled
+# costs one comparison. Two modes:
+#   sample     a thread samples the stack of the profiled calls every `interval` seconds,
+#              which they barely notice, into collapsed stacks for flame graphs
+#   cprofile   cProfile, with exact call counts and a higher overhead on the profiled calls
+#
+# The profiles go to a folder:
+#   calls.jsonl             one record per profiled call: tool, start, seconds, file
+#   calls/<tool>/*.folded   the collapsed stacks of each call, or *.prof for cProfile
+#   <tool>.folded           the collapsed stacks of all the calls of a tool, for
+#                           flamegraph.pl, speedscope or inferno
+#   <tool>.prof             the cProfile stats of all the calls, for pstats or snakeviz
+#
+#   profiler = ToolProfiler("profiles/pubmed")
+#   profile_fastmcp_tools(mcp, profiler)   # before offload_fastmcp_tools
+#   profiler.start(rate=0.05)              # or --profile 0.05, or kill -USR1
+
+MODES = ("sample", "cprofile")
+
+# the rate `toggle` turns profiling on with, when it was never started
+DEFAULT_RATE = 0.1
+# The sampler needs the GIL, so it takes a sample at least every switch interval (5ms)
+# of a CPU-bound call, and every `interval` of a call waiting on the network.
+DEFAULT_INTERVAL = 0.001
+
+# the aggregated profiles are written at most this often, and at exit
+FLUSH_SECONDS = 5.0
+
+# the per-call profiles kept for each tool, the oldest are removed
+MAX_CALL_FILES = 1000
+
+
+def collapse(frame, stop_code=None):
+    '''
+    Collapse a stack into one "root;...;leaf" line, the format of flamegraph.pl.
+
+    :param stop_code: The code object of the frame to stop at, excluded, e.g., the
+        profiler's wrapper, so the stacks start at the tool.
+    '''
+    names = []
+    while frame is not None and frame.f_code is not stop_code:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    '''
+    Samples the stacks of the threads registered with it, from one background thread that
+    sleeps while there is nothing to sample.
+    '''
+
+    def __init__(self, interval=DEFAULT_INTERVAL, stop_code=None):
+        self.interval = interval
+        self.stop_code = stop_code
+        self._active = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def begin(self, thread_id):
+        samples = Counter()
+        with self._condition:
+            self._active[thread_id] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return samples
+
+    def end(self, thread_id):
+        with self._condition:
+            return self._active.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._active:
+                    self._condition.wait()
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                if (frame := frames.get(thread_id)) is not None:
+                    # empty when the thread is in the wrapper itself, before or after the tool
+                    if stack := collapse(frame, self.stop_code):
+                        samples[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class ToolProfiler:
+    '''
+    Profiles a sampled fraction of the calls of the tools it wraps.
+    '''
+
+    def __init__(self, path, rate=0.0, mode="sample", interval=DEFAULT_INTERVAL):
+        '''
+        :param path: The folder of the profiles.
+        :param rate: The fraction of the calls to profile, 0 to disable.
+        :param mode: sample or cprofile.
+        :param interval: The seconds between two stack samples, in sample mode.
+        '''
+        if mode not in MODES:
+            raise ValueError(f"unknown profiling mode: {mode}, expected one of {', '.join(MODES)}")
+        self.path = Path(path)
+        self.rate = rate
+        self.mode = mode
+        self._last_rate = rate or DEFAULT_RATE
+        self._lock = threading.Lock()
+        self._sampler = StackSampler(interval, stop_code=self._profiled_call.__code__)
+        self._folded = {}
+        self._stats = {}
+        self._call_files = {}
+        self._calls = 0
+        self._flushed_at = time.monotonic()
+
+    def start(self, rate=None, mode=None):
+        '''
+        Start profiling, or change the rate or the mode, e.g., from a signal handler.
+        '''
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"unknown profiling mode: {mode}, expected one of {', '.join(MODES)}")
+            self.mode = mode
+        self.rate = self._last_rate = min(1.0, rate or self._last_rate)
+        logging.info(f"* profiling {self.rate:.0%} of the tool calls ({self.mode}) to {self.path}")
+
+    def stop(self):
+        self.rate = 0.0
+        self.flush()
+        logging.info(f"* stopped profiling, the profiles are in {self.path}")
+
+    def toggle(self):
+        if self.rate > 0:
+            self.stop()
+        else:
+            self.start()
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR1", None)):
+        '''
+        Toggle the profiling when the process gets a signal, SIGUSR1 by default.
+        '''
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return
+        # the handler only flips the rate, the files are written by the tool calls
+        signal.signal(signum, lambda *_: threading.Thread(target=self.toggle, daemon=True).start())
+
+    def wrap(self, fn, name=None):
+        '''
+        Wrap a sync tool so a `rate` fraction of its calls is profiled.
+        '''
+        name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rate = self.rate
+            if rate <= 0.0 or (rate < 1.0 and random.random() >= rate):
+                return fn(*args, **kwargs)
+            return self._profiled_call(name, fn, args, kwargs)
+
+        return wrapper
+
+    def _profiled_call(self, name, fn, args, kwargs):
+        mode = self.mode
+        started = time.time()
+        profile = None
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+        else:
+            thread_id = threading.get_ident()
+            self._sampler.begin(thread_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+                samples = None
+            else:
+                samples = self._sampler.end(thread_id)
+            self._record(name, mode, started, time.time() - started, profile, samples)
+
+    def _record(self, name, mode, started, seconds, profile, samples):
+        with self._lock:
+            self._calls += 1
+            call = self._calls
+        folder = self.path / "calls" / name
+        folder.mkdir(parents=True, exist_ok=True)
+        file = folder / f"{call:06d}-{int(seconds * 1000)}ms.{'prof' if profile is not None else 'folded'}"
+
+        if profile is not None:
+            profile.dump_stats(file)
+        else:
+            write_folded(file, samples)
+        with self._lock:
+            if profile is not None:
+                if (stats := self._stats.get(name)) is None:
+                    self._stats[name] = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            else:
+                self._folded.setdefault(name, Counter()).update(samples)
+            files = self._call_files.setdefault(name, deque())
+            files.append(file)
+            removed = files.popleft() if len(files) > MAX_CALL_FILES else None
+            with open(self.path / "calls.jsonl", "a") as f:
+                f.write(json.dumps(dict(
+                    tool=name,
+                    mode=mode,
+                    started=started,
+                    seconds=seconds,
+                    samples=sum(samples.values()) if samples is not None else None,
+                    file=str(file.relative_to(self.path)),
+                )) + "\n")
+            flush = time.monotonic() - self._flushed_at >= FLUSH_SECONDS
+        if removed is not None:
+            removed.unlink(missing_ok=True)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write the aggregated profiles of each tool.
+        '''
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            folded = {name: Counter(samples) for name, samples in self._folded.items()}
+            stats = dict(self._stats)
+            if not folded and not stats:
+                return
+            self.path.mkdir(parents=True, exist_ok=True)
+            for name, tool_stats in stats.items():
+                tool_stats.dump_stats(self.path / f"{name}.prof")
+        for name, samples in folded.items():
+            write_folded(self.path / f"{name}.folded", samples)
+
+    def status(self):
+        return dict(rate=self.rate, mode=self.mode, path=str(self.path), profiled_calls=self._calls)
+
+
+def write_folded(path, samples):
+    '''
+    Write collapsed stacks, "frame;frame;frame count" per line, through a temporary file.
+    '''
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+
+
+def profile_fastmcp_tools(mcp, profiler):
+    '''
+    Make the sync tools registered on a FastMCP server profiled by the profiler. Call it
+    before offload_fastmcp_tools, so the calls are profiled in the thread that runs them.
+    '''
+    for tool in mcp._tool_manager.list_tools():
+        if not tool.is_async:
+            tool.fn = profiler.wrap(tool.fn, name=tool.name)
+
+
+if __name__ == "__main__":
+    import argparse
+    import atexit
+    import tempfile
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["bench"])
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    def parse_records(n: int = 2000) -> int:
+        """
+        A CPU-bound tool: dump and parse JSON records, like a paper being parsed.
+        """
+        records = [dict(pmid=str(i), title=f"title {i}", authors=[f"Author{j} A" for j in range(6)]) for i in range(n)]
+        return len(json.loads(json.dumps(records)))
+
+    def tiny() -> int:
+        return 1
+
+    def per_call(fn, calls):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        return (time.perf_counter() - started) / calls
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        profiler = ToolProfiler(tmpdir)
+        atexit.register(profiler.flush)
+        for label, fn, calls in [("tiny", tiny, args.calls * 10), ("parse_records", parse_records, args.calls // 10)]:
+            baseline = per_call(fn, calls)
+            wrapped = profiler.wrap(fn)
+            profiler.rate = 0.0
+            disabled = per_call(wrapped, calls)
+            print(f"* {label}: {baseline * 1e6:.2f}us per call, profiling disabled {disabled * 1e6:.2f}us "
+                  f"(+{(disabled - baseline) * 1e9:.0f}ns)")
+            for mode in MODES:
+                for rate in (0.01, 1.0):
+                    profiler.start(rate=rate, mode=mode)
+                    seconds = per_call(wrapped, calls)
+                    print(f"  - {mode} {rate:.0%}: {seconds * 1e6:.2f}us per call ({seconds / baseline - 1:+.0%})")
+                    profiler.stop()
+        print(f"* {profiler.status()['profiled_calls']} calls profiled:",
+              ", ".join(sorted(child.name for child in Path(tmpdir).iterdir())))
+        print("* the hottest stack of parse_records:", open(Path(tmpdir) / "parse_records.folded").readline().strip())
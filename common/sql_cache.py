@@ -0,0 +1,357 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import event, text
+
+# A result cache for the SQL queries written by the text2SQL agents.
+#
+# Agents re-issue the same analytical queries over and over, often with different
+# whitespace, comments or keyword case. The queries are normalized, and the results are
+# cached under the normalized query and the versions of the tables it reads:
+# - a write through the engine (INSERT, UPDATE, DELETE, DDL) bumps the version of its table
+# - on SQLite, a write by any other connection or process is caught by PRAGMA data_version
+#
+#   cache = QueryCache(engine)
+#   rows = cache.get_or_run(sql, lambda statement: connection.execute(statement).fetchall())
+#
+# The tables a query reads are taken from SQLite itself: compiling the query calls an
+# authorizer with every table it reads, through joins, subqueries, CTEs and views. On other
+# databases the tables can't be known for sure, so the results are only cached with a ttl.
+#
+# The statement objects are reused too, and equivalent queries reach the driver as the
+# same text, so they hit SQLAlchemy's compiled cache and the driver's prepared statements.
+
+DEFAULT_MAX_ENTRIES = 1024
+
+# string literals and quoted identifiers are kept as they are, everything else is normalized
+TOKEN = re.compile(
+    r"""('(?:[^']|'')*')|("(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])|(--[^\n]*|/\*.*?\*/)|(\s+)|([^'"`\[\s/-]+|[/-])""",
+    re.DOTALL,
+)
+IDENTIFIER = r"""((?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[\w$]+)(?:\.(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[\w$]+))?)"""
+WRITTEN_TABLE = re.compile(
+    r"^\s*(?:insert\s+(?:or\s+\w+\s+)?into|replace\s+into|update(?:\s+or\s+\w+)?|delete\s+from"
+    r"|truncate(?:\s+table)?|(?:create|drop|alter)\s+table(?:\s+if\s+(?:not\s+)?exists)?)\s+" + IDENTIFIER,
+    re.IGNORECASE,
+)
+WRITE_STATEMENT = re.compile(
+    r"^\s*(?:insert|replace|update|delete|truncate|create|drop|alter|vacuum|attach|detach)\b", re.IGNORECASE
+)
+
+
+def normalize_sql(sql):
+    '''
+    Normalize a query for execution and for the cache key.
+
+    :return: The query without comments, with single spaces and without a trailing
+        semicolon, and the same with everything outside of quotes lowercased.
+    '''
+    parts = []
+    key_parts = []
+    for literal, quoted, comment, space, word in TOKEN.findall(sql):
+        if comment or space:
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+                key_parts.append(" ")
+        elif literal or quoted:
+            parts.append(literal or quoted)
+            key_parts.append(literal or quoted)
+        else:
+            parts.append(word)
+            key_parts.append(word.lower())
+    compact = "".join(parts).strip().rstrip(";").strip()
+    key = "".join(key_parts).strip().rstrip(";").strip()
+    return compact, key
+
+
+def table_name(identifier):
+    # the last part of a schema-qualified name, without quotes, lowercased
+    return identifier.split(".")[-1].strip('"`[]').lower()
+
+
+class QueryCache:
+    '''
+    An in-memory LRU cache of query results, invalidated when the tables they read change.
+
+    The cached values are shared, so they must not be modified by the callers.
+    '''
+
+    def __init__(self, engine, max_entries=DEFAULT_MAX_ENTRIES, ttl=None):
+        '''
+        :param engine: The SQLAlchemy engine the queries run on.
+        :param max_entries: The max number of cached results and of compiled statements.
+        :param ttl: Seconds a result is valid, None for no expiry. Set it for databases
+            other than SQLite that are written by other processes.
+        '''
+        self.engine = engine
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._statements = OrderedDict()
+        self._versions = defaultdict(int)
+        # bumped when a write cannot be tied to a table, invalidates everything
+        self._epoch = 0
+        # all the writes through the engine, for the results whose tables are not known
+        self._writes = 0
+
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        self._data_version_path = self._sqlite_path()
+        self._data_version_db = None
+        self._data_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.invalidations = 0
+        self.expired = 0
+        self.evicted = 0
+        self.saved_seconds = 0.0
+
+    def _sqlite_path(self):
+        '''
+        :return: The file of a SQLite database, whose data_version changes whenever another
+            connection commits a write, or None.
+        '''
+        url = self.engine.url
+        if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+            if url.get_backend_name() != "sqlite" and self.ttl is None:
+                logging.warning("* the tables a query reads are not known, the results are not cached without a ttl")
+            return None
+        return url.database
+
+    def _tables_read(self, statement):
+        '''
+        Get the tables a query reads from SQLite: compiling it with EXPLAIN, without running
+        it, calls the authorizer with every table read, including the ones behind a view.
+
+        :return: The lowercased table names, or None if they can't be known.
+        '''
+        if self.engine.dialect.name != "sqlite":
+            return None
+        tables = set()
+
+        def authorizer(action, table, column, database, source):
+            if action == sqlite3.SQLITE_READ and table:
+                tables.add(table.lower())
+            return sqlite3.SQLITE_OK
+
+        try:
+            with self.engine.connect() as connection:
+                driver_connection = connection.connection.driver_connection
+                driver_connection.set_authorizer(authorizer)
+                try:
+                    parameters = {name: None for name in statement.compile().params}
+                    driver_connection.execute(f"EXPLAIN {statement.text}", parameters).fetchall()
+                finally:
+                    driver_connection.set_authorizer(None)
+        except Exception as e:
+            # e.g., a table that does not exist yet, the query will fail with the same error
+            logging.debug(f"* cannot tell the tables a query reads, its result is not cached: {e}")
+            return None
+        return frozenset(tables)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not WRITE_STATEMENT.match(statement):
+            return
+        with self._lock:
+            self._writes += 1
+            if match := WRITTEN_TABLE.match(statement):
+                self._versions[table_name(match.group(1))] += 1
+            else:
+                self._epoch += 1
+            self.invalidations += 1
+
+    def _check_data_version(self):
+        # called with the lock held, the database is watched once the engine has created it
+        if self._data_version_db is None:
+            if self._data_version_path is None or not os.path.exists(self._data_version_path):
+                return
+            self._data_version_db = sqlite3.connect(
+                f"file:{self._data_version_path}?mode=ro", uri=True, check_same_thread=False
+            )
+        data_version = self._data_version_db.execute("PRAGMA data_version").fetchone()[0]
+        if self._data_version is not None and data_version != self._data_version:
+            self._epoch += 1
+            self.invalidations += 1
+        self._data_version = data_version
+
+    def invalidate(self, table=None):
+        '''
+        Invalidate the results that read a table, or all the results.
+        '''
+        with self._lock:
+            if table is None:
+                self._epoch += 1
+            else:
+                self._versions[table.lower()] += 1
+            self.invalidations += 1
+
+    def _prepare(self, sql):
+        with self._lock:
+            if (prepared := self._statements.get(sql)) is not None:
+                self._statements.move_to_end(sql)
+                return prepared
+
+        # outside the lock, it takes a connection from the pool
+        compact, key = normalize_sql(sql)
+        statement = text(compact)
+        prepared = (statement, key, self._tables_read(statement))
+        if prepared[2] is None and self.engine.dialect.name == "sqlite":
+            # compiled again next time, the tables may exist by then
+            return prepared
+        with self._lock:
+            self._statements[sql] = prepared
+            if len(self._statements) > self.max_entries:
+                self._statements.popitem(last=False)
+        return prepared
+
+    def statement(self, sql):
+        '''
+        Get the compiled statement of a query, normalized so that equivalent queries share it.
+        '''
+        return self._prepare(sql)[0]
+
+    def get_or_run(self, sql, run, *key_extra):
+        '''
+        Get the cached result of a query, or run it and cache the result.
+
+        :param sql: The query.
+        :param run: A function that takes the compiled statement and returns the result.
+        :param key_extra: Anything else the result depends on, e.g., the page.
+        '''
+        statement, normalized, tables = self._prepare(sql)
+        # a write reads no tables, but it must run every time, and its result is not worth caching
+        if WRITE_STATEMENT.match(statement.text) or (tables is None and self.ttl is None):
+            with self._lock:
+                self.uncached += 1
+            return run(statement)
+
+        with self._lock:
+            self._check_data_version()
+            key = (
+                normalized,
+                key_extra,
+                self._epoch,
+                tuple(sorted((table, self._versions[table]) for table in tables))
+                if tables is not None else self._writes,
+            )
+
+            if (entry := self._entries.get(key)) is not None:
+                created, elapsed, value = entry
+                if self.ttl is None or time.time() - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.saved_seconds += elapsed
+                    return value
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+
+        started = time.perf_counter()
+        value = run(statement)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._entries[key] = (time.time(), elapsed, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        return value
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            uncached=self.uncached,
+            hit_rate=self.hit_rate,
+            invalidations=self.invalidations,
+            expired=self.expired,
+            evicted=self.evicted,
+            saved_seconds=self.saved_seconds,
+            entries=len(self._entries),
+            statements=len(self._statements),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        event.remove(self.engine, "after_cursor_execute", self._after_cursor_execute)
+        if self._data_version_db is not None:
+            self._data_version_db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["test"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "test.db")
+        # the database does not exist yet, the engine creates it on the first connection
+        engine = create_engine(f"sqlite:///{path}")
+        cache = QueryCache(engine)
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE receipts (customer TEXT, price REAL)"))
+            connection.execute(text("CREATE TABLE customers (name TEXT, city TEXT)"))
+            connection.execute(text("CREATE VIEW prices AS SELECT price FROM receipts"))
+            connection.execute(text("INSERT INTO receipts VALUES ('Alan', 1.5)"))
+            connection.execute(text("INSERT INTO customers VALUES ('Alan', 'Paris')"))
+
+        def run(statement):
+            with engine.connect() as connection:
+                return connection.execute(statement).fetchall()
+
+        queries = {
+            "comma join": "SELECT r.price, c.city FROM receipts r, customers c WHERE r.customer = c.name",
+            "subquery": "SELECT price FROM receipts WHERE customer IN (SELECT name FROM customers WHERE city = 'Paris')",
+            "cte": "WITH paris AS (SELECT name FROM customers WHERE city = 'Paris') SELECT COUNT(*) FROM paris",
+            "view": "SELECT SUM(price) FROM prices",
+        }
+        for label, sql in queries.items():
+            print(f"* {label}: reads {sorted(cache._prepare(sql)[2])}")
+        assert cache._prepare(queries["comma join"])[2] == {"receipts", "customers"}
+        assert cache._prepare(queries["view"])[2] >= {"receipts"}
+
+        for label, sql in queries.items():
+            before = cache.get_or_run(sql, run)
+            assert cache.get_or_run(sql, run) is before, label
+        # a write to the second table of the comma join, through the engine
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE customers SET city = 'Rome'"))
+        assert cache.get_or_run(queries["comma join"], run) == [(1.5, "Rome")]
+        assert cache.get_or_run(queries["cte"], run) == [(0,)]
+        # a write by another process, through the view
+        with sqlite3.connect(path) as other:
+            other.execute("UPDATE receipts SET price = 2.5")
+        assert cache.get_or_run(queries["view"], run) == [(2.5,)]
+        print("* the cached results follow the writes:", cache.stats())
+
+        # a write runs every time, it is never answered from the cache
+        def run_write(statement):
+            with engine.begin() as connection:
+                return connection.execute(statement).rowcount
+
+        for _ in range(3):
+            cache.get_or_run("INSERT INTO customers VALUES ('Bea', 'Oslo')", run_write)
+        assert cache.get_or_run("SELECT COUNT(*) FROM customers WHERE name = 'Bea'", run) == [(3,)]
+        print("* the writes are not cached:", cache.stats())
+        cache.close()
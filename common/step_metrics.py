@@ -0,0 +1,591 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import httpx
+
+# Per-step metrics of the agents, the same for every framework.
+#
+# autogen, the OpenAI Agents SDK, smolagents and LangGraph all talk to the model through the
+# `openai` package, which accepts a custom httpx client, so the model calls are measured in
+# the httpx transport, like the response cache (llm_cache.py): the time to the first token
+# of a streamed response, the total time, and the tokens in and out, from the usage of the
+# response or estimated when it has none. The tools are measured by wrapping them.
+#
+# A step is one model call and the tool calls that follow it. The time of a step not spent
+# in the model or the tools is the framework's overhead: building the prompt, parsing the
+# response, dispatching the tools. Each run is saved to a local SQLite store:
+#   runs    one row per run: the totals, the name, the framework and the tags
+#   steps   one row per step: seconds, time to first token, tokens, tool calls, overhead
+#   calls   one row per model or tool call, for the slow tools
+# and `report` compares the runs step by step, against the first one or a baseline.
+#
+#   metrics = StepMetrics("~/.cache/mcp-quick-start/metrics")
+#   # autogen, or http_client=metrics.http_client() for the sync clients, as in llm_cache.py
+#   model_client = OpenAIChatCompletionClient(model="gpt-4.1-nano", http_client=metrics.async_http_client())
+#   agent = AssistantAgent("assistant", model_client=model_client, tools=[metrics.tool(get_weather)])
+#   with metrics.run("weather", framework="autogen"):
+#       await agent.run(task="What is the weather in Paris?")
+#
+#   python common/step_metrics.py report --store ~/.cache/mcp-quick-start/metrics --name weather
+
+MODEL_PATHS = ("/chat/completions", "/completions", "/responses")
+
+# a step slower than the baseline's by this fraction, and by SLOW_MIN_SECONDS, is flagged
+SLOW_RATIO = 0.5
+SLOW_MIN_SECONDS = 0.05
+
+_current_run = contextvars.ContextVar("step_metrics_run", default=None)
+
+
+def estimate_tokens(text):
+    '''
+    A rough token count, about 4 characters per token, for the responses without usage.
+    '''
+    return estimate_tokens_from_length(len(text))
+
+
+def estimate_tokens_from_length(length):
+    '''
+    The same estimate from a number of characters, for a text that is never joined.
+    '''
+    return length // 4 + 1
+
+
+def usage_tokens(usage):
+    '''
+    :return: The prompt and completion tokens of a usage, in the chat completions or the responses format.
+    '''
+    if not usage:
+        return None, None
+    return usage.get("prompt_tokens", usage.get("input_tokens")), usage.get("completion_tokens", usage.get("output_tokens"))
+
+
+class Run:
+    '''
+    The model and tool calls of one run, timed from its start.
+    '''
+
+    def __init__(self, name, framework="", tags=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.framework = framework
+        self.tags = tags or {}
+        self.started = time.time()
+        self.seconds = None
+        self.error = None
+        self.calls = []
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def now(self):
+        return time.perf_counter() - self._started
+
+    def add(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def finish(self, error=None):
+        self.seconds = self.now()
+        self.error = error
+
+    def steps(self):
+        '''
+        Group the calls into steps: a model call starts a step, the tool calls after it are
+        part of it. The time not covered by a call counts as the overhead of the step it
+        leads to, and the time after the last call as the last step's.
+        '''
+        steps = []
+        covered = 0.0
+        for call in sorted(self.calls, key=lambda call: call["start"]):
+            if call["kind"] == "model" or not steps:
+                steps.append(dict(
+                    step=len(steps),
+                    start=call["start"],
+                    model=None,
+                    ttft=None,
+                    model_seconds=0.0,
+                    prompt_tokens=0,
+                    completion_tokens=0,
+                    tools=[],
+                    tool_calls=0,
+                    tool_seconds=0.0,
+                    overhead_seconds=0.0,
+                ))
+            step = steps[-1]
+            step["overhead_seconds"] += max(0.0, call["start"] - covered)
+            covered = max(covered, call["end"])
+            seconds = call["end"] - call["start"]
+            if call["kind"] == "model":
+                step.update(model=call["name"], ttft=call["ttft"], model_seconds=seconds,
+                            prompt_tokens=call["prompt_tokens"] or 0, completion_tokens=call["completion_tokens"] or 0)
+            else:
+                step["tools"].append(call["name"])
+                step["tool_calls"] += 1
+                step["tool_seconds"] += seconds
+        if steps:
+            steps[-1]["overhead_seconds"] += max(0.0, (self.seconds or self.now()) - covered)
+        for step in steps:
+            step["seconds"] = step["model_seconds"] + step["tool_seconds"] + step["overhead_seconds"]
+        return steps
+
+
+class ModelCall:
+    '''
+    Times a model request, and reads the first token and the usage from its response as it streams.
+    '''
+
+    def __init__(self, run, request):
+        self.run = run
+        self.start = run.now()
+        try:
+            payload = json.loads(request.read() or b"{}")
+        except ValueError:
+            payload = {}
+        self.model = payload.get("model", "")
+        self.streamed = bool(payload.get("stream"))
+        self.prompt_estimate = estimate_tokens(json.dumps(payload.get("messages", payload.get("input", ""))))
+        self.ttft = None
+        self.prompt_tokens = self.completion_tokens = None
+        self.text_length = 0
+        self.status_code = None
+        self._buffer = b""
+        self._body = []
+        self._finished = False
+
+    def feed(self, chunk):
+        if not self.streamed:
+            self._body.append(chunk)
+            return
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            if line.startswith(b"data:") and line[5:].strip() not in (b"", b"[DONE]"):
+                try:
+                    self.read_event(json.loads(line[5:]))
+                except ValueError:
+                    pass
+
+    def read_event(self, data):
+        # chat completions: choices[].delta with content or tool calls, responses: *.delta events
+        delta = ""
+        for choice in data.get("choices") or []:
+            choice_delta = choice.get("delta") or {}
+            delta += choice_delta.get("content") or ""
+            if choice_delta.get("tool_calls"):
+                delta += json.dumps(choice_delta["tool_calls"])
+        if str(data.get("type", "")).endswith(".delta"):
+            delta += data["delta"] if isinstance(data.get("delta"), str) else json.dumps(data.get("delta") or "")
+        if delta:
+            if self.ttft is None:
+                self.ttft = self.run.now() - self.start
+            self.text_length += len(delta)
+        prompt_tokens, completion_tokens = usage_tokens(data.get("usage") or (data.get("response") or {}).get("usage"))
+        if prompt_tokens is not None:
+            self.prompt_tokens, self.completion_tokens = prompt_tokens, completion_tokens
+
+    def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        end = self.run.now()
+        if not self.streamed:
+            try:
+                body = json.loads(b"".join(self._body) or b"{}")
+            except ValueError:
+                body = {}
+            self.prompt_tokens, self.completion_tokens = usage_tokens(body.get("usage"))
+            self.text_length = len(json.dumps(body.get("choices") or body.get("output") or ""))
+        estimated = self.prompt_tokens is None
+        self.run.add(dict(
+            kind="model",
+            name=self.model,
+            start=self.start,
+            end=end,
+            # without streaming, the first token comes with the whole response
+            ttft=self.ttft if self.ttft is not None else end - self.start,
+            prompt_tokens=self.prompt_estimate if estimated else self.prompt_tokens,
+            completion_tokens=estimate_tokens_from_length(self.text_length) if estimated else self.completion_tokens,
+            estimated=estimated,
+            error=None if self.status_code is None or self.status_code < 400 else f"HTTP {self.status_code}",
+        ))
+
+
+class MeteredStream(httpx.SyncByteStream):
+    def __init__(self, stream, call):
+        self.stream = stream
+        self.call = call
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.call.feed(chunk)
+            yield chunk
+        self.call.finish()
+
+    def close(self):
+        self.call.finish()
+        self.stream.close()
+
+
+class AsyncMeteredStream(httpx.AsyncByteStream):
+    def __init__(self, stream, call):
+        self.stream = stream
+        self.call = call
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.call.feed(chunk)
+            yield chunk
+        self.call.finish()
+
+    async def aclose(self):
+        self.call.finish()
+        await self.stream.aclose()
+
+
+def metered_response(request, response, stream, call):
+    call.status_code = response.status_code
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        stream=stream,
+        request=request,
+        extensions=response.extensions,
+    )
+
+
+class MetricsTransport(httpx.BaseTransport):
+    def __init__(self, metrics, transport=None):
+        self.metrics = metrics
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        run = self.metrics.current_run()
+        if run is None or not request.url.path.endswith(MODEL_PATHS):
+            return self.transport.handle_request(request)
+        call = ModelCall(run, request)
+        response = self.transport.handle_request(request)
+        return metered_response(request, response, MeteredStream(response.stream, call), call)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncMetricsTransport(httpx.AsyncBaseTransport):
+    def __init__(self, metrics, transport=None):
+        self.metrics = metrics
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        run = self.metrics.current_run()
+        if run is None or not request.url.path.endswith(MODEL_PATHS):
+            return await self.transport.handle_async_request(request)
+        call = ModelCall(run, request)
+        response = await self.transport.handle_async_request(request)
+        return metered_response(request, response, AsyncMeteredStream(response.stream, call), call)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class StepMetrics:
+    '''
+    Records the steps of the runs of agents, and saves them to a SQLite store.
+    '''
+
+    def __init__(self, path):
+        '''
+        :param path: The folder of the store.
+        '''
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._active = []
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.path, "metrics.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                framework TEXT NOT NULL,
+                started REAL NOT NULL,
+                seconds REAL NOT NULL,
+                steps INTEGER NOT NULL,
+                model_calls INTEGER NOT NULL,
+                tool_calls INTEGER NOT NULL,
+                model_seconds REAL NOT NULL,
+                tool_seconds REAL NOT NULL,
+                overhead_seconds REAL NOT NULL,
+                ttft REAL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                tags TEXT NOT NULL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS runs_name ON runs (name, started);
+            CREATE TABLE IF NOT EXISTS steps (
+                run_id TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                start REAL NOT NULL,
+                seconds REAL NOT NULL,
+                model TEXT,
+                ttft REAL,
+                model_seconds REAL NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                tools TEXT NOT NULL,
+                tool_calls INTEGER NOT NULL,
+                tool_seconds REAL NOT NULL,
+                overhead_seconds REAL NOT NULL,
+                PRIMARY KEY (run_id, step)
+            );
+            CREATE TABLE IF NOT EXISTS calls (
+                run_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                start REAL NOT NULL,
+                seconds REAL NOT NULL,
+                ttft REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                estimated INTEGER NOT NULL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS calls_run ON calls (run_id);
+        """)
+
+    def current_run(self):
+        '''
+        The run of the calling task, or the only active run, for the tools the frameworks
+        run in a thread pool, which does not carry the context over.
+        '''
+        run = _current_run.get()
+        if run is None:
+            with self._lock:
+                run = self._active[0] if len(self._active) == 1 else None
+        return run
+
+    @contextmanager
+    def run(self, name, framework="", **tags):
+        '''
+        Record the calls made inside, and save the run at the end, also when it fails.
+
+        :param name: The name of the task, the runs with the same name are compared.
+        :param framework: The framework running the task.
+        :param tags: Anything else to tell the runs apart, e.g., the model or the version.
+        '''
+        run = Run(name, framework, tags)
+        token = _current_run.set(run)
+        with self._lock:
+            self._active.append(run)
+        error = None
+        try:
+            yield run
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            run.finish(error)
+            _current_run.reset(token)
+            with self._lock:
+                self._active.remove(run)
+            self.save(run)
+
+    def http_client(self, transport=None, **kwargs):
+        '''
+        Get an httpx client that measures the model calls, for the sync `openai` client.
+
+        :param transport: The transport to wrap, e.g., a CachingTransport.
+        '''
+        return httpx.Client(transport=MetricsTransport(self, transport), **kwargs)
+
+    def async_http_client(self, transport=None, **kwargs):
+        '''
+        Get an httpx client that measures the model calls, for the async `openai` client.
+        '''
+        return httpx.AsyncClient(transport=AsyncMetricsTransport(self, transport), **kwargs)
+
+    @contextmanager
+    def tool_call(self, name):
+        '''
+        Time a tool call that can't be wrapped, e.g., an MCP tool.
+        '''
+        run = self.current_run()
+        if run is None:
+            yield
+            return
+        start = run.now()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            run.add(dict(kind="tool", name=name, start=start, end=run.now(), ttft=None,
+                         prompt_tokens=None, completion_tokens=None, estimated=False, error=error))
+
+    def tool(self, fn=None, name=None):
+        '''
+        Wrap a sync or async tool function so its calls are timed. The wrapper keeps the
+        name, the docstring and the signature, which the frameworks build the schema from.
+        '''
+        if fn is None:
+            return functools.partial(self.tool, name=name)
+        name = name or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with self.tool_call(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.tool_call(name):
+                    return fn(*args, **kwargs)
+
+        return wrapper
+
+    def save(self, run):
+        steps = run.steps()
+        model_calls = [call for call in run.calls if call["kind"] == "model"]
+        ttfts = [call["ttft"] for call in model_calls if call["ttft"] is not None]
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run.id, run.name, run.framework, run.started, run.seconds, len(steps),
+                    len(model_calls), sum(step["tool_calls"] for step in steps),
+                    sum(step["model_seconds"] for step in steps), sum(step["tool_seconds"] for step in steps),
+                    sum(step["overhead_seconds"] for step in steps),
+                    statistics.median(ttfts) if ttfts else None,
+                    sum(step["prompt_tokens"] for step in steps), sum(step["completion_tokens"] for step in steps),
+                    json.dumps(run.tags), run.error,
+                ),
+            )
+            self._db.executemany(
+                "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run.id, step["step"], step["start"], step["seconds"], step["model"], step["ttft"], step["model_seconds"],
+                  step["prompt_tokens"], step["completion_tokens"], ",".join(step["tools"]), step["tool_calls"],
+                  step["tool_seconds"], step["overhead_seconds"]) for step in steps],
+            )
+            self._db.executemany(
+                "INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run.id, call["kind"], call["name"], call["start"], call["end"] - call["start"], call["ttft"],
+                  call["prompt_tokens"], call["completion_tokens"], int(call["estimated"]), call["error"])
+                 for call in run.calls],
+            )
+            self._db.commit()
+        logging.info(f"* run {run.id} ({run.name}): {len(steps)} steps in {run.seconds:.2f}s")
+
+    def _rows(self, sql, parameters=()):
+        with self._lock:
+            cursor = self._db.execute(sql, parameters)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def runs(self, name=None, framework=None, ids=None, last=20):
+        '''
+        :return: The runs, the oldest first: the `last` ones with the name and the framework, or the ids.
+        '''
+        if ids:
+            rows = self._rows(f"SELECT * FROM runs WHERE id IN ({','.join('?' * len(ids))})", ids)
+            return sorted(rows, key=lambda row: ids.index(row["id"]))
+        where = " AND ".join(condition for condition, value in (("name = ?", name), ("framework = ?", framework)) if value)
+        parameters = [value for value in (name, framework) if value]
+        rows = self._rows(f"SELECT * FROM runs {'WHERE ' + where if where else ''} ORDER BY started DESC LIMIT ?",
+                          parameters + [last])
+        return rows[::-1]
+
+    def steps(self, run_id):
+        return self._rows("SELECT * FROM steps WHERE run_id = ? ORDER BY step", (run_id,))
+
+    def calls(self, run_id):
+        return self._rows("SELECT * FROM calls WHERE run_id = ? ORDER BY start", (run_id,))
+
+    def close(self):
+        self._db.close()
+
+
+###########################################################
+# Report
+###########################################################
+
+def ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+
+def report(metrics, runs, baseline=None, slow_ratio=SLOW_RATIO, slow_min_seconds=SLOW_MIN_SECONDS):
+    '''
+    Print the runs side by side, then their steps against the baseline's, the first run by
+    default, with the slow steps flagged.
+    '''
+    if not runs:
+        print("* no runs")
+        return
+    baseline = baseline or runs[0]
+    print(f"{'run':<12} {'name':<16} {'framework':<14} {'steps':>5} {'ms':>7} {'model ms':>8} {'tool ms':>8} "
+          f"{'overhead':>8} {'ttft p50':>8} {'tokens in':>9} {'out':>6}")
+    for run in runs:
+        marker = "*" if run["id"] == baseline["id"] else " "
+        print(f"{run['id']:<11}{marker} {run['name'][:16]:<16} {run['framework'][:14]:<14} {run['steps']:>5} "
+              f"{ms(run['seconds']):>7} {ms(run['model_seconds']):>8} {ms(run['tool_seconds']):>8} "
+              f"{ms(run['overhead_seconds']):>8} {ms(run['ttft']):>8} {run['prompt_tokens']:>9} {run['completion_tokens']:>6}"
+              + (f"  {run['error']}" if run["error"] else ""))
+
+    baseline_steps = metrics.steps(baseline["id"])
+    print()
+    print(f"* the steps, against the baseline {baseline['id']} (ms, and the change in brackets)")
+    print(f"{'run':<12} {'step':>4} {'ms':>13} {'ttft':>11} {'model':>11} {'tools':>11} {'overhead':>11} "
+          f"{'in':>6} {'out':>5}  tools")
+    for run in runs:
+        for step in metrics.steps(run["id"]):
+            base = baseline_steps[step["step"]] if step["step"] < len(baseline_steps) else None
+
+            def cell(key):
+                value = step[key]
+                if base is None or run["id"] == baseline["id"] or value is None or base[key] is None:
+                    return f"{ms(value):>11}"
+                return f"{ms(value):>5} ({(value - base[key]) * 1000:+.0f})".rjust(11)
+
+            slow = base is not None and step["seconds"] - base["seconds"] > max(slow_min_seconds, slow_ratio * base["seconds"])
+            print(f"{run['id']:<12} {step['step']:>4} {cell('seconds'):>13} {cell('ttft')} {cell('model_seconds')} "
+                  f"{cell('tool_seconds')} {cell('overhead_seconds')} {step['prompt_tokens']:>6} "
+                  f"{step['completion_tokens']:>5}  {step['tools']}{'  SLOW' if slow else ''}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["report", "calls"])
+    parser.add_argument("--store", type=str, default="~/.cache/mcp-quick-start/metrics")
+    parser.add_argument("--name", type=str, default=None, help="only the runs of this task")
+    parser.add_argument("--framework", type=str, default=None)
+    parser.add_argument("--runs", type=str, nargs="+", default=None, help="the ids of the runs to compare")
+    parser.add_argument("--baseline", type=str, default=None, help="the id of the run to compare to, the first by default")
+    parser.add_argument("--last", type=int, default=5)
+    args = parser.parse_args()
+
+    metrics = StepMetrics(args.store)
+    runs = metrics.runs(name=args.name, framework=args.framework, ids=args.runs, last=args.last)
+    if args.action == "report":
+        baseline = metrics.runs(ids=[args.baseline])[0] if args.baseline else None
+        report(metrics, runs, baseline=baseline)
+    elif args.action == "calls":
+        for run in runs:
+            print(f"* {run['id']} ({run['name']}, {run['framework']})")
+            for call in metrics.calls(run["id"]):
+                print(f"  {call['start'] * 1000:>7.0f}ms {call['kind']:<5} {call['name']:<24} {ms(call['seconds']):>6}ms"
+                      + (f" ttft {ms(call['ttft'])}ms" if call["kind"] == "model" else "")
+                      + (f" {call['error']}" if call["error"] else ""))
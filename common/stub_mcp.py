@@ -0,0 +1,100 @@
+import sys
+from pathlib import Path
+
+from mcp.server.fastmcp import FastMCP
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "mcp"))
+from clinical_trial import extract_nct_id
+from pubmed_parse import create_paper
+
+# A local MCP server with the tools of the PubMed and Clinical Trial servers for benchmarks.
+#
+# get_paper_abstract parses a canned efetch response with the real parser instead of
+# calling NCBI, so the tool calls cost the same every time and need no network.
+
+SAMPLE_EFETCH_XML = """<?xml version="1.0" ?>
+<PubmedArticleSet>
+<PubmedArticle>
+    <MedlineCitation Status="MEDLINE" Owner="NLM">
+        <PMID Version="1">{pmid}</PMID>
+        <DateCompleted><Year>2023</Year><Month>04</Month><Day>03</Day></DateCompleted>
+        <DateRevised><Year>2023</Year><Month>04</Month><Day>11</Day></DateRevised>
+        <Article PubModel="Print">
+            <Journal>
+                <JournalIssue CitedMedium="Internet">
+                    <PubDate><Year>2023</Year><Month>Mar</Month></PubDate>
+                </JournalIssue>
+                <Title>The Lancet</Title>
+            </Journal>
+            <ArticleTitle>A randomised, placebo-controlled trial of a stub intervention.</ArticleTitle>
+            <Abstract>
+                <AbstractText Label="BACKGROUND">The effect of the stub intervention is unknown.</AbstractText>
+                <AbstractText Label="METHODS">We did a randomised, double-blind, placebo-controlled trial.</AbstractText>
+                <AbstractText Label="FINDINGS">The primary outcome improved in the intervention group.</AbstractText>
+                <AbstractText Label="FUNDING">This study is registered with ClinicalTrials.gov, NCT02446405.</AbstractText>
+            </Abstract>
+            <AuthorList>
+                <Author><LastName>Smith</LastName><ForeName>John</ForeName><Initials>J</Initials></Author>
+                <Author><LastName>Doe</LastName><ForeName>Jane</ForeName><Initials>J</Initials></Author>
+            </AuthorList>
+            <PublicationTypeList>
+                <PublicationType UI="D016449">Randomized Controlled Trial</PublicationType>
+                <PublicationType UI="D016428">Journal Article</PublicationType>
+            </PublicationTypeList>
+        </Article>
+        <MeshHeadingList>
+            <MeshHeading><DescriptorName UI="D006801" MajorTopicYN="N">Humans</DescriptorName></MeshHeading>
+        </MeshHeadingList>
+    </MedlineCitation>
+    <PubmedData>
+        <History>
+            <PubMedPubDate PubStatus="pubmed"><Year>2023</Year><Month>3</Month><Day>29</Day></PubMedPubDate>
+            <PubMedPubDate PubStatus="medline"><Year>2023</Year><Month>4</Month><Day>3</Day></PubMedPubDate>
+        </History>
+        <ArticleIdList>
+            <ArticleId IdType="pubmed">{pmid}</ArticleId>
+            <ArticleId IdType="doi">10.1016/S0140-6736(23)00000-0</ArticleId>
+        </ArticleIdList>
+    </PubmedData>
+</PubmedArticle>
+</PubmedArticleSet>
+"""
+
+# Create server
+mcp = FastMCP("Stub PubMed")
+
+
+@mcp.tool()
+def get_paper_abstract(pmid: str) -> str:
+    """Get the abstract of a paper from PubMed
+
+    Args:
+        pmid: The PubMed ID of the paper
+
+    Returns:
+        The abstract of the paper
+    """
+    paper = create_paper(SAMPLE_EFETCH_XML.format(pmid=pmid))
+    return paper['abstract']
+
+
+mcp.add_tool(extract_nct_id)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["run", "test"])
+    parser.add_argument("--port", type=int, default=50009)
+    args = parser.parse_args()
+
+    if args.action == "run":
+        mcp.settings.port = args.port
+        mcp.run(
+            transport="sse",
+        )
+    elif args.action == "test":
+        abstract = get_paper_abstract("36990608")
+        print(abstract)
+        print(extract_nct_id(abstract))
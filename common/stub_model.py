@@ -0,0 +1,390 @@
+import ast
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# A local OpenAI-compatible chat completion server for benchmarks.
+#
+# It never calls a real model. Replies are produced by a few deterministic rules
+# and delayed like a real model would be: a fixed latency, plus a prefill cost per
+# prompt token and a decode cost per completion token. So the benchmarks measure
+# the frameworks (and how much they send to the model), not the model.
+#
+# The rules:
+# 1. if tools are offered, call the ones that make sense for the conversation so far
+#    - get_paper_abstract for every PMID mentioned by the user and not fetched yet
+#    - extract_nct_id on the fetched abstracts
+#    - get_weather and get_current_time for the city asked about
+# 2. otherwise answer with one line per PMID / tool result seen in the conversation,
+#    and end with the completion marker asked for in the system message, e.g., "TERMINATE"
+#    (through the final_answer tool if there is one, like smolagents expects)
+
+PMID_PATTERN = re.compile(r"PMID:?\s*(\d+)")
+CITY_PATTERN = re.compile(r"\bin ([A-Z][a-zA-Z]*(?: [A-Z][a-zA-Z]*)*)")
+MARKER_PATTERN = re.compile(r"end (?:your message )?with \"([A-Z_]+)\"")
+
+DEFAULT_ABSTRACT_WORDS = 24
+
+
+def estimate_tokens(text):
+    '''
+    A rough token count, about 4 characters per token.
+    '''
+    return len(text) // 4 + 1
+
+
+def message_text(message):
+    '''
+    Get the text of a chat message, the content can be a string or a list of parts.
+    '''
+    content = message.get("content")
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def base_tool_name(name):
+    '''
+    Strip the namespace added by the MCP gateway, e.g., "pubmed__get_paper_abstract".
+    '''
+    return name.rsplit("__", 1)[-1]
+
+
+def read_conversation(messages):
+    '''
+    Get the tool calls and tool results in a conversation.
+
+    Besides the OpenAI format, this understands how smolagents replays its memory:
+    "Calling tools:\n[...]" assistant messages and "Observation:\n..." user messages.
+
+    :return: A tuple of (the user text, [(tool name, arguments)], [tool result]).
+    '''
+    user_text = []
+    calls = []
+    results = []
+    for message in messages:
+        role = message.get("role")
+        text = message_text(message)
+
+        for tool_call in message.get("tool_calls") or []:
+            arguments = tool_call["function"].get("arguments") or "{}"
+            calls.append((base_tool_name(tool_call["function"]["name"]), json.loads(arguments)))
+
+        if role == "tool":
+            results.append(text)
+        elif role == "assistant" and "Calling tools:\n" in text:
+            try:
+                for tool_call in ast.literal_eval(text.split("Calling tools:\n", 1)[1]):
+                    arguments = tool_call["function"]["arguments"]
+                    if isinstance(arguments, str):
+                        arguments = json.loads(arguments)
+                    calls.append((base_tool_name(tool_call["function"]["name"]), arguments))
+            except (ValueError, SyntaxError, KeyError, IndexError):
+                pass
+        elif role == "user" and text.startswith("Observation:"):
+            results.append(text.split("\n", 1)[-1])
+        elif role == "user":
+            user_text.append(text)
+
+    return " ".join(user_text), calls, results
+
+
+class StubPolicy:
+    '''
+    The deterministic rules that decide what the stub model replies.
+    '''
+
+    def __init__(self, words_per_item=DEFAULT_ABSTRACT_WORDS):
+        self.words_per_item = words_per_item
+
+    def tool_calls(self, messages, tools):
+        available = {base_tool_name(t["function"]["name"]): t["function"]["name"] for t in tools}
+        user_text, called, tool_results = read_conversation(messages)
+        called_names = {name for name, _ in called}
+
+        calls = []
+        if "get_paper_abstract" in available:
+            fetched = {args.get("pmid") for name, args in called if name == "get_paper_abstract"}
+            for pmid in dict.fromkeys(PMID_PATTERN.findall(user_text)):
+                if pmid not in fetched:
+                    calls.append((available["get_paper_abstract"], {"pmid": pmid}))
+        if calls:
+            return calls
+
+        if "extract_nct_id" in available and "extract_nct_id" not in called_names and tool_results:
+            return [(available["extract_nct_id"], {"text": tool_results[-1]})]
+
+        city = CITY_PATTERN.search(user_text)
+        if city is not None:
+            for name in ["get_weather", "get_current_time"]:
+                if name in available and name not in called_names:
+                    calls.append((available[name], {"city": city.group(1)}))
+        if calls:
+            return calls
+
+        if "final_answer" in available:
+            return [(available["final_answer"], {"answer": self.answer(messages)})]
+
+        return calls
+
+    def answer(self, messages):
+        system_text = " ".join(message_text(m) for m in messages if m.get("role") == "system")
+        user_text, _, tool_results = read_conversation(messages)
+
+        lines = ["Here is what I found."]
+        filler = " ".join(["finding"] * self.words_per_item)
+        for pmid in dict.fromkeys(PMID_PATTERN.findall(user_text)):
+            lines.append(f"- PMID {pmid}: {filler}")
+        for result in tool_results:
+            lines.append(f"- {result[:200]}")
+
+        marker = MARKER_PATTERN.search(system_text)
+        if marker is not None:
+            lines.append(marker.group(1))
+
+        return "\n".join(lines)
+
+
+class StubStats:
+    '''
+    What the stub model was asked to do, for the benchmark reports.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.tool_call_replies = 0
+            self.tool_calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.seconds = 0.0
+
+    def add(self, prompt_tokens, completion_tokens, tool_calls):
+        with self.lock:
+            self.requests += 1
+            self.tool_call_replies += int(tool_calls > 0)
+            self.tool_calls += tool_calls
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def add_seconds(self, seconds):
+        # the time spent "in the model", i.e., from the request until the last byte of the reply
+        with self.lock:
+            self.seconds += seconds
+
+    def to_dict(self):
+        return dict(
+            requests=self.requests,
+            tool_call_replies=self.tool_call_replies,
+            tool_calls=self.tool_calls,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            seconds=self.seconds,
+        )
+
+
+def create_app(
+    latency_ms=50.0,
+    ms_per_prompt_token=0.0,
+    ms_per_token=2.0,
+    words_per_item=DEFAULT_ABSTRACT_WORDS,
+    policy=None,
+):
+    '''
+    Create the stub model server.
+
+    :param latency_ms: The fixed latency of every request.
+    :param ms_per_prompt_token: The prefill cost, paid before the first token.
+    :param ms_per_token: The decode cost of every completion token.
+    :param words_per_item: How long each line of an answer is.
+    :param policy: The rules to reply with, a StubPolicy by default.
+    :return: The FastAPI app, with the stats at `app.state.stats`.
+    '''
+    app = FastAPI()
+    policy = policy or StubPolicy(words_per_item=words_per_item)
+    stats = StubStats()
+    app.state.stats = stats
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.to_dict()
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats.reset()
+        return stats.to_dict()
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        started = time.perf_counter()
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "stub")
+
+        tool_calls = []
+        if body.get("tools") and body.get("tool_choice") != "none":
+            for name, arguments in policy.tool_calls(messages, body["tools"]):
+                tool_calls.append({
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(arguments)},
+                })
+        content = None if tool_calls else policy.answer(messages)
+
+        prompt_tokens = estimate_tokens(json.dumps(messages)) + estimate_tokens(json.dumps(body.get("tools", [])))
+        completion_tokens = estimate_tokens(content or json.dumps(tool_calls))
+        # smolagents' final_answer is how it answers, not a real tool call
+        n_tool_calls = sum(base_tool_name(t["function"]["name"]) != "final_answer" for t in tool_calls)
+        stats.add(prompt_tokens, completion_tokens, n_tool_calls)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        # prefill
+        await asyncio.sleep((latency_ms + ms_per_prompt_token * prompt_tokens) / 1000)
+
+        if not body.get("stream"):
+            await asyncio.sleep(ms_per_token * completion_tokens / 1000)
+            stats.add_seconds(time.perf_counter() - started)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content, "tool_calls": tool_calls or None},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta, finish=None, choices=True, **extra):
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if choices else [],
+                **extra,
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def stream():
+            yield chunk({"role": "assistant", "content": ""})
+            if tool_calls:
+                await asyncio.sleep(ms_per_token * completion_tokens / 1000)
+                for index, tool_call in enumerate(tool_calls):
+                    yield chunk({"tool_calls": [{"index": index, **tool_call}]})
+            else:
+                # decode word by word
+                words = re.findall(r"\S+\s*", content)
+                per_word = ms_per_token * completion_tokens / max(len(words), 1) / 1000
+                for word in words:
+                    await asyncio.sleep(per_word)
+                    yield chunk({"content": word})
+            yield chunk({}, finish=finish_reason)
+            if include_usage:
+                yield chunk(None, choices=False, usage=usage)
+            yield "data: [DONE]\n\n"
+            stats.add_seconds(time.perf_counter() - started)
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+class BackgroundServer:
+    '''
+    Serve an ASGI app in a background thread, e.g., inside a benchmark process.
+    '''
+
+    def __init__(self, app, host="127.0.0.1", port=8765):
+        self.app = app
+        self.url = f"http://{host}:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError(f"failed to start the server at {self.url}")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+class StubServer(BackgroundServer):
+    '''
+    Run the stub model server in a background thread.
+
+    with StubServer(port=8765, latency_ms=20) as server:
+        client = OpenAI(base_url=server.base_url, api_key="stub")
+    '''
+
+    def __init__(self, host="127.0.0.1", port=8765, **kwargs):
+        super().__init__(create_app(**kwargs), host=host, port=port)
+        self.base_url = f"{self.url}/v1"
+
+    @property
+    def stats(self):
+        return self.app.state.stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["run", "test"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.0)
+    parser.add_argument("--ms-per-token", type=float, default=2.0)
+    args = parser.parse_args()
+
+    kwargs = dict(
+        latency_ms=args.latency_ms,
+        ms_per_prompt_token=args.ms_per_prompt_token,
+        ms_per_token=args.ms_per_token,
+    )
+    if args.action == "run":
+        uvicorn.run(create_app(**kwargs), host="127.0.0.1", port=args.port)
+    elif args.action == "test":
+        from openai import OpenAI
+
+        with StubServer(port=args.port, **kwargs) as server:
+            client = OpenAI(base_url=server.base_url, api_key="stub")
+            tools = [{"type": "function", "function": {"name": "get_paper_abstract", "parameters": {}}}]
+            messages = [{"role": "user", "content": "What is the NCT ID for the paper PMID: 36990608?"}]
+            response = client.chat.completions.create(model="stub", messages=messages, tools=tools)
+            print(response.choices[0].message.tool_calls)
+            print(client.chat.completions.create(model="stub", messages=messages).choices[0].message.content)
+            print(server.stats.to_dict())
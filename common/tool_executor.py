@@ -0,0 +1,311 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# A tool-execution layer that runs the blocking sync tools off the caller's event loop.
+#
+# get_paper_abstract (requests.get), sql_engine, get_weather and get_current_time are
+# plain sync functions: FastMCP and Google ADK call them on the event loop, so one slow
+# call stalls every concurrent agent. The executor runs them in a thread pool, with a
+# concurrency limit per tool and metrics on the time each call waited in the queue.
+# The tools only wait on the network or a database, so threads are enough: a process
+# pool would only add the pickling of every call.
+#
+#   executor = ToolExecutor(max_workers=16, limits={"get_paper_abstract": 4})
+#
+#   # FastMCP: offload the sync tools of a server
+#   offload_fastmcp_tools(mcp, executor)
+#   # autogen
+#   FunctionTool(executor.wrap_async(get_weather), description="...")  # or autogen_tool(get_weather, executor)
+#   # smolagents
+#   tool(executor.wrap_sync(get_weather))                               # or smolagents_tool(get_weather, executor)
+#   # Google ADK
+#   Agent(tools=[adk_tool(get_weather, executor)], ...)
+
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# the last calls of each tool that the percentiles are computed on
+METRICS_WINDOW = 1000
+
+
+class ToolMetrics:
+    '''
+    The calls of one tool: how long they waited in the queue and how long they ran.
+    '''
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        # queued or running
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.queue_seconds = deque(maxlen=METRICS_WINDOW)
+        self.run_seconds = deque(maxlen=METRICS_WINDOW)
+
+    def summary(self):
+        def percentiles(seconds):
+            if not seconds:
+                return dict(mean=0.0, p50=0.0, p95=0.0)
+            seconds = sorted(seconds)
+            return dict(
+                mean=statistics.mean(seconds),
+                p50=seconds[len(seconds) // 2],
+                p95=seconds[int(len(seconds) * 0.95)],
+            )
+
+        return dict(
+            calls=self.calls,
+            errors=self.errors,
+            in_flight=self.in_flight,
+            max_in_flight=self.max_in_flight,
+            queue_seconds=percentiles(self.queue_seconds),
+            run_seconds=percentiles(self.run_seconds),
+        )
+
+
+class ToolExecutor:
+    '''
+    Runs sync tools in a shared thread pool, or in a dedicated pool per tool with a
+    concurrency limit.
+
+    A tool with a limit gets its own pool of that many workers, so a burst of calls to a
+    slow tool queues up behind its own limit and never takes the workers of the others.
+    '''
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, limits=None):
+        '''
+        :param max_workers: The size of the shared thread pool.
+        :param limits: The max concurrent calls per tool name.
+        '''
+        self.max_workers = max_workers
+        self.limits = dict(limits or {})
+
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._metrics = {}
+
+    def _pool(self, name):
+        with self._lock:
+            key = name if name in self.limits else None
+            if (pool := self._pools.get(key)) is None:
+                pool = self._pools[key] = ThreadPoolExecutor(
+                    max_workers=self.limits.get(name, self.max_workers),
+                    thread_name_prefix=f"tool-{name}" if key else "tool",
+                )
+            return pool
+
+    def metrics(self, name):
+        with self._lock:
+            if (metrics := self._metrics.get(name)) is None:
+                metrics = self._metrics[name] = ToolMetrics()
+            return metrics
+
+    def submit(self, name, fn, *args, **kwargs):
+        '''
+        Submit a call of a tool.
+
+        :return: A concurrent.futures.Future of the result.
+        '''
+        metrics = self.metrics(name)
+        with self._lock:
+            metrics.calls += 1
+            metrics.in_flight += 1
+            metrics.max_in_flight = max(metrics.max_in_flight, metrics.in_flight)
+
+        submitted = time.time()
+
+        def run():
+            return time.time(), fn(*args, **kwargs)
+
+        future = self._pool(name).submit(run)
+
+        def done(future):
+            finished = time.time()
+            with self._lock:
+                metrics.in_flight -= 1
+                if future.cancelled() or future.exception() is not None:
+                    metrics.errors += 1
+                    return
+                started, _ = future.result()
+                metrics.queue_seconds.append(max(0.0, started - submitted))
+                metrics.run_seconds.append(finished - started)
+
+        future.add_done_callback(done)
+        return future
+
+    def run(self, name, fn, *args, **kwargs):
+        '''
+        Run a tool call in the pool and wait for the result, from sync code.
+        '''
+        return self.submit(name, fn, *args, **kwargs).result()[1]
+
+    async def arun(self, name, fn, *args, **kwargs):
+        '''
+        Run a tool call in the pool without blocking the event loop.
+        '''
+        _, result = await asyncio.wrap_future(self.submit(name, fn, *args, **kwargs))
+        return result
+
+    def wrap_async(self, fn, name=None):
+        '''
+        Wrap a sync tool into an async function with the same name, signature and
+        docstring, for the frameworks that await async tools on their event loop.
+        '''
+        if inspect.iscoroutinefunction(fn):
+            return fn
+        name = name or fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await self.arun(name, fn, *args, **kwargs)
+
+        return wrapper
+
+    def wrap_sync(self, fn, name=None):
+        '''
+        Wrap a sync tool into a sync function that runs in the pool, for the frameworks that
+        call tools from their own threads: the call is still limited and measured.
+        '''
+        name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.run(name, fn, *args, **kwargs)
+
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {name: tool_metrics.summary() for name, tool_metrics in metrics.items()}
+
+    def report(self):
+        for name, summary in self.stats().items():
+            print(f"* {name}: {summary['calls']} calls, {summary['errors']} errors, "
+                  f"max {summary['max_in_flight']} in flight, "
+                  f"queue p50 {summary['queue_seconds']['p50'] * 1000:.1f}ms "
+                  f"p95 {summary['queue_seconds']['p95'] * 1000:.1f}ms, "
+                  f"run p50 {summary['run_seconds']['p50'] * 1000:.1f}ms "
+                  f"p95 {summary['run_seconds']['p95'] * 1000:.1f}ms")
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=wait)
+
+
+###########################################################
+# Adapters
+###########################################################
+
+def offload_fastmcp_tools(mcp, executor):
+    '''
+    Make the sync tools registered on a FastMCP server run in the executor.
+
+    FastMCP calls sync tools on its event loop, so without this a slow tool blocks every
+    other request to the server.
+    '''
+    for tool in mcp._tool_manager.list_tools():
+        if not tool.is_async:
+            tool.fn = executor.wrap_async(tool.fn, name=tool.name)
+            tool.is_async = True
+            logging.info(f"* offloaded the {tool.name} tool")
+
+
+def autogen_tool(fn, executor, description=None, name=None):
+    '''
+    Get an autogen FunctionTool that runs a sync function in the executor.
+    '''
+    from autogen_core.tools import FunctionTool
+
+    return FunctionTool(
+        executor.wrap_async(fn, name=name),
+        description=description or inspect.getdoc(fn) or "",
+        name=name,
+    )
+
+
+def smolagents_tool(fn, executor):
+    '''
+    Get a smolagents tool, as made by @tool, that runs a sync function in the executor.
+    The function needs the type hints and the docstring @tool asks for.
+    '''
+    from smolagents import tool
+
+    return tool(executor.wrap_sync(fn))
+
+
+def adk_tool(fn, executor):
+    '''
+    Get a Google ADK FunctionTool that runs a sync function in the executor.
+    '''
+    from google.adk.tools import FunctionTool
+
+    return FunctionTool(executor.wrap_async(fn))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["test", "bench"])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=0.1, help="the time each blocking call takes")
+    args = parser.parse_args()
+
+    def slow_lookup(pmid: str) -> str:
+        """
+        Look up a paper, blocking like requests.get.
+
+        Args:
+            pmid: The PubMed ID of the paper
+        """
+        time.sleep(args.seconds)
+        return f"abstract of {pmid}"
+
+    async def heartbeat(stop):
+        # how late the event loop runs a 10ms timer while the tools are called
+        delays = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            delays.append(time.perf_counter() - started - 0.01)
+        return max(delays) if delays else 0.0
+
+    async def call_all(fn):
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(heartbeat(stop))
+        # let the heartbeat start its first timer
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        await asyncio.gather(*(fn(str(i)) for i in range(args.calls)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        return elapsed, await monitor
+
+    executor = ToolExecutor(limits={"slow_lookup": 10})
+    if args.action == "test":
+        print(executor.run("slow_lookup", slow_lookup, "36990608"))
+        print(asyncio.run(executor.wrap_async(slow_lookup)("36990609")))
+        print(smolagents_tool(slow_lookup, executor)(pmid="36990610"))
+        executor.report()
+    elif args.action == "bench":
+        # the way FastMCP and ADK call a sync tool: on the event loop
+        async def on_the_loop(pmid):
+            return slow_lookup(pmid)
+
+        elapsed, stall = asyncio.run(call_all(on_the_loop))
+        print(f"* on the event loop: {args.calls} calls in {elapsed:.2f}s, the loop stalled up to {stall * 1000:.0f}ms")
+        elapsed, stall = asyncio.run(call_all(executor.wrap_async(slow_lookup)))
+        print(f"* in the executor (limit 10): {args.calls} calls in {elapsed:.2f}s, "
+              f"the loop stalled up to {stall * 1000:.0f}ms")
+        executor.report()
+    executor.shutdown()
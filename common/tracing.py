@@ -0,0 +1,367 @@
+import collections
+import logging
+import os
+import socket
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from urllib.parse import urlparse
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+# The tracing setup of the agent examples, cheap enough for batch runs.
+#
+# The mode is picked with $TRACING_MODE or `mode`:
+#   off    no tracer provider, the spans are no-ops
+#   head   a `ratio` of the traces is sampled when they start, the others cost almost nothing
+#   tail   every trace is recorded, and kept when it failed, was slow (`slow_seconds`) or
+#          falls in the `ratio`, decided when its root span ends
+#   full   every span is exported
+#
+# The spans go to the OTLP collector at $OTEL_EXPORTER_OTLP_ENDPOINT (localhost:4317 by
+# default, e.g., Jaeger or Phoenix), or to rotating JSONL files under $TRACING_DIR when the
+# collector can't be reached, so the examples run without one. Spans wait for the exporter
+# in a bounded queue: when it is full the oldest are dropped and counted, a slow or down
+# collector never blocks the agents.
+#
+#   tracing = setup_tracing("autogen-test-agentchat")
+#   tracer = tracing.tracer("autogen-test-agentchat")
+#   ...
+#   tracing.shutdown()
+
+MODES = ("off", "head", "tail", "full")
+
+DEFAULT_ENDPOINT = "http://localhost:4317"
+DEFAULT_RATIO = 0.1
+DEFAULT_SLOW_SECONDS = 30.0
+DEFAULT_DIR = "traces"
+
+# the spans waiting for the exporter, and the traces waiting for the tail decision
+MAX_QUEUE_SIZE = 2048
+MAX_EXPORT_BATCH_SIZE = 512
+EXPORT_DELAY_SECONDS = 2.0
+MAX_PENDING_TRACES = 512
+MAX_SPANS_PER_TRACE = 1024
+
+# the rotated span files, 64MB each
+MAX_FILE_BYTES = 64 * 1024 * 1024
+FILE_BACKUPS = 5
+
+
+def sampled_by_ratio(trace_id, ratio):
+    '''
+    Whether a trace falls in the ratio, by its ID, the same decision as TraceIdRatioBased.
+    '''
+    return trace_id & ((1 << 64) - 1) < round(ratio * (1 << 64))
+
+
+class BoundedBatchProcessor(SpanProcessor):
+    '''
+    Exports the spans in batches from a background thread. The queue is bounded: when the
+    exporter falls behind, the oldest spans are dropped, and counted, instead of blocking
+    the code that ends the spans.
+    '''
+
+    def __init__(
+        self,
+        exporter,
+        max_queue_size=MAX_QUEUE_SIZE,
+        max_export_batch_size=MAX_EXPORT_BATCH_SIZE,
+        export_delay_seconds=EXPORT_DELAY_SECONDS,
+    ):
+        self.exporter = exporter
+        self.max_export_batch_size = max_export_batch_size
+        self.export_delay_seconds = export_delay_seconds
+        self.queue = collections.deque(maxlen=max_queue_size)
+        self.dropped = 0
+        self.exported = 0
+        self.failed = 0
+        self._condition = threading.Condition()
+        self._flushing = 0
+        # the spans popped from the queue and not exported yet
+        self._in_flight = 0
+        self._shutdown = False
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span):
+        if not span.context.trace_flags.sampled:
+            return
+        with self._condition:
+            if len(self.queue) == self.queue.maxlen:
+                # the deque drops the oldest span
+                self.dropped += 1
+            self.queue.append(span)
+            if len(self.queue) >= self.max_export_batch_size:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._shutdown and not (self._flushing and self.queue) and len(self.queue) < self.max_export_batch_size:
+                    self._condition.wait(self.export_delay_seconds)
+                self._in_flight = min(len(self.queue), self.max_export_batch_size)
+                batch = [self.queue.popleft() for _ in range(self._in_flight)]
+                done = self._shutdown and not self.queue
+            if batch:
+                self._export(batch)
+            with self._condition:
+                self._in_flight = 0
+                if not self.queue:
+                    self._condition.notify_all()
+            if done:
+                return
+
+    def _export(self, batch):
+        try:
+            result = self.exporter.export(batch)
+        except Exception as e:
+            logging.warning(f"* failed to export {len(batch)} spans: {e}")
+            result = SpanExportResult.FAILURE
+        with self._condition:
+            if result == SpanExportResult.SUCCESS:
+                self.exported += len(batch)
+            else:
+                self.failed += len(batch)
+
+    def force_flush(self, timeout_millis=30_000):
+        deadline = time.monotonic() + timeout_millis / 1000
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                while (self.queue or self._in_flight) and self._thread.is_alive():
+                    if not self._condition.wait(max(0.0, deadline - time.monotonic())) and time.monotonic() >= deadline:
+                        return False
+            finally:
+                self._flushing -= 1
+        return True
+
+    def shutdown(self):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        self._thread.join(self.export_delay_seconds + 5)
+        self.exporter.shutdown()
+
+    def stats(self):
+        with self._condition:
+            return dict(queued=len(self.queue), exported=self.exported, failed=self.failed, dropped=self.dropped)
+
+
+class TailSamplingProcessor(SpanProcessor):
+    '''
+    Holds the spans of each trace until its root span ends, then passes them on to the
+    next processor if the trace is kept: it has an error, its root took `slow_seconds` or
+    more, or it falls in the `ratio`. The pending traces are bounded, the oldest are dropped.
+    '''
+
+    def __init__(
+        self,
+        next_processor,
+        ratio=DEFAULT_RATIO,
+        slow_seconds=DEFAULT_SLOW_SECONDS,
+        max_pending_traces=MAX_PENDING_TRACES,
+        max_spans_per_trace=MAX_SPANS_PER_TRACE,
+    ):
+        self.next_processor = next_processor
+        self.ratio = ratio
+        self.slow_seconds = slow_seconds
+        self.max_pending_traces = max_pending_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self.kept = 0
+        self.discarded = 0
+        self.dropped_spans = 0
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        # the local root, its parent is missing or in another process
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._pending.get(trace_id)
+            if spans is None:
+                spans = self._pending[trace_id] = []
+                if len(self._pending) > self.max_pending_traces:
+                    # a trace whose root never ended, e.g., a cancelled run
+                    _, evicted = self._pending.popitem(last=False)
+                    self.dropped_spans += len(evicted)
+            if len(spans) < self.max_spans_per_trace:
+                spans.append(span)
+            else:
+                self.dropped_spans += 1
+            if not is_root:
+                return
+            spans = self._pending.pop(trace_id)
+
+        if self.keep(span, spans):
+            with self._lock:
+                self.kept += 1
+            for pending_span in spans:
+                self.next_processor.on_end(pending_span)
+        else:
+            with self._lock:
+                self.discarded += 1
+
+    def keep(self, root, spans):
+        if any(span.status.status_code == StatusCode.ERROR for span in spans):
+            return True
+        if root.end_time is not None and (root.end_time - root.start_time) / 1e9 >= self.slow_seconds:
+            return True
+        return sampled_by_ratio(root.context.trace_id, self.ratio)
+
+    def force_flush(self, timeout_millis=30_000):
+        return self.next_processor.force_flush(timeout_millis)
+
+    def shutdown(self):
+        self.next_processor.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                pending_traces=len(self._pending),
+                kept_traces=self.kept,
+                discarded_traces=self.discarded,
+                dropped_spans=self.dropped_spans,
+            )
+
+
+class RotatingFileSpanExporter(SpanExporter):
+    '''
+    Writes the spans as JSON lines to `<service>.jsonl` in a folder, rotated by size.
+    '''
+
+    def __init__(self, path, service_name, max_bytes=MAX_FILE_BYTES, backups=FILE_BACKUPS):
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.path = Path(path) / f"{service_name}.jsonl"
+        self.handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def export(self, spans):
+        for span in spans:
+            self.handler.emit(logging.makeLogRecord(dict(msg=span.to_json(indent=None))))
+        self.handler.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self.handler.close()
+
+
+def collector_reachable(endpoint, timeout=0.5):
+    '''
+    Whether something listens at the collector's host and port.
+    '''
+    url = urlparse(endpoint if "://" in endpoint else f"http://{endpoint}")
+    try:
+        with socket.create_connection((url.hostname or "localhost", url.port or 4317), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class Tracing:
+    '''
+    The tracer provider and the processors set up by setup_tracing().
+    '''
+
+    def __init__(self, mode, provider=None, exporter=None, batch=None, tail=None):
+        self.mode = mode
+        self.provider = provider
+        self.exporter = exporter
+        self.batch = batch
+        self.tail = tail
+
+    def tracer(self, name):
+        if self.provider is None:
+            return trace.get_tracer(name)
+        return self.provider.get_tracer(name)
+
+    def stats(self):
+        stats = dict(mode=self.mode, exporter=type(self.exporter).__name__ if self.exporter else None)
+        if self.batch is not None:
+            stats.update(self.batch.stats())
+        if self.tail is not None:
+            stats.update(self.tail.stats())
+        return stats
+
+    def shutdown(self):
+        if self.provider is not None:
+            self.provider.shutdown()
+
+
+def setup_tracing(
+    service_name,
+    mode=None,
+    endpoint=None,
+    ratio=None,
+    slow_seconds=None,
+    directory=None,
+    exporter=None,
+    max_queue_size=MAX_QUEUE_SIZE,
+    set_global=True,
+    resource_attributes=None,
+):
+    '''
+    Set up the tracing of a service.
+
+    :param mode: off, head, tail or full, by default $TRACING_MODE or full.
+    :param endpoint: The OTLP gRPC collector, by default $OTEL_EXPORTER_OTLP_ENDPOINT or localhost:4317.
+    :param ratio: The fraction of the traces to keep in head and tail modes, by default $TRACING_RATIO or 0.1.
+    :param slow_seconds: The traces at least this long are kept in tail mode, by default $TRACING_SLOW_SECONDS or 30.
+    :param directory: Where the span files go when the collector can't be reached, by default $TRACING_DIR or traces.
+    :param exporter: The span exporter to use instead of OTLP or the files.
+    :param set_global: Whether to make it the global tracer provider, for the instrumented libraries.
+    :return: A Tracing.
+    '''
+    mode = mode or os.getenv("TRACING_MODE", "full")
+    if mode not in MODES:
+        raise ValueError(f"unknown tracing mode: {mode}, expected one of {', '.join(MODES)}")
+    if mode == "off":
+        return Tracing(mode)
+
+    endpoint = endpoint or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", DEFAULT_ENDPOINT)
+    ratio = float(ratio if ratio is not None else os.getenv("TRACING_RATIO", DEFAULT_RATIO))
+    slow_seconds = float(slow_seconds if slow_seconds is not None else os.getenv("TRACING_SLOW_SECONDS", DEFAULT_SLOW_SECONDS))
+
+    if exporter is None:
+        if collector_reachable(endpoint):
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+            exporter = OTLPSpanExporter(endpoint=endpoint, insecure=True, timeout=5)
+        else:
+            directory = directory or os.getenv("TRACING_DIR", DEFAULT_DIR)
+            logging.warning(f"* no trace collector at {endpoint}, writing the spans to {directory}")
+            exporter = RotatingFileSpanExporter(directory, service_name)
+
+    sampler = ParentBased(TraceIdRatioBased(ratio)) if mode == "head" else ALWAYS_ON
+    attributes = {"service.name": service_name, **(resource_attributes or {})}
+    provider = TracerProvider(resource=Resource(attributes), sampler=sampler)
+    batch = BoundedBatchProcessor(exporter, max_queue_size=max_queue_size)
+    tail = TailSamplingProcessor(batch, ratio=ratio, slow_seconds=slow_seconds) if mode == "tail" else None
+    provider.add_span_processor(tail or batch)
+    if set_global:
+        trace.set_tracer_provider(provider)
+    return Tracing(mode, provider=provider, exporter=exporter, batch=batch, tail=tail)
+
+
+def instrument_smolagents(service_name, **kwargs):
+    '''
+    Set up the tracing and instrument smolagents with OpenInference, like phoenix.otel's
+    register(), with the sampling, the fallback and the bounded queue of setup_tracing().
+    The spans show up in the Phoenix project named after the service.
+
+    :return: A Tracing, not instrumented when the mode is off.
+    '''
+    tracing = setup_tracing(service_name, resource_attributes={"openinference.project.name": service_name}, **kwargs)
+    if tracing.provider is not None:
+        from openinference.instrumentation.smolagents import SmolagentsInstrumentor
+
+        SmolagentsInstrumentor().instrument(tracer_provider=tracing.provider)
+    return tracing
@@ -1,59 +1,15 @@
-import datetime
-from zoneinfo import ZoneInfo
+import sys
+from pathlib import Path
 from google.adk.agents import Agent
 from google.adk.agents import LlmAgent
 from google.adk.models.lite_llm import LiteLlm
+from .weather_tools import get_current_time, get_weather
 
-def get_weather(city: str) -> dict:
-    """Retrieves the current weather report for a specified city.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from tool_executor import ToolExecutor, adk_tool
 
-    Args:
-        city (str): The name of the city for which to retrieve the weather report.
-
-    Returns:
-        dict: status and result or error msg.
-    """
-    if city.lower() == "new york":
-        return {
-            "status": "success",
-            "report": (
-                "The weather in New York is sunny with a temperature of 25 degrees"
-                " Celsius (41 degrees Fahrenheit)."
-            ),
-        }
-    else:
-        return {
-            "status": "error",
-            "error_message": f"Weather information for '{city}' is not available.",
-        }
-
-
-def get_current_time(city: str) -> dict:
-    """Returns the current time in a specified city.
-
-    Args:
-        city (str): The name of the city for which to retrieve the current time.
-
-    Returns:
-        dict: status and result or error msg.
-    """
-
-    if city.lower() == "new york":
-        tz_identifier = "America/New_York"
-    else:
-        return {
-            "status": "error",
-            "error_message": (
-                f"Sorry, I don't have timezone information for {city}."
-            ),
-        }
-
-    tz = ZoneInfo(tz_identifier)
-    now = datetime.datetime.now(tz)
-    report = (
-        f'The current time in {city} is {now.strftime("%Y-%m-%d %H:%M:%S %Z%z")}'
-    )
-    return {"status": "success", "report": report}
+# ADK calls sync tools on its event loop, so they run in a thread pool instead
+executor = ToolExecutor()
 
 
 root_agent = Agent(
@@ -65,5 +21,5 @@ root_agent = Agent(
     instruction=(
         "You are a helpful agent who can answer user questions about the time and weather in a city."
     ),
-    tools=[get_weather, get_current_time],
+    tools=[adk_tool(get_weather, executor), adk_tool(get_current_time, executor)],
 )
\ No newline at end of file
@@ -1,17 +1,20 @@
 #%% load libs
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 from smolagents import CodeAgent, ToolCallingAgent, OpenAIServerModel, tool
-from phoenix.otel import register
-from openinference.instrumentation.smolagents import SmolagentsInstrumentor
 from smolagents.mcp_client import MCPClient
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from tracing import instrument_smolagents
+
 # Load environment variables
 load_dotenv()
 
-# Register and instrument for tracing
-register()
-SmolagentsInstrumentor().instrument()
+# Register and instrument for tracing: to Phoenix's OTLP endpoint (localhost:4317), or to
+# files under traces/ without it. TRACING_MODE=off|head|tail|full picks how much is traced
+tracing = instrument_smolagents("smolagents-research")
 print("* loaded libs and instrumented the agent")
 
 
@@ -60,4 +63,5 @@ Please analyze the following research papers and provide a summary of their find
 # Run the analysis
 summary_result = manager_agent.run(task)
 print("\nSummary Results:")
-print(summary_result)
\ No newline at end of file
+print(summary_result)
+tracing.shutdown()
\ No newline at end of file
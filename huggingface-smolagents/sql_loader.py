@@ -0,0 +1,255 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from sqlalchemy import insert
+
+# Bulk loading of CSV, JSONL and Parquet files into the SQL environment of the text2SQL agent.
+#
+# The files are read in chunks and every chunk is inserted with one executemany in its
+# own transaction, so memory stays flat and a million rows take seconds instead of minutes.
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+def chunked(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Split an iterable of rows into lists of at most `chunk_size` rows.
+    '''
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def read_csv(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Read a CSV file with a header row in chunks of row dicts. The values are strings.
+    '''
+    with open(path, newline="") as f:
+        yield from chunked(csv.DictReader(f), chunk_size)
+
+
+def read_jsonl(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Read a JSONL file, one JSON object per line, in chunks of row dicts.
+    '''
+    with open(path) as f:
+        yield from chunked((json.loads(line) for line in f if line.strip()), chunk_size)
+
+
+def read_parquet(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Read a Parquet file in chunks of row dicts, one record batch at a time.
+    '''
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required to load Parquet files: pip install pyarrow")
+
+    with pq.ParquetFile(path) as f:
+        for batch in f.iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+
+
+READERS = {
+    ".csv": read_csv,
+    ".jsonl": read_jsonl,
+    ".ndjson": read_jsonl,
+    ".parquet": read_parquet,
+}
+
+
+def converters_for(table):
+    '''
+    Get a function per column to convert the string values of a CSV file to the column type.
+    '''
+    converters = {}
+    for column in table.columns:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            continue
+        if python_type is not str:
+            converters[column.name] = python_type
+    return converters
+
+
+def convert_rows(rows, converters):
+    for row in rows:
+        for name, convert in converters.items():
+            value = row.get(name)
+            if isinstance(value, str):
+                # an empty CSV field is a NULL
+                row[name] = convert(value) if value != "" else None
+    return rows
+
+
+def insert_chunks(chunks, table, engine):
+    '''
+    Insert each chunk of row dicts with one executemany in its own transaction.
+
+    :return: The number of rows inserted.
+    '''
+    stmt = insert(table)
+    count = 0
+    for chunk in chunks:
+        with engine.begin() as connection:
+            connection.execute(stmt, chunk)
+        count += len(chunk)
+    return count
+
+
+def bulk_insert(rows, table, engine, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Insert an iterable of row dicts in chunks of `chunk_size`.
+
+    :return: The number of rows inserted.
+    '''
+    return insert_chunks(chunked(rows, chunk_size), table, engine)
+
+
+def load_file(path, table, engine, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Stream a CSV, JSONL or Parquet file into the table.
+
+    :return: The number of rows inserted.
+    '''
+    suffix = Path(path).suffix.lower()
+    if suffix not in READERS:
+        raise ValueError(f"unsupported file type: {suffix}, expected one of {', '.join(READERS)}")
+
+    chunks = READERS[suffix](path, chunk_size)
+    if suffix == ".csv":
+        converters = converters_for(table)
+        chunks = (convert_rows(chunk, converters) for chunk in chunks)
+    return insert_chunks(chunks, table, engine)
+
+
+def insert_rows_one_by_one(rows, table, engine):
+    '''
+    The original per-row path of test-text2sql.py, one insert and one transaction per row.
+    '''
+    for row in rows:
+        stmt = insert(table).values(**row)
+        with engine.begin() as connection:
+            connection.execute(stmt)
+
+
+def create_receipts_table(engine):
+    from sqlalchemy import Column, Float, Integer, MetaData, String, Table
+
+    metadata_obj = MetaData()
+    receipts = Table(
+        "receipts",
+        metadata_obj,
+        Column("receipt_id", Integer, primary_key=True),
+        Column("customer_name", String(16), primary_key=True),
+        Column("price", Float),
+        Column("tip", Float),
+    )
+    metadata_obj.create_all(engine)
+    return receipts
+
+
+def generate_receipts(n):
+    names = ["Alan Payne", "Alex Mason", "Woodrow Wilson", "Margaret James", "John Smith", "John Clark"]
+    for i in range(n):
+        yield {
+            "receipt_id": i + 1,
+            "customer_name": names[i % len(names)],
+            "price": round(10 + (i * 7919 % 9000) / 100, 2),
+            "tip": round((i * 104729 % 1000) / 100, 2),
+        }
+
+
+def write_files(folder, n):
+    '''
+    Write the same receipts as CSV, JSONL and, if pyarrow is installed, Parquet.
+    '''
+    paths = []
+    path = Path(folder) / "receipts.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["receipt_id", "customer_name", "price", "tip"])
+        writer.writeheader()
+        writer.writerows(generate_receipts(n))
+    paths.append(path)
+
+    path = Path(folder) / "receipts.jsonl"
+    with open(path, "w") as f:
+        for row in generate_receipts(n):
+            f.write(json.dumps(row) + "\n")
+    paths.append(path)
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("* pyarrow is not installed, skipping Parquet")
+        return paths
+
+    path = Path(folder) / "receipts.parquet"
+    schema = None
+    writer = None
+    for chunk in chunked(generate_receipts(n), DEFAULT_CHUNK_SIZE):
+        batch = pa.RecordBatch.from_pylist(chunk, schema=schema)
+        if writer is None:
+            schema = batch.schema
+            writer = pq.ParquetWriter(path, schema)
+        writer.write_batch(batch)
+    writer.close()
+    paths.append(path)
+    return paths
+
+
+def bench(rows, per_row_rows, chunk_size):
+    import tempfile
+
+    from sqlalchemy import create_engine
+
+    def rows_per_second(count, seconds):
+        return f"{count:,} rows in {seconds:.2f}s, {count / seconds:,.0f} rows/s"
+
+    # the per-row path is far too slow for the full size, so it gets a sample
+    engine = create_engine("sqlite:///:memory:")
+    receipts = create_receipts_table(engine)
+    started = time.perf_counter()
+    insert_rows_one_by_one(generate_receipts(per_row_rows), receipts, engine)
+    seconds = time.perf_counter() - started
+    per_row = per_row_rows / seconds
+    print(f"* per-row inserts: {rows_per_second(per_row_rows, seconds)}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for path in write_files(tmpdir, rows):
+            engine = create_engine("sqlite:///:memory:")
+            receipts = create_receipts_table(engine)
+            started = time.perf_counter()
+            count = load_file(path, receipts, engine, chunk_size=chunk_size)
+            seconds = time.perf_counter() - started
+            print(f"* bulk load {path.suffix[1:]}: {rows_per_second(count, seconds)}, "
+                  f"{count / seconds / per_row:.0f}x the per-row inserts")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["load", "bench"])
+    parser.add_argument("--file", type=str, help="the CSV, JSONL or Parquet file to load")
+    parser.add_argument("--database", type=str, default="sqlite:///receipts.db")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--per-row-rows", type=int, default=20_000)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.action == "load":
+        from sqlalchemy import create_engine
+
+        engine = create_engine(args.database)
+        receipts = create_receipts_table(engine)
+        started = time.perf_counter()
+        count = load_file(args.file, receipts, engine, chunk_size=args.chunk_size)
+        print(f"* loaded {count:,} rows in {time.perf_counter() - started:.2f}s")
+    elif args.action == "bench":
+        bench(args.rows, args.per_row_rows, args.chunk_size)
@@ -18,19 +18,16 @@ from sqlalchemy import (
     String,
     Integer,
     Float,
-    insert,
     inspect,
-    text,
 )
+from sql_loader import bulk_insert
 
 engine = create_engine("sqlite:///:memory:")
 metadata_obj = MetaData()
 
 def insert_rows_into_table(rows, table, engine=engine):
-    for row in rows:
-        stmt = insert(table).values(**row)
-        with engine.begin() as connection:
-            connection.execute(stmt)
+    # one executemany per chunk instead of one transaction per row
+    bulk_insert(rows, table, engine)
 
 table_name = "receipts"
 receipts = Table(
@@ -54,6 +51,10 @@ rows = [
 insert_rows_into_table(rows, receipts)
 print("* created the table with some data")
 
+# for larger tables, stream a CSV, JSONL or Parquet file instead, e.g.:
+# from sql_loader import load_file
+# load_file("receipts.parquet", receipts, engine)
+
 
 #%% take a look at the data
 inspector = inspect(engine)
@@ -64,8 +65,16 @@ print(table_description)
 
 
 #%% build agents
+import sys
+from pathlib import Path
 from smolagents import tool
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from sql_cache import QueryCache
+
+# repeated questions are answered from the cache until the receipts change
+query_cache = QueryCache(engine)
+
 @tool
 def sql_engine(query: str) -> str:
     """
@@ -80,12 +89,12 @@ def sql_engine(query: str) -> str:
     Args:
         query: The query to perform. This should be correct SQL.
     """
-    output = ""
-    with engine.connect() as con:
-        rows = con.execute(text(query))
-        for row in rows:
-            output += "\n" + str(row)
-    return output
+    def run(statement):
+        with engine.connect() as con:
+            rows = con.execute(statement)
+            return "".join("\n" + str(row) for row in rows)
+
+    return query_cache.get_or_run(query, run)
 
 print('* defined the sql_engine tool')
 
@@ -112,16 +121,19 @@ agent.run("Can you give me the name of the client who got the most expensive rec
 agent.run("There is a client named John, but I don't know his last name. He has spent more than 50 dollars. Can you give me his full name and tip on that receipt?")
 
 
+# %% how many queries were answered from the cache
+print(query_cache.stats())
+
+
 # %% take a look at the agent prompt
 print(agent.prompt_templates["system_prompt"])
 
 
 #%% let's create an instrumentor
-from phoenix.otel import register
-from openinference.instrumentation.smolagents import SmolagentsInstrumentor
+from tracing import instrument_smolagents
 
-register()
-SmolagentsInstrumentor().instrument()
+# Phoenix's OTLP endpoint, or files under traces/ when it isn't running
+tracing = instrument_smolagents("smolagents-text2sql")
 print('* instrumented the agent')
 
 
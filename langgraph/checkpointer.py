@@ -0,0 +1,669 @@
+import asyncio
+import operator
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from itertools import groupby
+from typing import Annotated, Any, AsyncIterator, Iterator, Optional, Sequence, TypedDict
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.types import TASKS, ChannelProtocol
+from langgraph.graph import END, START, StateGraph
+
+# A disk-backed checkpointer for long-running chat threads.
+#
+# InMemorySaver keeps every checkpoint of every thread in memory forever and loses
+# them on restart. BoundedSqliteSaver keeps them in SQLite instead:
+# - writes are queued and committed in batches, one transaction per batch
+# - only the last `keep_last` checkpoints of each thread are kept, older ones are deleted
+# - at most `max_threads` threads are cached in memory, the least recently used are evicted
+#   and reloaded from SQLite the next time they are used
+# - the async methods run the sync ones in a worker thread, so a flush or a reload from
+#   SQLite never blocks the event loop of the graph
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+INSERT_CHECKPOINT = "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_WRITE = "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+DELETE_CHECKPOINT = "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+DELETE_WRITES = "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+
+
+class ThreadState:
+    '''
+    The checkpoints of one thread that are kept, with their pending writes.
+    '''
+    __slots__ = ("checkpoints", "writes")
+
+    def __init__(self):
+        # checkpoint_ns -> checkpoint_id -> (checkpoint, metadata, parent_checkpoint_id)
+        self.checkpoints = defaultdict(dict)
+        # (checkpoint_ns, checkpoint_id) -> (task_id, idx) -> (task_id, channel, value, task_path)
+        self.writes = defaultdict(dict)
+
+
+class BoundedSqliteSaver(BaseCheckpointSaver[str]):
+    '''
+    A checkpointer that persists to SQLite and bounds the checkpoints kept per thread
+    and the threads cached in memory.
+
+    Up to `batch_size` writes, or `flush_interval` seconds of writes, are buffered before
+    they are committed, so a crash loses at most that much. A timer commits the writes of
+    an idle saver. Call `flush()` or `close()`, or use the saver as a context manager, to
+    commit them at once.
+
+    :param path: The SQLite database file.
+    :param keep_last: How many checkpoints to keep per thread and namespace. At least 2,
+        because the pending sends of a checkpoint are read from its parent.
+    :param max_threads: How many threads to cache in memory.
+    :param batch_size: How many writes to buffer before committing them.
+    :param flush_interval: How many seconds to buffer writes before committing them.
+    '''
+
+    def __init__(
+        self,
+        path="checkpoints.sqlite",
+        keep_last=10,
+        max_threads=1000,
+        batch_size=100,
+        flush_interval=1.0,
+        *,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        if keep_last < 2:
+            raise ValueError("keep_last must be at least 2")
+        self.keep_last = keep_last
+        self.max_threads = max_threads
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        # langgraph may call put_writes from its executor threads
+        self.lock = threading.RLock()
+        self.threads = OrderedDict()
+        self.pending = []
+        # the threads with buffered writes
+        self.dirty = set()
+        self.last_flush = time.monotonic()
+        # armed by the first buffered write, so the writes are committed even if no more come
+        self.timer = None
+
+        self.flushes = 0
+        self.loads = 0
+        self.evictions = 0
+        self.compacted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.to_thread(self.close)
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+    def flush(self):
+        '''
+        Commit the buffered writes in one transaction.
+        '''
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, []
+            self.dirty.clear()
+            with self.conn:
+                # consecutive statements of the same kind are sent together, in order
+                for sql, group in groupby(pending, key=lambda op: op[0]):
+                    self.conn.executemany(sql, [params for _, params in group])
+            self.flushes += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                threads=len(self.threads),
+                pending=len(self.pending),
+                flushes=self.flushes,
+                loads=self.loads,
+                evictions=self.evictions,
+                compacted=self.compacted,
+            )
+
+    def _enqueue(self, sql, params):
+        self.pending.append((sql, params))
+        self.dirty.add(params[0])
+        if self.timer is None and self.flush_interval:
+            self.timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_on_timer(self):
+        with self.lock:
+            # flushed since the timer fired, e.g., by close()
+            if self.pending:
+                self.flush()
+
+    def _maybe_flush(self):
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def _thread(self, thread_id):
+        '''
+        Get the state of a thread from the cache, loading it from SQLite on a miss.
+        '''
+        if (state := self.threads.get(thread_id)) is not None:
+            self.threads.move_to_end(thread_id)
+            return state
+
+        # an evicted thread may still have buffered writes
+        if thread_id in self.dirty:
+            self.flush()
+        state = self._load(thread_id)
+        self.loads += 1
+
+        self.threads[thread_id] = state
+        while len(self.threads) > self.max_threads:
+            self.threads.popitem(last=False)
+            self.evictions += 1
+        return state
+
+    def _load(self, thread_id):
+        state = ThreadState()
+        rows = self.conn.execute(
+            "SELECT checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_ns, checkpoint_id DESC",
+            (thread_id,),
+        )
+        for ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata in rows:
+            checkpoints = state.checkpoints[ns]
+            if len(checkpoints) < self.keep_last:
+                checkpoints[checkpoint_id] = ((type_, checkpoint), (metadata_type, metadata), parent_id)
+
+        rows = self.conn.execute(
+            "SELECT checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path "
+            "FROM writes WHERE thread_id = ? ORDER BY checkpoint_ns, checkpoint_id, task_id, idx",
+            (thread_id,),
+        )
+        for ns, checkpoint_id, task_id, idx, channel, type_, value, task_path in rows:
+            if checkpoint_id in state.checkpoints.get(ns, ()):
+                state.writes[(ns, checkpoint_id)][(task_id, idx)] = (task_id, channel, (type_, value), task_path)
+        return state
+
+    def _compact(self, thread_id, state, checkpoint_ns):
+        '''
+        Delete the oldest checkpoints of a thread beyond `keep_last`, with their writes.
+        '''
+        checkpoints = state.checkpoints[checkpoint_ns]
+        while len(checkpoints) > self.keep_last:
+            # checkpoint IDs are time-ordered UUIDs
+            oldest = min(checkpoints)
+            del checkpoints[oldest]
+            state.writes.pop((checkpoint_ns, oldest), None)
+            self._enqueue(DELETE_CHECKPOINT, (thread_id, checkpoint_ns, oldest))
+            self._enqueue(DELETE_WRITES, (thread_id, checkpoint_ns, oldest))
+            self.compacted += 1
+
+    def _make_tuple(self, thread_id, checkpoint_ns, checkpoint_id, saved, writes, sends):
+        checkpoint, metadata, parent_id = saved
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **self.serde.loads_typed(checkpoint),
+                "pending_sends": [self.serde.loads_typed(value) for value in sends],
+            },
+            metadata=self.serde.loads_typed(metadata),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed(value)) for task_id, channel, value in writes
+            ],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.lock:
+            state = self._thread(thread_id)
+            checkpoints = state.checkpoints.get(checkpoint_ns)
+            if not checkpoints:
+                return None
+
+            checkpoint_id = get_checkpoint_id(config) or max(checkpoints)
+            if (saved := checkpoints.get(checkpoint_id)) is None:
+                # unknown or compacted away
+                return None
+
+            writes = [
+                (task_id, channel, value)
+                for task_id, channel, value, _ in state.writes.get((checkpoint_ns, checkpoint_id), {}).values()
+            ]
+            parent_id = saved[2]
+            sends = []
+            if parent_id:
+                parent_writes = state.writes.get((checkpoint_ns, parent_id), {})
+                sends = [
+                    write[2]
+                    for (_, idx), write in sorted(
+                        parent_writes.items(), key=lambda item: (item[1][3], item[1][0], item[0][1])
+                    )
+                    if write[1] == TASKS
+                ]
+            return self._make_tuple(thread_id, checkpoint_ns, checkpoint_id, saved, writes, sends)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        where = []
+        params = []
+        if config is not None:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+
+        sql = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+
+        with self.lock:
+            self.flush()
+            rows = self.conn.execute(sql, params).fetchall()
+
+        count = 0
+        for thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata in rows:
+            if limit is not None and count >= limit:
+                break
+            metadata = (metadata_type, metadata)
+            if filter and not all(
+                query_value == self.serde.loads_typed(metadata).get(query_key)
+                for query_key, query_value in filter.items()
+            ):
+                continue
+
+            with self.lock:
+                writes = self.conn.execute(
+                    "SELECT task_id, channel, type, value FROM writes "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchall()
+                sends = []
+                if parent_id:
+                    sends = self.conn.execute(
+                        "SELECT type, value FROM writes "
+                        "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ? "
+                        "ORDER BY task_path, task_id, idx",
+                        (thread_id, checkpoint_ns, parent_id, TASKS),
+                    ).fetchall()
+
+            count += 1
+            yield self._make_tuple(
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                ((type_, checkpoint), metadata, parent_id),
+                [(task_id, channel, (value_type, value)) for task_id, channel, value_type, value in writes],
+                [tuple(send) for send in sends],
+            )
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        # the whole checkpoint is stored, channel values included, so compaction
+        # never has to work out which channel blobs are still referenced
+        c = checkpoint.copy()
+        c.pop("pending_sends", None)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        saved = (
+            self.serde.dumps_typed(c),
+            self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+            parent_id,
+        )
+
+        with self.lock:
+            state = self._thread(thread_id)
+            state.checkpoints[checkpoint_ns][checkpoint["id"]] = saved
+            self._enqueue(
+                INSERT_CHECKPOINT,
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, *saved[0], *saved[1]),
+            )
+            self._compact(thread_id, state, checkpoint_ns)
+            self._maybe_flush()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        with self.lock:
+            state = self._thread(thread_id)
+            if checkpoint_id not in state.checkpoints.get(checkpoint_ns, ()):
+                # the checkpoint was compacted away
+                return
+
+            saved_writes = state.writes[(checkpoint_ns, checkpoint_id)]
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                # regular writes are kept the first time, special ones are overwritten
+                if idx >= 0 and (task_id, idx) in saved_writes:
+                    continue
+
+                value = self.serde.dumps_typed(value)
+                saved_writes[(task_id, idx)] = (task_id, channel, value, task_path)
+                self._enqueue(
+                    INSERT_WRITE,
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, *value, task_path),
+                )
+            self._maybe_flush()
+
+    def delete_thread(self, thread_id: str) -> None:
+        '''
+        Delete all checkpoints and writes of a thread.
+        '''
+        with self.lock:
+            self.threads.pop(thread_id, None)
+            self.flush()
+            with self.conn:
+                self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        # the rows and their writes are read in one go in the thread, so the loop only
+        # iterates over the built tuples
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: ChannelProtocol) -> str:
+        # the same string versions as InMemorySaver
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        next_v = current_v + 1
+        next_h = random.random()
+        return f"{next_v:032}.{next_h:016}"
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def build_graph(checkpointer):
+    '''
+    A chat-like graph that appends a user message and a reply to the thread on every turn.
+    '''
+    class State(TypedDict):
+        messages: Annotated[list[str], operator.add]
+
+    def reply(state):
+        return {"messages": [f"reply {len(state['messages'])}: " + "lorem ipsum " * 20]}
+
+    builder = StateGraph(State)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def time_calls(obj, name, latencies):
+    method = getattr(obj, name)
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    setattr(obj, name, timed)
+
+
+def bench(saver_name, threads, turns, path):
+    if saver_name == "memory":
+        saver = InMemorySaver()
+    else:
+        saver = BoundedSqliteSaver(path, keep_last=4, max_threads=1000)
+    latencies = []
+    time_calls(saver, "put", latencies)
+    time_calls(saver, "put_writes", latencies)
+    graph = build_graph(saver)
+
+    rss_start = rss_mb()
+    started = time.perf_counter()
+    for i in range(threads):
+        config = {"configurable": {"thread_id": f"thread-{i}"}}
+        for turn in range(turns):
+            graph.invoke({"messages": [f"user {turn}: " + "dolor sit amet " * 10]}, config)
+        if (i + 1) % (threads // 5) == 0:
+            print(f"  {saver_name}: {i + 1} threads, rss +{rss_mb() - rss_start:.0f}MB")
+    elapsed = time.perf_counter() - started
+    if saver_name != "memory":
+        saver.flush()
+
+    latencies.sort()
+    print(f"* {saver_name}: {threads} threads x {turns} turns in {elapsed:.1f}s, "
+          f"{len(latencies)} writes, p50 {latencies[len(latencies) // 2] * 1e6:.0f}us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us, "
+          f"rss +{rss_mb() - rss_start:.0f}MB")
+    if saver_name != "memory":
+        print(f"  {saver.stats()}, {os.path.getsize(path) / 1024 / 1024:.0f}MB on disk")
+        saver.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import subprocess
+    import sys
+    import tempfile
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["test", "bench"])
+    parser.add_argument("--saver", type=str, choices=["memory", "sqlite"], default=None,
+                        help="benchmark only this saver, in this process")
+    parser.add_argument("--threads", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "checkpoints.sqlite")
+        if args.action == "test":
+            with BoundedSqliteSaver(path, keep_last=3, max_threads=2) as saver:
+                graph = build_graph(saver)
+                for i in range(4):
+                    for thread_id in ("a", "b", "c"):
+                        graph.invoke({"messages": [f"{thread_id} {i}"]}, {"configurable": {"thread_id": thread_id}})
+                config = {"configurable": {"thread_id": "a"}}
+                print(graph.get_state(config).values)
+                print(f"* {len(list(saver.list(config)))} checkpoints kept for thread a")
+                print(f"* {saver.stats()}")
+
+            # an idle saver commits its writes after flush_interval
+            with BoundedSqliteSaver(path, flush_interval=0.2) as saver:
+                build_graph(saver).invoke({"messages": ["d 0"]}, {"configurable": {"thread_id": "d"}})
+                time.sleep(0.5)
+                with sqlite3.connect(path) as conn:
+                    committed = conn.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = 'd'").fetchone()[0]
+                assert committed > 0, "the writes of an idle saver were not committed"
+                print(f"* {committed} checkpoints of thread d committed by the timer")
+
+            # reopen: the threads are loaded from disk
+            with BoundedSqliteSaver(path, keep_last=3) as saver:
+                graph = build_graph(saver)
+                print(graph.invoke({"messages": ["a 4"]}, config)["messages"][-2:])
+
+            # the async methods run in a worker thread, off the event loop
+            async def run_async():
+                async with BoundedSqliteSaver(path, keep_last=3) as saver:
+                    graph = build_graph(saver)
+                    loop_thread = threading.get_ident()
+                    put = saver.put
+                    put_threads = set()
+
+                    def put_in_thread(*args, **kwargs):
+                        put_threads.add(threading.get_ident())
+                        return put(*args, **kwargs)
+
+                    saver.put = put_in_thread
+                    config = {"configurable": {"thread_id": "e"}}
+                    for i in range(3):
+                        await graph.ainvoke({"messages": [f"e {i}"]}, config)
+                    assert put_threads and loop_thread not in put_threads, "aput ran on the event loop"
+                    checkpoints = [item async for item in saver.alist(config)]
+                    assert len(checkpoints) == 3, len(checkpoints)
+                    assert (await saver.aget_tuple(config)).checkpoint["id"] == checkpoints[0].checkpoint["id"]
+                    await saver.adelete_thread("e")
+                    assert await saver.aget_tuple(config) is None
+                    print(f"* {len(checkpoints)} checkpoints of thread e written off the event loop")
+
+            asyncio.run(run_async())
+        elif args.saver:
+            bench(args.saver, args.threads, args.turns, path)
+        else:
+            # one process per saver, so the memory of one does not skew the other
+            for saver_name in ("memory", "sqlite"):
+                subprocess.run(
+                    [sys.executable, __file__, "bench", "--saver", saver_name,
+                     "--threads", str(args.threads), "--turns", str(args.turns)],
+                    check=True,
+                )
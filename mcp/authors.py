@@ -0,0 +1,388 @@
+import bisect
+import json
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# An index of the authors of the papers: the papers of an author, and their co-authors.
+#
+# extract_authors() gives the authors as "LastName Initials". The names are normalized
+# (case, accents, punctuation, "J. A. Smith" or "Smith, John A." to "smith ja") and
+# interned: the sorted names are the dictionary, and an author is the position of their
+# name. The index is a folder:
+#   names.bin, name_offsets.npy   the sorted normalized names, UTF-8
+#   postings.bin                  the PMIDs of each author, sorted, delta- and varint-encoded
+#   posting_offsets.npy           where the postings of each author start in postings.bin
+#   posting_counts.npy            the number of papers of each author
+#   pmids.npy, author_offsets.npy, author_ids.npy   the authors of each paper, for co-authors
+# The postings take 2 to 3 bytes per paper and author, and everything is memory-mapped.
+# The paper library builds one per segment while it applies the files (paper_library.py).
+#
+#   python mcp/authors.py build --papers pubmed25n0001.xml.gz --index data/authors
+#   PUBMED_AUTHOR_INDEX=data/authors python mcp/pubmed.py run
+
+# the (author, pmid) pairs encoded at a time
+CHUNK_SIZE = 1 << 22
+
+WORD = re.compile(r"[^\W_]+")
+
+
+def normalize_name(name):
+    '''
+    Normalize an author's name to "last initials", lowercase and without accents, e.g.,
+    "Smith JA", "J. A. Smith" and "Smith, John A." to "smith ja".
+    '''
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).strip()
+    if "," in name:
+        # "Last, Given Names"
+        last, _, given = name.partition(",")
+        words = WORD.findall(given)
+        return " ".join(WORD.findall(last)).lower() + (" " + "".join(w[0] for w in words).lower() if words else "")
+
+    words = WORD.findall(name)
+    if len(words) < 2:
+        return " ".join(words).lower()
+    if len(words[-1]) <= 3 and (words[-1].isupper() or name.islower()):
+        # "Last Initials", as extract_authors() writes them, or already normalized
+        return " ".join(words[:-1]).lower() + " " + words[-1].lower()
+    if all(len(word) == 1 for word in words[:-1]):
+        # "J A Smith"
+        return words[-1].lower() + " " + "".join(words[:-1]).lower()
+    # "Given Names Last"
+    return words[-1].lower() + " " + "".join(word[0] for word in words[:-1]).lower()
+
+
+def varint_encode(values, return_sizes=False):
+    '''
+    Encode unsigned 32-bit integers as LEB128 varints, 7 bits per byte, vectorized.
+
+    :param return_sizes: Whether to also return the number of bytes of each value.
+    '''
+    values = np.asarray(values, dtype=np.uint32)
+    sizes = np.ones(len(values), dtype=np.uint8)
+    for bits in (7, 14, 21, 28):
+        sizes += values >= (1 << bits)
+    starts = np.zeros(len(values), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    out = np.zeros(int(sizes.sum(dtype=np.int64)), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(values) else 0):
+        has = sizes > k
+        more = (sizes[has] > k + 1).astype(np.uint8) << 7
+        out[starts[has] + k] = ((values[has] >> (7 * k)) & 0x7F).astype(np.uint8) | more
+    return (out, sizes) if return_sizes else out
+
+
+def varint_decode(data):
+    '''
+    Decode LEB128 varints, vectorized.
+    '''
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    value_of_byte = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[value_of_byte]) * 7
+    parts = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+class SortedNames:
+    '''
+    The sorted names of the index, read from the mapped UTF-8 blob, for bisect.
+    '''
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+
+class AuthorIndexBuilder:
+    '''
+    Collects the authors of the papers, as they are parsed, and writes the index.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.names = {}
+        self.pair_pmids = array("I")
+        self.pair_authors = array("I")
+
+    def add(self, pmid, authors):
+        pmid = int(pmid)
+        for author in dict.fromkeys(normalize_name(author) for author in authors):
+            if not author:
+                continue
+            if (author_id := self.names.get(author)) is None:
+                author_id = self.names[author] = len(self.names)
+            self.pair_pmids.append(pmid)
+            self.pair_authors.append(author_id)
+
+    def add_paper(self, paper):
+        self.add(paper["pmid"], paper.get("authors") or [])
+
+    def build(self):
+        '''
+        :return: The number of authors.
+        '''
+        return write_index(
+            self.path,
+            list(self.names),
+            np.frombuffer(self.pair_pmids, dtype=np.uint32),
+            np.frombuffer(self.pair_authors, dtype=np.uint32),
+        )
+
+
+def sorted_unique(keys):
+    '''
+    Sort the keys in place and drop the repeats, cheaper than np.unique.
+    '''
+    keys.sort()
+    if len(keys) and (keys[1:] == keys[:-1]).any():
+        keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+    return keys
+
+
+def write_index(path, names, pair_pmids, pair_authors):
+    '''
+    Write the index of (pmid, author) pairs, the authors as positions in `names`.
+    '''
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    # intern the names in sorted order
+    order = np.argsort(np.array(names, dtype=object), kind="stable") if names else np.zeros(0, dtype=np.int64)
+    rank = np.empty(len(names), dtype=np.uint32)
+    rank[order] = np.arange(len(names), dtype=np.uint32)
+    encoded = [names[i].encode() for i in order]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.uint64)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+    with open(path / "names.bin", "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(path / "name_offsets.npy", name_offsets)
+    pairs = len(pair_pmids)
+
+    # the postings: the PMIDs of each author, delta-encoded from the author's first paper.
+    # The pairs are sorted as one uint64 key, author then PMID, to keep the memory low.
+    keys = rank[pair_authors].astype(np.uint64) << np.uint64(32)
+    keys |= pair_pmids
+    keys = sorted_unique(keys)  # a paper listed twice for an author
+    posting_counts = np.bincount((keys >> np.uint64(32)).astype(np.uint32), minlength=len(names)).astype(np.uint32)
+    posting_offsets = np.zeros(len(names) + 1, dtype=np.uint64)
+    with open(path / "postings.bin", "wb") as f:
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[max(start - 1, 0):start + CHUNK_SIZE]
+            authors = (chunk >> np.uint64(32)).astype(np.uint32)
+            pmids = (chunk & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+            if start:
+                authors, pmids = authors[1:], np.diff(pmids)
+                first = authors != (chunk[:-1] >> np.uint64(32)).astype(np.uint32)
+                pmids[first] = (chunk[1:][first] & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+            else:
+                first = np.ones(len(authors), dtype=bool)
+                first[1:] = authors[1:] != authors[:-1]
+                pmids[1:] = np.where(first[1:], pmids[1:], np.diff(pmids))
+            encoded, sizes = varint_encode(pmids, return_sizes=True)
+            posting_offsets[1:] += np.bincount(authors, weights=sizes, minlength=len(names)).astype(np.uint64)
+            encoded.tofile(f)
+    np.cumsum(posting_offsets, out=posting_offsets)
+    np.save(path / "posting_offsets.npy", posting_offsets)
+    np.save(path / "posting_counts.npy", posting_counts)
+
+    # the authors of each paper, sorted by PMID then author
+    keys = pair_pmids.astype(np.uint64) << np.uint64(32)
+    keys |= rank[pair_authors]
+    keys = sorted_unique(keys)
+    pmids, counts = np.unique((keys >> np.uint64(32)).astype(np.uint32), return_counts=True)
+    author_offsets = np.zeros(len(pmids) + 1, dtype=np.uint64)
+    np.cumsum(counts, out=author_offsets[1:])
+    np.save(path / "pmids.npy", pmids)
+    np.save(path / "author_offsets.npy", author_offsets)
+    np.save(path / "author_ids.npy", (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+    del keys
+
+    with open(path / "meta.json", "w") as f:
+        json.dump(dict(authors=len(names), papers=len(pmids), pairs=pairs), f)
+    return len(names)
+
+
+class AuthorIndex:
+    '''
+    The papers of an author and their co-authors.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+        def load(name):
+            return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+        def mapped(name):
+            if (self.path / name).stat().st_size == 0:
+                return np.zeros(0, dtype=np.uint8)
+            return np.memmap(self.path / name, dtype=np.uint8, mode="r")
+
+        self.names = SortedNames(mapped("names.bin"), load("name_offsets"))
+        self.postings = mapped("postings.bin")
+        self.posting_offsets = load("posting_offsets")
+        self.posting_counts = load("posting_counts")
+        self.pmids = load("pmids")
+        self.author_offsets = load("author_offsets")
+        self.author_ids = load("author_ids")
+
+    def author_ids_of(self, name, prefix=False):
+        '''
+        :param prefix: Whether to match the names that start with the name, e.g., "smith j"
+            for "smith ja" and "smith jb".
+        :return: The IDs of the authors with a name.
+        '''
+        name = normalize_name(name)
+        if not name:
+            return []
+        start = bisect.bisect_left(self.names, name)
+        if not prefix:
+            return [start] if start < len(self.names) and self.names[start] == name else []
+        end = bisect.bisect_left(self.names, name + "￿")
+        return list(range(start, end))
+
+    def papers_of(self, author_id):
+        start, end = self.posting_offsets[author_id], self.posting_offsets[author_id + 1]
+        return np.cumsum(varint_decode(self.postings[start:end])).astype(np.uint32)
+
+    def papers_by_author(self, name, prefix=False):
+        '''
+        :return: The PMIDs of the papers of an author, sorted.
+        '''
+        papers = [self.papers_of(author_id) for author_id in self.author_ids_of(name, prefix=prefix)]
+        return np.unique(np.concatenate(papers)) if papers else np.zeros(0, dtype=np.uint32)
+
+    def authors_of(self, pmids):
+        '''
+        :return: The author IDs of the papers, with repeats.
+        '''
+        pmids = np.asarray(pmids, dtype=np.uint32)
+        positions = np.searchsorted(self.pmids, pmids)
+        found = positions < len(self.pmids)
+        positions, pmids = positions[found], pmids[found]
+        positions = positions[self.pmids[positions] == pmids]
+        starts = self.author_offsets[positions].astype(np.int64)
+        counts = self.author_offsets[positions + 1].astype(np.int64) - starts
+        # the positions of the authors of all the papers, as one gather
+        shifts = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        return self.author_ids[np.arange(int(counts.sum())) + shifts]
+
+    def coauthor_ids(self, name, pmids=None):
+        '''
+        :param pmids: The papers of the author to count, by default all of them.
+        :return: The IDs of the co-authors, and their numbers of shared papers.
+        '''
+        own = self.author_ids_of(name)
+        if pmids is None:
+            pmids = self.papers_by_author(name)
+        ids, counts = np.unique(self.authors_of(pmids), return_counts=True)
+        others = ~np.isin(ids, own)
+        return ids[others], counts[others]
+
+    def coauthor_counts(self, name, pmids=None):
+        '''
+        :return: A Counter of the co-authors' names by number of shared papers.
+        '''
+        ids, counts = self.coauthor_ids(name, pmids=pmids)
+        return Counter({self.names[int(i)]: int(c) for i, c in zip(ids, counts)})
+
+    def coauthors(self, name, top=20):
+        '''
+        :return: The top co-authors' names and numbers of shared papers, most first.
+        '''
+        ids, counts = self.coauthor_ids(name)
+        # only the names of the top co-authors are read
+        order = np.lexsort((ids, -counts.astype(np.int64)))[:top]
+        return [(self.names[int(ids[i])], int(counts[i])) for i in order]
+
+
+if __name__ == "__main__":
+    import argparse
+    import resource
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["build", "papers", "coauthors", "bench"])
+    parser.add_argument("--index", type=str, default="data/authors")
+    parser.add_argument("--papers", type=str, action="append", default=[],
+                        help="a PubMed XML file or a JSONL file of papers")
+    parser.add_argument("--library", type=str, default=None, help="a paper library, built with paper_library.py")
+    parser.add_argument("--name", type=str, default=None)
+    parser.add_argument("--prefix", action="store_true")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="papers, for the benchmark")
+    parser.add_argument("--authors", type=int, default=3_000_000, help="distinct authors, for the benchmark")
+    args = parser.parse_args()
+
+    if args.action == "build":
+        if args.library:
+            from paper_library import PaperLibrary
+            papers = PaperLibrary(args.library).iter_live_papers()
+        else:
+            from pubmed_files import iter_papers
+            papers = (paper for path in args.papers for paper in iter_papers(path))
+        builder = AuthorIndexBuilder(args.index)
+        for paper in papers:
+            builder.add_paper(paper)
+        print(f"* indexed {builder.build()} authors")
+    elif args.action == "papers":
+        print(AuthorIndex(args.index).papers_by_author(args.name, prefix=args.prefix).tolist())
+    elif args.action == "coauthors":
+        print(AuthorIndex(args.index).coauthors(args.name))
+    elif args.action == "bench":
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            started = time.perf_counter()
+            # 1 to 12 authors per paper, a few prolific authors and many occasional ones
+            counts = rng.integers(1, 13, size=args.rows)
+            pair_pmids = np.repeat(np.arange(1, args.rows + 1, dtype=np.uint32), counts)
+            # the top authors have a few thousand papers, as in PubMed
+            pair_authors = (args.authors * rng.random(len(pair_pmids)) ** 1.5).astype(np.uint32)
+            letters = "abcdefghijklmnopqrstuvwxyz"
+            names = [
+                "".join(letters[i // 26 ** k % 26] for k in range(5)) + " " + letters[i % 7] + letters[i % 11]
+                for i in range(args.authors)
+            ]
+            print(f"* {args.rows} papers, {len(pair_pmids)} authorships, {args.authors} authors, "
+                  f"generated in {time.perf_counter() - started:.1f}s")
+
+            started = time.perf_counter()
+            write_index(tmpdir, names, pair_pmids, pair_authors)
+            print(f"* built in {time.perf_counter() - started:.1f}s, peak RSS "
+                  f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB")
+            pairs = len(pair_pmids)
+            del pair_pmids, pair_authors
+
+            sizes = {child.name: child.stat().st_size for child in Path(tmpdir).iterdir()}
+            postings = sizes["postings.bin"] + sizes["posting_offsets.npy"] + sizes["posting_counts.npy"]
+            names_size = sizes["names.bin"] + sizes["name_offsets.npy"]
+            papers_size = sizes["pmids.npy"] + sizes["author_offsets.npy"] + sizes["author_ids.npy"]
+            print(f"* postings {postings / 1e6:.0f}MB ({sizes['postings.bin'] / pairs:.2f} bytes per authorship), "
+                  f"names {names_size / 1e6:.0f}MB, authors of the papers {papers_size / 1e6:.0f}MB")
+
+            index = AuthorIndex(tmpdir)
+            for label, sample in [("prolific", names[1:4]), ("occasional", names[-3:])]:
+                for name in sample:
+                    started = time.perf_counter()
+                    papers = index.papers_by_author(name)
+                    papers_seconds = time.perf_counter() - started
+                    started = time.perf_counter()
+                    coauthors = index.coauthors(name, top=5)
+                    coauthors_seconds = time.perf_counter() - started
+                    print(f"* {label} {name}: {len(papers)} papers in {papers_seconds * 1000:.2f}ms, "
+                          f"{len(coauthors)} top co-authors in {coauthors_seconds * 1000:.1f}ms")
@@ -1,11 +1,17 @@
+import os
 import re
 import logging
 import requests
 from mcp.server.fastmcp import FastMCP
 
+from trial_index import TrialIndex
+
 # Create server
 mcp = FastMCP("Clinical Trial")
 
+# the local search index of the registry, built with trial_index.py
+trial_index = TrialIndex(os.getenv("CLINICAL_TRIAL_INDEX")) if os.path.exists(os.getenv("CLINICAL_TRIAL_INDEX", "")) else None
+
 
 @mcp.tool()
 def extract_nct_id(text: str) -> str:
@@ -14,6 +20,34 @@ def extract_nct_id(text: str) -> str:
     return re.search(r"NCT\d+", text).group(0)
 
 
+@mcp.tool()
+def search_trials(condition: str = "", intervention: str = "", phase: str = "", status: str = "", limit: int = 20) -> dict:
+    """Search the clinical trials registry, e.g., the phase 3 trials recruiting for a condition
+
+    Args:
+        condition: The words of the condition, e.g., type 2 diabetes
+        intervention: The words of the intervention, e.g., metformin
+        phase: The phases, comma-separated for any of them, e.g., 2, 3 or EARLY_PHASE1
+        status: The statuses, comma-separated for any of them, e.g., recruiting, not yet recruiting
+        limit: How many trials to return, the most recently started first
+
+    Returns:
+        The number of matching trials, their counts by phase and status, and the trials
+    """
+    logging.info(f"search_trials ({condition=}, {intervention=}, {phase=}, {status=})")
+    if trial_index is None:
+        return dict(error="no trial index, set CLINICAL_TRIAL_INDEX to the folder built with trial_index.py")
+    if not any((condition, intervention, phase, status)):
+        return dict(error="give a condition, an intervention, a phase or a status")
+    return trial_index.search(
+        condition=condition,
+        intervention=intervention,
+        phases=[value for value in phase.split(",") if value.strip()],
+        statuses=[value for value in status.split(",") if value.strip()],
+        limit=limit,
+    )
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -0,0 +1,479 @@
+import importlib
+import json
+import os
+import re
+import shutil
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# Dense-vector similarity search over the titles and abstracts of the papers, for
+# "papers like this one".
+#
+# The papers are embedded by a pluggable local function, texts in and vectors out. The
+# default is a hashing embedder (signed feature hashing of the words and word pairs), which
+# needs no model, network or GPU; any other embedder is given as module:function, e.g., a
+# wrapper around a sentence-transformers model.
+#
+# The vectors are stored memory-mapped, in float16 or in int8 with a scale per vector:
+#   pmids.bin      uint32 per vector
+#   vectors.bin    the vectors, normalized, float16 or int8 (vectors x dim)
+#   scales.bin     float32 per vector, for int8
+#   meta.json      the dim, the dtype, the embedder and the number of vectors
+# New papers are appended, and meta.json is replaced last, so readers never see a vector
+# that is half written. Search is brute force over chunks of the matrix, or over the
+# nearest partitions of an IVF index (k-means centroids) built with `build_ivf` into a new
+# folder, ivf-000001/, ..., that meta.json names.
+
+DEFAULT_DIM = 256
+# the IVF partitions a search scores
+DEFAULT_NPROBE = 8
+DEFAULT_EMBEDDER = "hashing"
+DTYPES = ("float16", "int8")
+
+# the rows scored at a time in brute force, to bound the memory of the float32 copy
+CHUNK_ROWS = 65_536
+
+WORD = re.compile(r"\w+")
+
+
+def paper_text(paper):
+    return f"{paper.get('title') or ''} {paper.get('abstract') or ''}"
+
+
+class HashingEmbedder:
+    '''
+    Embeds texts by hashing their words and word pairs into `dim` signed buckets,
+    log-scaled and normalized. Deterministic, and fast enough for millions of abstracts.
+    '''
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+
+    def embed_one(self, text, out):
+        words = WORD.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            return
+        hashes = np.array([zlib.crc32(feature.encode()) for feature in features], dtype=np.uint32)
+        # the low bits pick the bucket, the top bit the sign
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        np.add.at(out, hashes % self.dim, signs)
+
+    def __call__(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            self.embed_one(text, vectors[row])
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def load_embedder(spec=DEFAULT_EMBEDDER, dim=DEFAULT_DIM):
+    '''
+    Get an embedder: "hashing", or "module:function" for a function that takes a list of
+    texts and returns an array of vectors.
+    '''
+    if spec == "hashing":
+        return HashingEmbedder(dim)
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def quantize(vectors, dtype):
+    '''
+    :return: The vectors in the storage dtype, and their scales for int8.
+    '''
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+class MappedVectors:
+    '''
+    The vectors of one version of a store, and their IVF index, mapped once and never
+    changed: a search holds one snapshot from start to end, while the store swaps in the
+    next one.
+    '''
+
+    def __init__(self, path, meta):
+        count = meta["count"]
+        dim, dtype = meta["dim"], meta["dtype"]
+        self.count = count
+        self.ivf_count = meta.get("ivf_count", 0)
+
+        def mapped(name, dtype, shape):
+            if not count:
+                return np.zeros(shape, dtype=dtype)
+            return np.memmap(path / name, dtype=dtype, mode="r", shape=shape)
+
+        self.pmids = mapped("pmids.bin", np.uint32, (count,))
+        self.vectors = mapped("vectors.bin", dtype, (count, dim))
+        self.scales = mapped("scales.bin", np.float32, (count,)) if dtype == "int8" else None
+        self._lock = threading.Lock()
+        self._row_of = None
+
+        self.centroids = self.ivf_rows = self.ivf_offsets = None
+        if self.ivf_count:
+            # the stores built before the IVF folders have the files at the top
+            ivf_path = path / meta["ivf_dir"] if meta.get("ivf_dir") else path
+            self.centroids = np.load(ivf_path / "ivf_centroids.npy")
+            self.ivf_rows = np.load(ivf_path / "ivf_rows.npy", mmap_mode="r")
+            self.ivf_offsets = np.load(ivf_path / "ivf_offsets.npy")
+
+    def row(self, pmid):
+        with self._lock:
+            if self._row_of is None:
+                order = np.argsort(self.pmids, kind="stable")
+                self._row_of = (np.asarray(self.pmids)[order], order)
+            sorted_pmids, order = self._row_of
+        position = np.searchsorted(sorted_pmids, int(pmid))
+        if position < len(sorted_pmids) and sorted_pmids[position] == int(pmid):
+            return int(order[position])
+        return None
+
+    def vector(self, row):
+        vector = np.asarray(self.vectors[row], dtype=np.float32)
+        return vector * self.scales[row] if self.scales is not None else vector
+
+    def chunk(self, start, end):
+        chunk = np.asarray(self.vectors[start:end], dtype=np.float32)
+        return chunk * self.scales[start:end, None] if self.scales is not None else chunk
+
+    def _score_rows(self, rows, query):
+        chunk = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            chunk *= self.scales[rows, None]
+        return chunk @ query
+
+    @staticmethod
+    def _top(scores, rows, k):
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+            scores, rows = scores[best], rows[best]
+        order = np.argsort(-scores)
+        return scores[order], rows[order]
+
+    def search(self, query, k=10, nprobe=None, exclude=None):
+        '''
+        Find the nearest vectors to a query, by cosine similarity.
+
+        :param nprobe: The number of IVF partitions to score, or None for brute force.
+        :param exclude: A PMID to leave out, e.g., the query's paper.
+        :return: A list of (pmid, similarity), most similar first.
+        '''
+        query = normalize(np.asarray(query)[None, :])[0]
+        best_scores, best_rows = np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        def merge(scores, rows):
+            nonlocal best_scores, best_rows
+            best_scores, best_rows = self._top(
+                np.concatenate([best_scores, scores]), np.concatenate([best_rows, rows]), k + 1
+            )
+
+        start = 0
+        if nprobe and self.centroids is not None:
+            probes = np.argsort(-(self.centroids @ query))[:nprobe]
+            rows = np.concatenate([self.ivf_rows[self.ivf_offsets[p]:self.ivf_offsets[p + 1]] for p in probes])
+            rows = np.sort(rows).astype(np.int64)
+            merge(self._score_rows(rows, query), rows)
+            # the vectors added after the IVF build
+            start = self.ivf_count
+        for chunk_start in range(start, self.count, CHUNK_ROWS):
+            chunk_end = min(chunk_start + CHUNK_ROWS, self.count)
+            merge(self.chunk(chunk_start, chunk_end) @ query, np.arange(chunk_start, chunk_end))
+
+        results = [
+            (str(self.pmids[row]), round(float(score), 4))
+            for score, row in zip(best_scores, best_rows)
+            if exclude is None or int(self.pmids[row]) != int(exclude)
+        ]
+        return results[:k]
+
+
+class EmbeddingStore:
+    '''
+    The vectors of the papers, memory-mapped, with brute-force and IVF search.
+
+    Only one process may write to a store at a time, e.g., `embeddings.py add` after each
+    update; any number of processes read it.
+    '''
+
+    def __init__(self, path, dim=DEFAULT_DIM, dtype="float16", embedder=DEFAULT_EMBEDDER):
+        '''
+        :param dim, dtype, embedder: The parameters of a new store. An existing store
+            keeps its own.
+        '''
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        if (self.path / "meta.json").exists():
+            with open(self.path / "meta.json") as f:
+                self.meta = json.load(f)
+        else:
+            if dtype not in DTYPES:
+                raise ValueError(f"unknown dtype: {dtype}, expected one of {DTYPES}")
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.meta = dict(dim=dim, dtype=dtype, embedder=embedder, count=0, ivf_count=0)
+            self._write_meta()
+        self.dim = self.meta["dim"]
+        self.dtype = self.meta["dtype"]
+        self.embedder = load_embedder(self.meta["embedder"], self.dim)
+        self._meta_mtime = (self.path / "meta.json").stat().st_mtime_ns
+        self._map()
+
+    def refresh(self):
+        '''
+        Map the vectors appended by another process since the store was opened.
+        '''
+        mtime = (self.path / "meta.json").stat().st_mtime_ns
+        if mtime == self._meta_mtime:
+            return
+        with self._lock:
+            if mtime == self._meta_mtime:
+                return
+            with open(self.path / "meta.json") as f:
+                self.meta = json.load(f)
+            self._meta_mtime = mtime
+            self._map()
+
+    def _write_meta(self):
+        tmp_path = self.path / "meta.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.path / "meta.json")
+        self._meta_mtime = (self.path / "meta.json").stat().st_mtime_ns
+
+    def _map(self):
+        # one assignment, so a search sees the old snapshot or the new one, never a mix
+        self.mapped = MappedVectors(self.path, self.meta)
+
+    def __len__(self):
+        return self.mapped.count
+
+    @property
+    def pmids(self):
+        return self.mapped.pmids
+
+    def row(self, pmid):
+        return self.mapped.row(pmid)
+
+    def vector(self, row):
+        return self.mapped.vector(row)
+
+    ###########################################################
+    # Writes
+    ###########################################################
+
+    def add(self, pmids, vectors):
+        '''
+        Append vectors. The readers see them once meta.json is replaced.
+        '''
+        if not len(pmids):
+            return
+        stored, scales = quantize(normalize(vectors), self.dtype)
+        self._append("pmids.bin", np.asarray(pmids, dtype=np.uint32))
+        self._append("vectors.bin", stored)
+        if scales is not None:
+            self._append("scales.bin", scales)
+        self.meta["count"] += len(pmids)
+        self._write_meta()
+        self._map()
+
+    def _append(self, name, rows):
+        with open(self.path / name, "ab") as f:
+            # drop what an interrupted append left past the last committed row
+            f.truncate(self.meta["count"] * rows[0].nbytes)
+            f.write(rows.tobytes())
+
+    def add_papers(self, papers, batch_size=1_000):
+        '''
+        Embed and append the papers that are not in the store yet.
+
+        :return: The number of papers added.
+        '''
+        known = set(np.asarray(self.pmids).tolist())
+        added = 0
+        batch = []
+
+        def flush():
+            nonlocal added, batch
+            self.add([int(paper["pmid"]) for paper in batch], self.embedder([paper_text(paper) for paper in batch]))
+            added += len(batch)
+            batch = []
+
+        for paper in papers:
+            pmid = int(paper["pmid"])
+            if pmid in known:
+                continue
+            known.add(pmid)
+            batch.append(paper)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return added
+
+    def build_ivf(self, nlist=None, iterations=10, sample=100_000, seed=0):
+        '''
+        Partition the vectors with k-means, so a search only scores the nearest partitions.
+        Vectors added later are searched brute force until the next build.
+
+        Each build writes a new folder of IVF files, and meta.json points to it once it is
+        complete, so the readers that have the previous files mapped keep reading them.
+        '''
+        mapped = self.mapped
+        count = mapped.count
+        nlist = nlist or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        training = np.stack([mapped.vector(row) for row in rng.choice(count, size=min(sample, count), replace=False)])
+        centroids = training[rng.choice(len(training), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(training @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = training[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = normalize(centroids)
+
+        assignments = np.concatenate([
+            np.argmax(mapped.chunk(start, min(start + CHUNK_ROWS, count)) @ centroids.T, axis=1)
+            for start in range(0, count, CHUNK_ROWS)
+        ])
+        order = np.argsort(assignments, kind="stable").astype(np.uint32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+
+        old_dir = self.meta.get("ivf_dir")
+        ivf_dir = f"ivf-{self.meta.get('ivf_builds', 0) + 1:06d}"
+        tmp_path = self.path / f"{ivf_dir}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir()
+        np.save(tmp_path / "ivf_centroids.npy", centroids.astype(np.float32))
+        np.save(tmp_path / "ivf_rows.npy", order)
+        np.save(tmp_path / "ivf_offsets.npy", offsets)
+        os.replace(tmp_path, self.path / ivf_dir)
+
+        self.meta.update(ivf_count=count, ivf_dir=ivf_dir, ivf_builds=self.meta.get("ivf_builds", 0) + 1)
+        self._write_meta()
+        self._map()
+        # the readers that still map the old files keep them until they refresh
+        if old_dir:
+            shutil.rmtree(self.path / old_dir, ignore_errors=True)
+        else:
+            for name in ("ivf_centroids.npy", "ivf_rows.npy", "ivf_offsets.npy"):
+                (self.path / name).unlink(missing_ok=True)
+
+    ###########################################################
+    # Search
+    ###########################################################
+
+    def search(self, query, k=10, nprobe=None, exclude=None):
+        '''
+        Find the nearest vectors to a query, by cosine similarity, see MappedVectors.search().
+        '''
+        return self.mapped.search(query, k=k, nprobe=nprobe, exclude=exclude)
+
+    def similar_to_pmid(self, pmid, k=10, nprobe=None):
+        '''
+        :return: The papers most similar to a paper of the store, or None if it is not in the store.
+        '''
+        self.refresh()
+        mapped = self.mapped
+        if (row := mapped.row(pmid)) is None:
+            return None
+        return mapped.search(mapped.vector(row), k=k, nprobe=nprobe, exclude=pmid)
+
+    def similar_to_text(self, text, k=10, nprobe=None, exclude=None):
+        self.refresh()
+        return self.search(self.embedder([text])[0], k=k, nprobe=nprobe, exclude=exclude)
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["add", "ivf", "search", "bench"])
+    parser.add_argument("--store", type=str, default="data/embeddings")
+    parser.add_argument("--papers", type=str, action="append", default=[],
+                        help="a PubMed XML file or a JSONL file of papers")
+    parser.add_argument("--library", type=str, default=None, help="a paper library, built with paper_library.py")
+    parser.add_argument("--embedder", type=str, default=DEFAULT_EMBEDDER, help="hashing, or module:function")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--dtype", type=str, default="float16", choices=DTYPES)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--pmid", type=str, default=None)
+    parser.add_argument("--text", type=str, default=None)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rows", type=int, action="append", default=[])
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.action == "add":
+        # only the papers that are not in the store yet are embedded
+        store = EmbeddingStore(args.store, dim=args.dim, dtype=args.dtype, embedder=args.embedder)
+        if args.library:
+            from paper_library import PaperLibrary
+            papers = PaperLibrary(args.library).iter_live_papers()
+        else:
+            from pubmed_files import iter_papers
+            papers = (paper for path in args.papers for paper in iter_papers(path))
+        started = time.perf_counter()
+        added = store.add_papers(papers)
+        print(f"* embedded {added} new papers in {time.perf_counter() - started:.1f}s, {len(store)} in the store")
+    elif args.action == "ivf":
+        store = EmbeddingStore(args.store)
+        started = time.perf_counter()
+        store.build_ivf(nlist=args.nlist)
+        print(f"* built the IVF index of {len(store)} vectors in {time.perf_counter() - started:.1f}s")
+    elif args.action == "search":
+        store = EmbeddingStore(args.store)
+        if args.pmid:
+            print(store.similar_to_pmid(args.pmid, k=args.k, nprobe=args.nprobe))
+        else:
+            print(store.similar_to_text(args.text, k=args.k, nprobe=args.nprobe))
+    elif args.action == "bench":
+        rng = np.random.default_rng(0)
+        for rows in args.rows or [100_000, 1_000_000]:
+            for dtype in DTYPES:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    # clustered vectors, like the topics of the abstracts
+                    store = EmbeddingStore(tmpdir, dim=args.dim, dtype=dtype)
+                    topics = normalize(rng.standard_normal((1_000, args.dim)))
+                    for start in range(0, rows, 100_000):
+                        size = min(100_000, rows - start)
+                        vectors = topics[rng.integers(0, len(topics), size)] + rng.standard_normal((size, args.dim)) * 0.08
+                        store.add(np.arange(start + 1, start + size + 1), vectors)
+                    started = time.perf_counter()
+                    store.build_ivf(nlist=args.nlist)
+                    ivf_seconds = time.perf_counter() - started
+                    disk = sum(os.path.getsize(Path(tmpdir) / name) for name in ("vectors.bin", "scales.bin")
+                               if (Path(tmpdir) / name).exists())
+                    print(f"* {rows} vectors of {args.dim} {dtype}: {disk / 1e6:.0f}MB, IVF built in {ivf_seconds:.1f}s")
+
+                    queries = [int(row) for row in rng.integers(0, rows, args.queries)]
+                    exact = {}
+                    for nprobe in [None, 1, 4, 16]:
+                        started = time.perf_counter()
+                        recall = []
+                        for row in queries:
+                            results = [pmid for pmid, _ in store.search(store.vector(row), k=args.k, nprobe=nprobe)]
+                            if nprobe is None:
+                                exact[row] = set(results)
+                            else:
+                                recall.append(len(exact[row] & set(results)) / len(exact[row]))
+                        latency = (time.perf_counter() - started) / len(queries)
+                        label = "brute force" if nprobe is None else f"IVF nprobe {nprobe}, recall@{args.k} {np.mean(recall):.1%}"
+                        print(f"  - {label}: {latency * 1000:.1f}ms per query")
@@ -0,0 +1,215 @@
+import datetime
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from pubmed_files import iter_papers
+
+# Columnar export of the parsed papers to Parquet or Arrow, for the analytics jobs.
+#
+# The papers are streamed from the PubMed XML files (or JSONL files of papers) and written
+# in batches of --batch-size rows, one row group per batch, so memory stays flat whatever
+# the size of the input. Authors, MeSH terms and references are list columns, and the
+# journal and the type are dictionary-encoded. With several input files, each one is
+# exported to its own part of the output folder, in parallel with --workers:
+#
+#   python mcp/export_papers.py --input pubmed25n0001.xml.gz --input pubmed25n0002.xml.gz --output data/papers.parquet --workers 4
+#
+#   import pyarrow.dataset as ds
+#   ds.dataset("data/papers.parquet").to_table(columns=["pmid", "source"])
+
+DEFAULT_BATCH_SIZE = 10_000
+
+FORMATS = ("parquet", "arrow")
+
+SCHEMA = pa.schema([
+    ("pmid", pa.int64()),
+    ("pmcid", pa.string()),
+    ("doi", pa.string()),
+    ("title", pa.string()),
+    ("type", pa.dictionary(pa.int32(), pa.string())),
+    ("source", pa.dictionary(pa.int32(), pa.string())),
+    ("publication_date", pa.date32()),
+    ("authors", pa.list_(pa.string())),
+    ("abstract", pa.string()),
+    ("full_text", pa.string()),
+    ("full_text_type", pa.string()),
+    ("references", pa.list_(pa.string())),
+    ("mesh_terms", pa.list_(pa.string())),
+    ("date_revised", pa.date32()),
+])
+
+
+def parse_date(date):
+    # extract_date falls back to 1701-10-09 when the paper has no date
+    if not date or date == "1701-10-09":
+        return None
+    try:
+        return datetime.date.fromisoformat(date)
+    except ValueError:
+        return None
+
+
+def to_batch(papers):
+    '''
+    Convert papers, as returned by create_paper(), to an Arrow record batch.
+    '''
+    columns = {name: [] for name in SCHEMA.names}
+    for paper in papers:
+        for name in SCHEMA.names:
+            columns[name].append(paper.get(name))
+    columns["pmid"] = [int(pmid) if pmid else None for pmid in columns["pmid"]]
+    columns["publication_date"] = [parse_date(date) for date in columns["publication_date"]]
+    columns["date_revised"] = [parse_date(date) for date in columns["date_revised"]]
+
+    arrays = []
+    for field in SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(columns[field.name], type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+class BatchWriter:
+    '''
+    Writes record batches to a Parquet or an Arrow IPC file. The file is written under a
+    temporary name and renamed when closed, so readers never see a partial file.
+    '''
+
+    def __init__(self, path, format="parquet", compression="zstd"):
+        if format not in FORMATS:
+            raise ValueError(f"unknown format: {format}, expected one of {FORMATS}")
+        self.path = Path(path)
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        if format == "parquet":
+            self._writer = pq.ParquetWriter(
+                self._tmp_path,
+                SCHEMA,
+                compression=compression,
+                use_dictionary=["type", "source"],
+            )
+        else:
+            self._sink = pa.OSFile(str(self._tmp_path), "wb")
+            self._writer = pa.ipc.new_file(self._sink, SCHEMA, options=pa.ipc.IpcWriteOptions(compression=compression))
+        self.format = format
+        self.rows = 0
+
+    def write(self, batch):
+        if self.format == "parquet":
+            # one row group per batch
+            self._writer.write_batch(batch, row_group_size=len(batch))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += len(batch)
+
+    def close(self):
+        self._writer.close()
+        if self.format == "arrow":
+            self._sink.close()
+        os.replace(self._tmp_path, self.path)
+
+
+def export_file(input_path, output_path, format="parquet", batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    Export the papers of one file.
+
+    :return: The number of papers exported.
+    '''
+    writer = BatchWriter(output_path, format=format)
+    batch = []
+    for paper in iter_papers(input_path):
+        batch.append(paper)
+        if len(batch) >= batch_size:
+            writer.write(to_batch(batch))
+            batch = []
+    if batch:
+        writer.write(to_batch(batch))
+    writer.close()
+    logging.info(f"* exported {writer.rows} papers from {input_path} to {output_path}")
+    return writer.rows
+
+
+def part_name(input_path, format):
+    name = Path(input_path).name
+    for suffix in (".gz", ".xml", ".jsonl"):
+        name = name.removesuffix(suffix)
+    return f"{name}.{format}"
+
+
+def export(input_paths, output_path, format="parquet", batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    '''
+    Export the papers of the input files: one input to one output file, or several inputs
+    to one part each in an output folder, exported in parallel by the worker processes.
+
+    :return: The number of papers exported.
+    '''
+    if len(input_paths) == 1:
+        return export_file(input_paths[0], output_path, format=format, batch_size=batch_size)
+
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    jobs = [(input_path, output_path / part_name(input_path, format)) for input_path in input_paths]
+    if workers <= 1:
+        return sum(export_file(i, o, format=format, batch_size=batch_size) for i, o in jobs)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_file, i, o, format=format, batch_size=batch_size) for i, o in jobs]
+        return sum(future.result() for future in futures)
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import resource
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, nargs="?", default="export", choices=["export", "bench"])
+    parser.add_argument("--input", type=str, action="append", default=[],
+                        help="a PubMed XML file, gzipped or not, or a JSONL file of papers")
+    parser.add_argument("--output", type=str, default="data/papers.parquet")
+    parser.add_argument("--format", type=str, default="parquet", choices=FORMATS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=2_000, help="papers per file, for the benchmark")
+    args = parser.parse_args()
+
+    def peak_rss_mb():
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        return max(own, children)
+
+    if args.action == "export":
+        started = time.perf_counter()
+        rows = export(args.input, args.output, format=args.format, batch_size=args.batch_size, workers=args.workers)
+        print(f"* exported {rows} papers to {args.output} in {time.perf_counter() - started:.1f}s")
+    elif args.action == "bench":
+        from pubmed_files import write_synthetic_file
+
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            inputs = []
+            for i in range(args.files):
+                path = Path(tmpdir) / f"pubmed25n{i + 1:04d}.xml.gz"
+                write_synthetic_file(path, range(i * args.rows + 1, (i + 1) * args.rows + 1), rng)
+                inputs.append(str(path))
+            print(f"* {args.files} files of {args.rows} papers")
+
+            for workers in sorted({1, args.workers}):
+                output = Path(tmpdir) / f"papers-{workers}.{args.format}"
+                started = time.perf_counter()
+                rows = export(inputs, output, format=args.format, batch_size=args.batch_size, workers=workers)
+                elapsed = time.perf_counter() - started
+                print(f"* {workers} workers: {rows} papers in {elapsed:.1f}s ({rows / elapsed:.0f} papers/s), "
+                      f"peak RSS {peak_rss_mb():.0f}MB")
+
+            table = ds.dataset(output, format="parquet" if args.format == "parquet" else "ipc").to_table()
+            print(f"* read back {table.num_rows} rows, {table.schema.field('source').type} journals")
@@ -0,0 +1,294 @@
+import json
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+# A columnar index of the papers for faceted counts: by MeSH term, publication type,
+# journal and year, over the papers that match a filter ("how many RCTs on X per year?").
+#
+# Every value is integer-coded with a dictionary, and the index is a folder of arrays:
+#   year.npy                    uint16 per paper, 0 when unknown
+#   journal.npy                 uint32 code per paper
+#   type_offsets.npy, type_codes.npy, type_rows.npy   the publication types of each paper (CSR),
+#                                                     and the paper of each entry
+#   mesh_offsets.npy, mesh_codes.npy, mesh_rows.npy   the same for the MeSH terms
+#   type_postings_*.npy, mesh_postings_*.npy          the papers of each type and term (inverted)
+#   dictionaries.json            the names behind the codes
+# The arrays are memory-mapped, so the counts over millions of papers are NumPy bincounts
+# over a boolean mask and take tens of milliseconds.
+
+FACETS = ("year", "journal", "type", "mesh")
+MULTI_VALUED = ("type", "mesh")
+
+
+def paper_year(paper):
+    date = paper.get("publication_date") or ""
+    year = int(date[:4]) if date[:4].isdigit() else 0
+    # extract_date falls back to 1701-10-09 when the paper has no date
+    return 0 if year == 1701 else year
+
+
+def paper_types(paper):
+    # extract_paper_type joins the types with '|'
+    return [paper_type for paper_type in (paper.get("type") or "").split("|") if paper_type]
+
+
+class Dictionary:
+    '''
+    Integer codes for the values of a facet, case-insensitive.
+    '''
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.codes = {name.lower(): code for code, name in enumerate(self.names)}
+
+    def code(self, name):
+        key = name.lower()
+        if (code := self.codes.get(key)) is None:
+            code = self.codes[key] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def get(self, name):
+        return self.codes.get(name.lower())
+
+    def __len__(self):
+        return len(self.names)
+
+
+class FacetIndexBuilder:
+    '''
+    Collects the facets of papers, as returned by create_paper(), and writes the index.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dictionaries = {facet: Dictionary() for facet in ("journal", "type", "mesh")}
+        self.pmid = array("I")
+        self.year = array("H")
+        self.journal = array("I")
+        self.codes = {facet: array("I") for facet in MULTI_VALUED}
+        self.offsets = {facet: array("Q", [0]) for facet in MULTI_VALUED}
+
+    def add(self, paper):
+        self.pmid.append(int(paper.get("pmid") or 0))
+        self.year.append(paper_year(paper))
+        self.journal.append(self.dictionaries["journal"].code(paper.get("source") or "Unknown"))
+        for facet, values in (("type", paper_types(paper)), ("mesh", paper.get("mesh_terms") or [])):
+            # a paper counts once per value
+            codes = sorted({self.dictionaries[facet].code(value) for value in values})
+            self.codes[facet].extend(codes)
+            self.offsets[facet].append(len(self.codes[facet]))
+
+    def add_papers(self, path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    self.add(json.loads(line))
+
+    def build(self):
+        '''
+        Write the arrays and the dictionaries.
+
+        :return: The number of papers.
+        '''
+        rows = len(self.pmid)
+        np.save(self.path / "pmid.npy", np.frombuffer(self.pmid, dtype=np.uint32))
+        np.save(self.path / "year.npy", np.frombuffer(self.year, dtype=np.uint16))
+        np.save(self.path / "journal.npy", np.frombuffer(self.journal, dtype=np.uint32))
+
+        for facet in MULTI_VALUED:
+            offsets = np.frombuffer(self.offsets[facet], dtype=np.uint64)
+            codes = np.frombuffer(self.codes[facet], dtype=np.uint32)
+            entry_rows = np.repeat(np.arange(rows, dtype=np.uint32), np.diff(offsets).astype(np.int64))
+            np.save(self.path / f"{facet}_offsets.npy", offsets)
+            np.save(self.path / f"{facet}_codes.npy", codes)
+            np.save(self.path / f"{facet}_rows.npy", entry_rows)
+
+            # the inverted index: the entries sorted by code are the papers of each code, in order
+            order = np.argsort(codes, kind="stable")
+            postings = entry_rows[order]
+            postings_offsets = np.zeros(len(self.dictionaries[facet]) + 1, dtype=np.uint64)
+            np.cumsum(np.bincount(codes, minlength=len(self.dictionaries[facet])), out=postings_offsets[1:])
+            np.save(self.path / f"{facet}_postings.npy", postings)
+            np.save(self.path / f"{facet}_postings_offsets.npy", postings_offsets)
+
+        with open(self.path / "dictionaries.json", "w") as f:
+            json.dump({facet: dictionary.names for facet, dictionary in self.dictionaries.items()}, f)
+        return rows
+
+
+class FacetIndex:
+    '''
+    Faceted counts over the papers that match a filter.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "dictionaries.json") as f:
+            self.dictionaries = {facet: Dictionary(names) for facet, names in json.load(f).items()}
+
+        def load(name):
+            return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+        self.pmid = load("pmid")
+        self.year = load("year")
+        self.journal = load("journal")
+        self.rows = len(self.pmid)
+        self.offsets = {facet: load(f"{facet}_offsets") for facet in MULTI_VALUED}
+        self.codes = {facet: load(f"{facet}_codes") for facet in MULTI_VALUED}
+        self.entry_rows = {facet: load(f"{facet}_rows") for facet in MULTI_VALUED}
+        self.postings = {facet: load(f"{facet}_postings") for facet in MULTI_VALUED}
+        self.postings_offsets = {facet: load(f"{facet}_postings_offsets") for facet in MULTI_VALUED}
+
+    def _papers_with(self, facet, name):
+        '''
+        :return: The rows of the papers with a type or MeSH term, or None if it is unknown.
+        '''
+        if (code := self.dictionaries[facet].get(name)) is None:
+            return None
+        start, end = self.postings_offsets[facet][code], self.postings_offsets[facet][code + 1]
+        return self.postings[facet][start:end]
+
+    def match(self, mesh_terms=(), publication_types=(), journal=None, year_from=None, year_to=None):
+        '''
+        Get the papers that have all the MeSH terms, any of the publication types, the
+        journal and a year in the range.
+
+        :return: A boolean mask over the papers, or None for all of them.
+        '''
+        mask = None
+
+        def restrict(rows):
+            nonlocal mask
+            selected = np.zeros(self.rows, dtype=bool)
+            if rows is not None:
+                selected[rows] = True
+            mask = selected if mask is None else mask & selected
+
+        for mesh_term in mesh_terms:
+            restrict(self._papers_with("mesh", mesh_term))
+        if publication_types:
+            rows = [self._papers_with("type", name) for name in publication_types]
+            rows = [r for r in rows if r is not None]
+            restrict(np.concatenate(rows) if rows else None)
+        if journal:
+            code = self.dictionaries["journal"].get(journal)
+            selected = self.journal == code if code is not None else np.zeros(self.rows, dtype=bool)
+            mask = selected if mask is None else mask & selected
+        if year_from or year_to:
+            selected = (self.year >= (year_from or 1)) & (self.year <= (year_to or np.iinfo(np.uint16).max))
+            mask = selected if mask is None else mask & selected
+        return mask
+
+    def _count_multi_valued(self, facet, mask):
+        codes = self.codes[facet]
+        if mask is None:
+            # the lengths of the postings are the counts over all the papers
+            return np.diff(self.postings_offsets[facet].astype(np.int64))
+
+        selected = np.flatnonzero(mask)
+        if len(selected) < self.rows // 8:
+            # few papers: gather their entries through the offsets
+            offsets = self.offsets[facet]
+            starts = offsets[selected].astype(np.int64)
+            lengths = offsets[selected + 1].astype(np.int64) - starts
+            entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            selected_codes = codes[entries]
+        else:
+            # many papers: one pass over all the entries
+            selected_codes = codes[mask[self.entry_rows[facet]]]
+        return np.bincount(selected_codes, minlength=len(self.dictionaries[facet]))
+
+    def count(self, by, mask=None, top=20):
+        '''
+        Count the papers by a facet.
+
+        :param by: year, journal, type or mesh.
+        :param mask: The papers to count, from match(), or None for all.
+        :param top: How many of the largest counts to return, all of them for the years.
+        :return: A list of (value, count), by decreasing count, or by year.
+        '''
+        if by not in FACETS:
+            raise ValueError(f"unknown facet: {by}, expected one of {', '.join(FACETS)}")
+
+        if by == "year":
+            years = self.year if mask is None else self.year[mask]
+            counts = np.bincount(years)
+            return [(int(year), int(counts[year])) for year in np.flatnonzero(counts) if year > 0]
+
+        if by == "journal":
+            journals = self.journal if mask is None else self.journal[mask]
+            counts = np.bincount(journals, minlength=len(self.dictionaries["journal"]))
+        else:
+            counts = self._count_multi_valued(by, mask)
+
+        top_codes = np.argsort(counts)[::-1][:top]
+        names = self.dictionaries[by].names
+        return [(names[code], int(counts[code])) for code in top_codes if counts[code] > 0]
+
+    def aggregate(self, by, top=20, **filters):
+        mask = self.match(**filters)
+        return dict(
+            total=self.rows if mask is None else int(mask.sum()),
+            counts=self.count(by, mask, top=top),
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["build", "bench"])
+    parser.add_argument("--index", type=str, default="data/facets")
+    parser.add_argument("--papers", type=str, action="append", default=[],
+                        help="a JSONL file of papers, as returned by create_paper()")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    if args.action == "build":
+        builder = FacetIndexBuilder(args.index)
+        for path in args.papers:
+            builder.add_papers(path)
+        print(f"* built the facet index of {builder.build()} papers in {args.index}")
+    elif args.action == "bench":
+        random.seed(0)
+        mesh_vocabulary = ["Humans", "Female", "Male", "Adult", "Middle Aged", "Aged", "Neoplasms", "Diabetes Mellitus"] \
+            + [f"Term {i}" for i in range(20_000)]
+        types = ["Journal Article", "Randomized Controlled Trial", "Review", "Meta-Analysis", "Case Reports"]
+        journals = [f"Journal {i}" for i in range(5_000)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            started = time.perf_counter()
+            builder = FacetIndexBuilder(tmpdir)
+            for i in range(args.rows):
+                builder.add(dict(
+                    pmid=str(i + 1),
+                    publication_date=f"{random.randint(1990, 2024)}-01-01",
+                    source=random.choice(journals),
+                    type="|".join(random.sample(types, random.randint(1, 2))),
+                    # the common terms are on most papers, like Humans on PubMed
+                    mesh_terms=random.sample(mesh_vocabulary[:8], 4) + random.sample(mesh_vocabulary, 8),
+                ))
+            builder.build()
+            print(f"* built {args.rows} papers in {time.perf_counter() - started:.1f}s")
+
+            index = FacetIndex(tmpdir)
+            queries = [
+                ("year", dict()),
+                ("mesh", dict()),
+                ("year", dict(mesh_terms=["Neoplasms"], publication_types=["Randomized Controlled Trial"])),
+                ("journal", dict(mesh_terms=["Diabetes Mellitus"], year_from=2015)),
+                ("mesh", dict(publication_types=["Meta-Analysis"], year_from=2020)),
+                ("type", dict(mesh_terms=["Term 42"])),
+            ]
+            for by, filters in queries:
+                index.aggregate(by, **filters)
+                started = time.perf_counter()
+                result = index.aggregate(by, **filters)
+                elapsed = time.perf_counter() - started
+                print(f"* by {by} where {filters}: {result['total']} papers in {elapsed * 1000:.1f}ms")
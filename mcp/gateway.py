@@ -0,0 +1,255 @@
+import asyncio
+import importlib
+import logging
+from typing import Any, Sequence
+
+from mcp import ClientSession, McpError
+from mcp.client.sse import sse_client
+from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp.exceptions import ToolError
+from mcp.types import EmbeddedResource, ImageContent, TextContent, Tool as MCPTool
+
+# tool names are exposed as "<backend>__<tool>", e.g., "pubmed__get_paper_abstract"
+# OpenAI tool names only allow [a-zA-Z0-9_-], so we can't use "." or "/"
+NAMESPACE_SEPARATOR = "__"
+
+# the servers in this folder and the ports they listen on by default
+DEFAULT_BACKENDS = {
+    "pubmed": "http://localhost:50002/sse",
+    "clinical_trial": "http://localhost:50001/sse",
+}
+
+
+###########################################################
+# Backends
+###########################################################
+
+class RemoteBackend:
+    '''
+    A backend FastMCP server reached over one persistent SSE connection.
+
+    The connection is opened on first use and then shared by every call
+    routed to this backend, so clients of the gateway never pay the
+    backend handshake again.
+    '''
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self._session = None
+        self._task = None
+        self._stop = None
+        self._lock = asyncio.Lock()
+
+    async def _hold_connection(self, ready: asyncio.Future):
+        # the sse_client and ClientSession contexts have to be entered and exited
+        # in the same task, so a dedicated task keeps them open until close()
+        try:
+            async with sse_client(self.url) as streams:
+                async with ClientSession(*streams) as session:
+                    await session.initialize()
+                    self._session = session
+                    ready.set_result(session)
+                    await self._stop.wait()
+
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logging.error(f"* lost connection to backend {self.name} ({self.url}): {e}")
+
+        finally:
+            self._session = None
+
+    async def session(self) -> ClientSession:
+        '''
+        Get the shared session, connecting (or reconnecting) if needed.
+        '''
+        async with self._lock:
+            if self._session is None:
+                logging.info(f"connecting to backend {self.name} ({self.url})")
+                self._stop = asyncio.Event()
+                ready = asyncio.get_running_loop().create_future()
+                self._task = asyncio.create_task(self._hold_connection(ready))
+                await ready
+
+            return self._session
+
+    async def list_tools(self) -> list[MCPTool]:
+        session = await self.session()
+        result = await session.list_tools()
+        return result.tools
+
+    async def call_tool(
+        self, name: str, arguments: dict[str, Any]
+    ) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
+        try:
+            result = await (await self.session()).call_tool(name, arguments)
+        except McpError:
+            raise
+        except Exception as e:
+            # the connection dropped (e.g., the backend restarted), retry once on a new one
+            logging.warning(f"* call to backend {self.name} failed, reconnecting: {e}")
+            await self.close()
+            result = await (await self.session()).call_tool(name, arguments)
+
+        if result.isError:
+            raise ToolError(" ".join(c.text for c in result.content if isinstance(c, TextContent)))
+
+        return result.content
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+class LocalBackend:
+    '''
+    A backend FastMCP server hosted inside the gateway process.
+
+    The module is imported and its `mcp` server is called directly,
+    so there is no extra network hop or serialization at all.
+    '''
+
+    def __init__(self, name: str, module: str):
+        self.name = name
+        self.module = module
+        self.server = importlib.import_module(module).mcp
+
+    async def list_tools(self) -> list[MCPTool]:
+        return await self.server.list_tools()
+
+    async def call_tool(
+        self, name: str, arguments: dict[str, Any]
+    ) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
+        return await self.server.call_tool(name, arguments)
+
+    async def close(self):
+        pass
+
+
+###########################################################
+# Gateway
+###########################################################
+
+class Gateway(FastMCP):
+    '''
+    A FastMCP server that fronts any number of backend servers.
+
+    The tool lists of all backends are merged under a namespace per backend,
+    and calls are routed to the backend that owns the tool. Tools registered
+    on the gateway itself with @gateway.tool() are listed as-is.
+    '''
+
+    def __init__(self, backends, name: str = "Gateway", **settings: Any):
+        super().__init__(name, **settings)
+        self.backends = {backend.name: backend for backend in backends}
+        self._tools = None
+        self._routes = None
+        self._routes_lock = asyncio.Lock()
+
+    async def _load_routes(self):
+        async with self._routes_lock:
+            if self._routes is not None:
+                return
+
+            backends = list(self.backends.values())
+            results = await asyncio.gather(*[backend.list_tools() for backend in backends])
+
+            tools = []
+            routes = {}
+            for backend, backend_tools in zip(backends, results):
+                for tool in backend_tools:
+                    name = f"{backend.name}{NAMESPACE_SEPARATOR}{tool.name}"
+                    routes[name] = (backend, tool.name)
+                    tools.append(tool.model_copy(update={"name": name}))
+
+            self._tools = tools
+            self._routes = routes
+            logging.info(f"loaded {len(routes)} tools from {len(backends)} backends")
+
+    async def refresh(self):
+        '''
+        Forget the merged tool list, it will be reloaded from the backends on the next request.
+        '''
+        async with self._routes_lock:
+            self._tools = None
+            self._routes = None
+
+    async def list_tools(self) -> list[MCPTool]:
+        await self._load_routes()
+        return self._tools + await super().list_tools()
+
+    async def call_tool(
+        self, name: str, arguments: dict[str, Any]
+    ) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
+        await self._load_routes()
+        if name not in self._routes:
+            return await super().call_tool(name, arguments)
+
+        backend, tool_name = self._routes[name]
+        return await backend.call_tool(tool_name, arguments)
+
+    async def close(self):
+        await asyncio.gather(*[backend.close() for backend in self.backends.values()])
+
+
+def create_gateway(remote=None, local=None, **settings: Any) -> Gateway:
+    '''
+    Create a gateway from backend specs.
+
+    :param remote: A dict of backend name -> SSE URL.
+    :param local: A list of module names in this folder to host in-process.
+    :return: The gateway server.
+    '''
+    backends = []
+    for name, url in (remote or {}).items():
+        backends.append(RemoteBackend(name, url))
+    for module in local or []:
+        backends.append(LocalBackend(module, module))
+
+    return Gateway(backends, **settings)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["run", "test"])
+    parser.add_argument("--port", type=int, default=50000)
+    parser.add_argument("--backend", type=str, action="append", default=[],
+                        help="a remote backend as NAME=URL, e.g., pubmed=http://localhost:50002/sse")
+    parser.add_argument("--local", type=str, action="append", default=[],
+                        help="a server module in this folder to host in-process, e.g., pubmed")
+    parser.add_argument("--in-process", action="store_true",
+                        help="host all the default backends in-process")
+    args = parser.parse_args()
+
+    remote = dict(spec.split("=", 1) for spec in args.backend)
+    local = args.local
+    if args.in_process:
+        local = local + [name for name in DEFAULT_BACKENDS if name not in local]
+    elif not remote and not local:
+        remote = dict(DEFAULT_BACKENDS)
+
+    if args.action == "run":
+        gateway = create_gateway(remote, local)
+        gateway.settings.port = args.port
+        gateway.run(
+            transport="sse",
+        )
+    elif args.action == "test":
+        async def test():
+            gateway = create_gateway(remote, local)
+            for tool in await gateway.list_tools():
+                print(f"- {tool.name}: {tool.description.strip().splitlines()[0]}")
+            print(await gateway.call_tool(
+                "clinical_trial__extract_nct_id",
+                {"text": "This study is registered with ClinicalTrials.gov, NCT02446405."},
+            ))
+            await gateway.close()
+
+        asyncio.run(test())
@@ -0,0 +1,363 @@
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import requests
+
+# A local DOI/PMCID/PMID mapping table for the PubMed server.
+#
+# The table is a folder of flat arrays, one row per paper, sorted by PMID:
+#   pmid.npy, pmcid.npy          uint32, 0 when missing (PMC123 is stored as 123)
+#   doi_offset.npy, doi_length.npy  the DOI of each row in doi.bin
+#   doi_hash.npy                 uint64 hash of the lowercased DOI
+#   by_pmcid.npy, by_doi.npy     the row order that sorts pmcid.npy and doi_hash.npy
+# The arrays are memory-mapped, so every server process shares the same pages and a
+# lookup is a binary search. IDs missing from the table are resolved by NCBI's ID
+# converter API.
+
+IDCONV_ENDPOINT = "https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/"
+# the ID converter takes up to 200 IDs per request
+IDCONV_BATCH_SIZE = 200
+
+DOI_PREFIX = re.compile(r"^(?:doi:\s*|https?://(?:dx\.)?doi\.org/)", re.IGNORECASE)
+PMCID_PATTERN = re.compile(r"^PMC(\d+)$", re.IGNORECASE)
+PMID_PATTERN = re.compile(r"^(?:PMID:?\s*)?(\d+)$", re.IGNORECASE)
+
+
+def doi_hash(doi):
+    return int.from_bytes(hashlib.blake2b(doi.lower().encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def parse_id(identifier):
+    '''
+    Tell a PMID, a PMCID and a DOI apart.
+
+    :return: ("pmid", 123), ("pmcid", 123), ("doi", "10.1/x") or (None, identifier).
+    '''
+    identifier = identifier.strip()
+    if match := PMID_PATTERN.match(identifier):
+        return "pmid", int(match.group(1))
+    if match := PMCID_PATTERN.match(identifier):
+        return "pmcid", int(match.group(1))
+    doi = DOI_PREFIX.sub("", identifier)
+    if doi.startswith("10."):
+        return "doi", doi
+    return None, identifier
+
+
+def make_record(pmid=None, pmcid=None, doi=None):
+    return dict(
+        pmid=str(pmid) if pmid else None,
+        pmcid=f"PMC{pmcid}" if isinstance(pmcid, int) and pmcid else (pmcid or None),
+        doi=doi or None,
+    )
+
+
+class IdIndexBuilder:
+    '''
+    Collects (PMID, PMCID, DOI) rows and writes the mapping table.
+
+    The DOIs are streamed to disk as they come, so memory holds only the fixed-size columns.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._doi_file = open(self.path / "doi.bin", "wb")
+        self._doi_bytes = 0
+        self.pmid = array("I")
+        self.pmcid = array("I")
+        self.doi_offset = array("Q")
+        self.doi_length = array("I")
+        self.doi_hash = array("Q")
+
+    def add(self, pmid=None, pmcid=None, doi=None):
+        if isinstance(pmcid, str):
+            match = PMCID_PATTERN.match(pmcid.strip())
+            pmcid = int(match.group(1)) if match else None
+        pmid = int(pmid) if pmid else 0
+        if not (pmid or pmcid or doi):
+            return
+
+        self.pmid.append(pmid)
+        self.pmcid.append(pmcid or 0)
+        if doi:
+            encoded = DOI_PREFIX.sub("", doi.strip()).encode("utf-8")
+            self.doi_offset.append(self._doi_bytes)
+            self.doi_length.append(len(encoded))
+            self.doi_hash.append(doi_hash(encoded.decode("utf-8")))
+            self._doi_file.write(encoded)
+            self._doi_bytes += len(encoded)
+        else:
+            self.doi_offset.append(0)
+            self.doi_length.append(0)
+            self.doi_hash.append(0)
+
+    def add_pmc_ids(self, path):
+        '''
+        Add the rows of NCBI's PMC-ids.csv(.gz), which maps the PMCIDs to PMIDs and DOIs.
+        '''
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "rt", newline="") as f:
+            for row in csv.DictReader(f):
+                self.add(pmid=row.get("PMID"), pmcid=row.get("PMCID"), doi=row.get("DOI"))
+
+    def add_papers(self, path):
+        '''
+        Add the papers of a JSONL file with the fields of create_paper().
+        '''
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    paper = json.loads(line)
+                    self.add(pmid=paper.get("pmid"), pmcid=paper.get("pmcid"), doi=paper.get("doi"))
+
+    def build(self):
+        '''
+        Sort the rows and write the arrays.
+
+        :return: The number of rows.
+        '''
+        self._doi_file.close()
+        pmid = np.frombuffer(self.pmid, dtype=np.uint32)
+        order = np.argsort(pmid, kind="stable")
+        columns = dict(
+            pmid=pmid[order],
+            pmcid=np.frombuffer(self.pmcid, dtype=np.uint32)[order],
+            doi_offset=np.frombuffer(self.doi_offset, dtype=np.uint64)[order],
+            doi_length=np.frombuffer(self.doi_length, dtype=np.uint32)[order],
+            doi_hash=np.frombuffer(self.doi_hash, dtype=np.uint64)[order],
+        )
+        columns["by_pmcid"] = np.argsort(columns["pmcid"], kind="stable").astype(np.uint32)
+        columns["by_doi"] = np.argsort(columns["doi_hash"], kind="stable").astype(np.uint32)
+        for name, values in columns.items():
+            np.save(self.path / f"{name}.npy", values)
+        with open(self.path / "meta.json", "w") as f:
+            json.dump(dict(rows=len(pmid), doi_bytes=self._doi_bytes), f)
+        return len(pmid)
+
+
+class IdIndex:
+    '''
+    Batch lookups in the mapping table, with the ID converter API as the fallback for misses.
+
+    :param path: The folder of the table, or None to use only the API.
+    :param fallback: Whether to ask the API for the IDs missing from the table.
+    :param max_cached: How many API answers to keep in memory.
+    '''
+
+    def __init__(self, path=None, fallback=True, max_cached=100_000):
+        self.path = Path(path) if path else None
+        self.fallback = fallback
+        self.max_cached = max_cached
+        self.rows = 0
+        if self.path is not None:
+            with open(self.path / "meta.json") as f:
+                self.rows = json.load(f)["rows"]
+            self.columns = {
+                name: np.load(self.path / f"{name}.npy", mmap_mode="r")
+                for name in ("pmid", "pmcid", "doi_offset", "doi_length", "doi_hash", "by_pmcid", "by_doi")
+            }
+            self.doi_blob = np.memmap(self.path / "doi.bin", dtype=np.uint8, mode="r") \
+                if os.path.getsize(self.path / "doi.bin") else np.zeros(0, dtype=np.uint8)
+
+        self._lock = threading.Lock()
+        self._cached = OrderedDict()
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+
+    def _doi_at(self, row):
+        offset = int(self.columns["doi_offset"][row])
+        length = int(self.columns["doi_length"][row])
+        return bytes(self.doi_blob[offset:offset + length]).decode("utf-8") if length else None
+
+    def _record_at(self, row):
+        return make_record(
+            int(self.columns["pmid"][row]),
+            int(self.columns["pmcid"][row]),
+            self._doi_at(row),
+        )
+
+    def _find(self, column, values, sorter=None):
+        '''
+        Binary-search the values in a sorted column.
+
+        :return: The row of each value, or -1.
+        '''
+        values = np.asarray(values, dtype=self.columns[column].dtype)
+        data = self.columns[column]
+        positions = np.searchsorted(data, values, sorter=sorter)
+        positions = np.minimum(positions, max(self.rows - 1, 0))
+        rows = sorter[positions] if sorter is not None else positions
+        found = (data[rows] == values) & (values != 0) if self.rows else np.zeros(len(values), dtype=bool)
+        return np.where(found, rows, -1)
+
+    def _lookup_local(self, parsed):
+        results = {}
+        if self.path is None or not self.rows:
+            return results
+
+        for kind in ("pmid", "pmcid"):
+            keys = [(identifier, value) for identifier, (k, value) in parsed.items() if k == kind]
+            if not keys:
+                continue
+            sorter = np.asarray(self.columns["by_pmcid"]) if kind == "pmcid" else None
+            rows = self._find(kind, [value for _, value in keys], sorter=sorter)
+            for (identifier, _), row in zip(keys, rows):
+                if row >= 0:
+                    results[identifier] = self._record_at(int(row))
+
+        keys = [(identifier, value) for identifier, (k, value) in parsed.items() if k == "doi"]
+        if keys:
+            by_doi = self.columns["by_doi"]
+            hashes = np.asarray([doi_hash(value) for _, value in keys], dtype=np.uint64)
+            starts = np.searchsorted(self.columns["doi_hash"], hashes, sorter=by_doi)
+            for (identifier, doi), h, start in zip(keys, hashes, starts):
+                # a hash collision is checked against the DOI itself
+                position = int(start)
+                while position < self.rows and self.columns["doi_hash"][by_doi[position]] == h:
+                    row = int(by_doi[position])
+                    if (self._doi_at(row) or "").lower() == doi.lower():
+                        results[identifier] = self._record_at(row)
+                        break
+                    position += 1
+        return results
+
+    def _lookup_remote(self, identifiers):
+        '''
+        Ask NCBI's ID converter for the IDs, in batches.
+        '''
+        results = {}
+        for i in range(0, len(identifiers), IDCONV_BATCH_SIZE):
+            batch = identifiers[i:i + IDCONV_BATCH_SIZE]
+            try:
+                response = requests.get(
+                    IDCONV_ENDPOINT,
+                    params=dict(ids=",".join(batch), format="json", tool="mcp-quick-start"),
+                    timeout=30,
+                )
+                response.raise_for_status()
+                records = response.json().get("records", [])
+            except Exception as e:
+                logging.error(f"* error resolving {len(batch)} IDs with the ID converter: {e}")
+                continue
+
+            for record in records:
+                if record.get("status") == "error":
+                    continue
+                requested = record.get("requested-id")
+                results[requested] = make_record(record.get("pmid"), record.get("pmcid"), record.get("doi"))
+        return results
+
+    def resolve(self, identifiers):
+        '''
+        Map each PMID, PMCID or DOI to all three.
+
+        :return: A dict of each identifier to {"pmid", "pmcid", "doi"}, or None if unknown.
+        '''
+        parsed = {identifier: parse_id(identifier) for identifier in identifiers}
+        results = self._lookup_local({i: p for i, p in parsed.items() if p[0] is not None})
+        self.local_hits += len(results)
+
+        missing = [identifier for identifier, (kind, _) in parsed.items()
+                   if kind is not None and identifier not in results]
+        with self._lock:
+            for identifier in list(missing):
+                if identifier in self._cached:
+                    self._cached.move_to_end(identifier)
+                    results[identifier] = self._cached[identifier]
+                    missing.remove(identifier)
+                    self.remote_hits += 1
+
+        if missing and self.fallback:
+            # the converter wants bare IDs: 123, PMC123, 10.1/x
+            requested = {}
+            for identifier in missing:
+                kind, value = parsed[identifier]
+                requested[f"PMC{value}" if kind == "pmcid" else str(value)] = identifier
+            remote = self._lookup_remote(list(requested))
+            with self._lock:
+                for requested_id, record in remote.items():
+                    if (identifier := requested.get(requested_id)) is None:
+                        continue
+                    results[identifier] = record
+                    self._cached[identifier] = record
+                    self.remote_hits += 1
+                while len(self._cached) > self.max_cached:
+                    self._cached.popitem(last=False)
+
+        self.misses += sum(1 for identifier in identifiers if identifier not in results)
+        return {identifier: results.get(identifier) for identifier in identifiers}
+
+    def stats(self):
+        return dict(
+            rows=self.rows,
+            local_hits=self.local_hits,
+            remote_hits=self.remote_hits,
+            misses=self.misses,
+            cached=len(self._cached),
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["build", "lookup", "bench"])
+    parser.add_argument("--index", type=str, default="data/id_index", help="the folder of the table")
+    parser.add_argument("--pmc-ids", type=str, action="append", default=[],
+                        help="NCBI's PMC-ids.csv.gz, from https://ftp.ncbi.nlm.nih.gov/pub/pmc/")
+    parser.add_argument("--papers", type=str, action="append", default=[],
+                        help="a JSONL file of papers with pmid, pmcid and doi")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("ids", type=str, nargs="*")
+    args = parser.parse_args()
+
+    if args.action == "build":
+        builder = IdIndexBuilder(args.index)
+        for path in args.pmc_ids:
+            builder.add_pmc_ids(path)
+        for path in args.papers:
+            builder.add_papers(path)
+        print(f"* built the table of {builder.build()} rows in {args.index}")
+    elif args.action == "lookup":
+        index = IdIndex(args.index if os.path.exists(args.index) else None)
+        print(json.dumps(index.resolve(args.ids), indent=2))
+    elif args.action == "bench":
+        with tempfile.TemporaryDirectory() as tmpdir:
+            started = time.perf_counter()
+            builder = IdIndexBuilder(tmpdir)
+            for i in range(args.rows):
+                pmid = 10_000_000 + i * 3
+                builder.add(pmid=pmid, pmcid=f"PMC{5_000_000 + i}" if i % 2 else None, doi=f"10.1000/j.{pmid}")
+            builder.build()
+            print(f"* built {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+            index = IdIndex(tmpdir, fallback=False)
+            ids = []
+            for _ in range(10_000):
+                i = random.randrange(args.rows)
+                ids.append(random.choice([
+                    str(10_000_000 + i * 3),
+                    f"PMC{5_000_000 + i}",
+                    f"10.1000/J.{10_000_000 + i * 3}",
+                ]))
+            started = time.perf_counter()
+            results = index.resolve(ids)
+            elapsed = time.perf_counter() - started
+            found = sum(1 for record in results.values() if record is not None)
+            print(f"* resolved {len(ids)} IDs ({found} found) in {elapsed * 1000:.0f}ms, "
+                  f"{len(ids) / elapsed:,.0f} lookups/s")
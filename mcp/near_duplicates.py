@@ -0,0 +1,362 @@
+import json
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Near-duplicate detection over the titles and abstracts of the papers, with MinHash and
+# locality-sensitive hashing (LSH).
+#
+# Errata, duplicate publications and preprint/journal pairs carry (nearly) the same text.
+# Each paper gets a MinHash signature of the word 3-grams of its title and abstract, whose
+# share of equal values estimates the Jaccard similarity of two papers. The signatures are
+# cut in bands, and papers that share a whole band are candidates: a lookup is a few
+# binary searches in the sorted band hashes, so it stays sublinear in the corpus size, and
+# only the candidates are compared. A text of fewer than SHINGLE_SIZE words, e.g., a paper
+# without an abstract titled "Correction.", has no shingles: it is neither indexed nor
+# matched, otherwise all the papers with the same short title, or none, would match.
+#
+# The index is a folder:
+#   pmids.npy         the PMIDs, sorted
+#   signatures.npy    the signature of each paper, uint32 (papers x permutations)
+#   band_hashes.npy   the hashes of the bands of each paper, sorted per band (bands x papers)
+#   band_rows.npy     the paper of each sorted band hash (bands x papers)
+#   meta.json         the parameters
+
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 16
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.8
+SEED = 42
+
+WORD = re.compile(r"\w+")
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def permutations(num_permutations=NUM_PERMUTATIONS, seed=SEED):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+    return a, b
+
+
+PERMUTATIONS = permutations()
+# the multipliers that fold the rows of a band into one hash
+BAND_MULTIPLIERS = np.random.default_rng(SEED + 1).integers(
+    1, np.iinfo(np.int64).max, size=NUM_PERMUTATIONS // NUM_BANDS, dtype=np.uint64
+) | np.uint64(1)
+
+
+def paper_text(paper):
+    return f"{paper.get('title') or ''} {paper.get('abstract') or ''}"
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    '''
+    Hash the word n-grams of a text.
+
+    :return: The unique 32-bit hashes of the n-grams, none for a text shorter than n words.
+    '''
+    words = np.array([zlib.crc32(word.encode()) for word in WORD.findall(text.lower())], dtype=np.uint64)
+    if len(words) < size:
+        return np.zeros(0, dtype=np.uint64)
+    # combine the hashes of the n consecutive words, wrapping on overflow
+    hashes = np.zeros(len(words) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * np.uint64(1_000_003) + words[offset:len(words) - size + 1 + offset]
+    return np.unique(hashes & MAX_HASH)
+
+
+def signature(text, permutations=PERMUTATIONS):
+    '''
+    The MinHash signature of a text: for each permutation, the smallest hash of its shingles.
+
+    :return: The signature, or None if the text is too short to compare.
+    '''
+    a, b = permutations
+    hashes = shingles(text)
+    if not len(hashes):
+        return None
+    # (a * x + b) mod 2^61 - 1, with x < 2^32 and the overflow wrapping, is a good enough permutation
+    permuted = (np.outer(a, hashes) + b[:, None]) % np.uint64(MERSENNE_PRIME)
+    return (permuted.min(axis=1) & MAX_HASH).astype(np.uint32)
+
+
+def signatures(pmids, texts):
+    '''
+    :return: The PMIDs of the texts long enough to compare, and their signatures.
+    '''
+    sigs = [(pmid, sig) for pmid, text in zip(pmids, texts) if (sig := signature(text)) is not None]
+    if not sigs:
+        return [], np.zeros((0, NUM_PERMUTATIONS), dtype=np.uint32)
+    return [pmid for pmid, _ in sigs], np.stack([sig for _, sig in sigs])
+
+
+def band_hashes(signatures, num_bands=NUM_BANDS):
+    '''
+    Hash each band of the signatures.
+
+    :return: A uint64 array of papers x bands.
+    '''
+    rows = signatures.shape[1] // num_bands
+    bands = signatures[:, :num_bands * rows].reshape(len(signatures), num_bands, rows).astype(np.uint64)
+    return (bands * BAND_MULTIPLIERS[:rows]).sum(axis=2)
+
+
+def _signatures_of_chunk(chunk):
+    return signatures(*chunk)
+
+
+def chunks_of_papers(papers, chunk_size):
+    pmids, texts = [], []
+    for paper in papers:
+        pmids.append(int(paper["pmid"]))
+        texts.append(paper_text(paper))
+        if len(pmids) >= chunk_size:
+            yield pmids, texts
+            pmids, texts = [], []
+    if pmids:
+        yield pmids, texts
+
+
+def build(path, papers, workers=1, chunk_size=1_000):
+    '''
+    Build the index of papers, as returned by create_paper(), the signatures computed in
+    parallel by `workers` processes. The papers too short to compare are left out.
+
+    :return: The number of papers indexed.
+    '''
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    all_pmids, all_signatures = [], []
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for pmids, chunk_signatures in pool.map(_signatures_of_chunk, chunks_of_papers(papers, chunk_size)):
+                all_pmids.extend(pmids)
+                all_signatures.append(chunk_signatures)
+    else:
+        for pmids, texts in chunks_of_papers(papers, chunk_size):
+            pmids, chunk_signatures = signatures(pmids, texts)
+            all_pmids.extend(pmids)
+            all_signatures.append(chunk_signatures)
+
+    pmids = np.array(all_pmids, dtype=np.uint32)
+    sigs = np.concatenate(all_signatures) if all_signatures else np.zeros((0, NUM_PERMUTATIONS), dtype=np.uint32)
+    # the last version of a paper wins
+    _, last = np.unique(pmids[::-1], return_index=True)
+    rows = len(pmids) - 1 - last
+    pmids, sigs = pmids[rows], sigs[rows]
+
+    bands = band_hashes(sigs).T
+    order = np.argsort(bands, axis=1, kind="stable")
+    np.save(path / "pmids.npy", pmids)
+    np.save(path / "signatures.npy", sigs)
+    np.save(path / "band_hashes.npy", np.take_along_axis(bands, order, axis=1))
+    np.save(path / "band_rows.npy", order.astype(np.uint32))
+    with open(path / "meta.json", "w") as f:
+        json.dump(dict(
+            papers=len(pmids),
+            permutations=NUM_PERMUTATIONS,
+            bands=NUM_BANDS,
+            shingle_size=SHINGLE_SIZE,
+            seed=SEED,
+        ), f)
+    return len(pmids)
+
+
+class NearDuplicateIndex:
+    '''
+    Finds the papers whose title and abstract are nearly the same as a paper's.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+        def load(name):
+            return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+        self.pmids = load("pmids")
+        self.signatures = load("signatures")
+        self.band_hashes = load("band_hashes")
+        self.band_rows = load("band_rows")
+
+    def __len__(self):
+        return len(self.pmids)
+
+    def row(self, pmid):
+        position = np.searchsorted(self.pmids, int(pmid))
+        if position < len(self.pmids) and self.pmids[position] == int(pmid):
+            return int(position)
+        return None
+
+    def signature_of(self, pmid):
+        return None if (row := self.row(pmid)) is None else np.asarray(self.signatures[row])
+
+    def candidates(self, sig):
+        '''
+        :return: The rows of the papers that share at least one band with a signature.
+        '''
+        rows = []
+        for band, band_hash in enumerate(band_hashes(sig[None, :])[0]):
+            hashes = self.band_hashes[band]
+            start = np.searchsorted(hashes, band_hash, side="left")
+            end = np.searchsorted(hashes, band_hash, side="right")
+            if end > start:
+                rows.append(self.band_rows[band][start:end])
+        return np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.uint32)
+
+    def query(self, sig, threshold=DEFAULT_THRESHOLD, exclude=None):
+        '''
+        :return: The (pmid, similarity) of the papers with an estimated Jaccard similarity
+            of at least `threshold` to a signature, by decreasing similarity. Nothing when
+            the signature is None, that of a text too short to compare.
+        '''
+        if sig is None:
+            return []
+        rows = self.candidates(sig)
+        if not len(rows):
+            return []
+        similarities = (np.asarray(self.signatures[rows]) == sig).mean(axis=1)
+        keep = similarities >= threshold
+        matches = [
+            (str(self.pmids[row]), round(float(similarity), 3))
+            for row, similarity in zip(rows[keep], similarities[keep])
+            if exclude is None or int(self.pmids[row]) != int(exclude)
+        ]
+        return sorted(matches, key=lambda match: -match[1])
+
+    def find(self, pmid, threshold=DEFAULT_THRESHOLD):
+        '''
+        :return: The near duplicates of a paper of the index, or None if it is not in the index.
+        '''
+        if (sig := self.signature_of(pmid)) is None:
+            return None
+        return self.query(sig, threshold=threshold, exclude=pmid)
+
+    def collapse(self, pmids, threshold=DEFAULT_THRESHOLD):
+        '''
+        Group a list of papers by near duplicates.
+
+        :return: The PMIDs to keep, in order, the first of each group, and a dict of the
+            others to the PMID they duplicate. PMIDs not in the index are kept.
+        '''
+        keep = []
+        duplicate_of = {}
+        kept_rows = {}
+        for pmid in pmids:
+            if pmid in duplicate_of or pmid in kept_rows:
+                continue
+            if (sig := self.signature_of(pmid)) is None:
+                keep.append(pmid)
+                continue
+            matches = {match for match, _ in self.query(sig, threshold=threshold, exclude=pmid)}
+            kept = next((other for other in kept_rows if other in matches), None)
+            if kept is None:
+                keep.append(pmid)
+                kept_rows[pmid] = True
+            else:
+                duplicate_of[pmid] = kept
+        return keep, duplicate_of
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["build", "find", "test", "bench"])
+    parser.add_argument("--index", type=str, default="data/near_duplicates")
+    parser.add_argument("--papers", type=str, action="append", default=[],
+                        help="a PubMed XML file or a JSONL file of papers")
+    parser.add_argument("--library", type=str, default=None, help="a paper library, built with paper_library.py")
+    parser.add_argument("--pmid", type=str, action="append", default=[])
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--rows", type=int, action="append", default=[])
+    args = parser.parse_args()
+
+    if args.action == "build":
+        if args.library:
+            from paper_library import PaperLibrary
+            papers = PaperLibrary(args.library).iter_live_papers()
+        else:
+            from pubmed_files import iter_papers
+            papers = (paper for path in args.papers for paper in iter_papers(path))
+        started = time.perf_counter()
+        count = build(args.index, papers, workers=args.workers)
+        print(f"* indexed {count} papers in {time.perf_counter() - started:.1f}s")
+    elif args.action == "find":
+        index = NearDuplicateIndex(args.index)
+        for pmid in args.pmid:
+            print(f"* {pmid}: {index.find(pmid, threshold=args.threshold)}")
+    elif args.action == "test":
+        # the papers without a title and abstract, or with the same short title, are distinct
+        papers = [
+            dict(pmid="1", title="", abstract=""),
+            dict(pmid="2", title=None, abstract=None),
+            dict(pmid="3", title="Correction.", abstract=""),
+            dict(pmid="4", title="Correction.", abstract=""),
+            dict(pmid="5", title="Erratum in the results", abstract=""),
+            dict(pmid="6", title="A trial of aspirin after a stroke", abstract="The risk of a second stroke fell."),
+            dict(pmid="7", title="A trial of aspirin after a stroke", abstract="The risk of a second stroke fell."),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            assert build(tmpdir, papers) == 3
+            index = NearDuplicateIndex(tmpdir)
+            keep, duplicate_of = index.collapse([paper["pmid"] for paper in papers])
+            assert keep == ["1", "2", "3", "4", "5", "6"] and duplicate_of == {"7": "6"}, (keep, duplicate_of)
+            assert index.find("3") is None and index.query(signature("Correction.")) == []
+            print(f"* kept {keep}, duplicates {duplicate_of}")
+    elif args.action == "bench":
+        rng = random.Random(0)
+        words = [f"word{i}" for i in range(20_000)]
+
+        def make_papers(rows):
+            # one paper in 50 has a near duplicate: a few words of the abstract changed
+            papers, pairs = [], []
+            for i in range(rows):
+                pmid = i + 1
+                if i % 50 == 49:
+                    original = papers[-1]
+                    abstract = original["abstract"].split()
+                    for position in rng.sample(range(len(abstract)), 5):
+                        abstract[position] = rng.choice(words)
+                    papers.append(dict(pmid=str(pmid), title=original["title"], abstract=" ".join(abstract)))
+                    pairs.append((original["pmid"], str(pmid)))
+                else:
+                    papers.append(dict(
+                        pmid=str(pmid),
+                        title=" ".join(rng.choices(words, k=12)),
+                        abstract=" ".join(rng.choices(words, k=200)),
+                    ))
+            return papers, pairs
+
+        for rows in args.rows or [10_000, 100_000]:
+            papers, pairs = make_papers(rows)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                started = time.perf_counter()
+                build(tmpdir, papers, workers=args.workers)
+                build_seconds = time.perf_counter() - started
+                index = NearDuplicateIndex(tmpdir)
+
+                started = time.perf_counter()
+                found = sum(1 for original, duplicate in pairs
+                            if duplicate in {pmid for pmid, _ in index.find(original, threshold=args.threshold)})
+                lookup_seconds = (time.perf_counter() - started) / len(pairs)
+                false_positives = sum(len(index.find(str(pmid), threshold=args.threshold)) for pmid in range(1, 1001, 50))
+
+                # the brute force a lookup replaces: comparing with every signature
+                sig = index.signature_of(pairs[0][0])
+                started = time.perf_counter()
+                (np.asarray(index.signatures) == sig).mean(axis=1)
+                brute_seconds = time.perf_counter() - started
+
+                print(f"* {rows} papers: built in {build_seconds:.1f}s with {args.workers} workers, "
+                      f"recall {found / len(pairs):.1%} of {len(pairs)} near duplicates, "
+                      f"lookup {lookup_seconds * 1000:.2f}ms (brute force {brute_seconds * 1000:.1f}ms), "
+                      f"{false_positives} matches for 20 papers without duplicates")
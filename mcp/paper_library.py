@@ -0,0 +1,518 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from authors import AuthorIndex, AuthorIndexBuilder
+from facets import FacetIndex, FacetIndexBuilder
+from paper_store import PaperStore, PaperStoreWriter
+from pubmed_files import iter_records
+
+# A local copy of PubMed kept up to date with NCBI's daily update files.
+#
+# The library is a folder of segments and a manifest. Each segment is the batch of one
+# file: a paper store of the papers it added or revised, their facet index, and the PMIDs
+# it deleted. A paper is looked up from the newest segment to the oldest, so a revision
+# shadows the older versions and a deletion hides them:
+#   manifest.json     the live segments, oldest first, and the files applied so far
+#   segment-000001/   papers/ (paper_store.py), facets/ (facets.py), authors/ (authors.py), deleted.npy
+#
+# Applying a file writes a new segment and then replaces the manifest, so a file is applied
+# entirely or not at all, and the servers that have the library open pick it up on their
+# next lookup. Within a file and against the library the newest revision (DateRevised) of
+# a paper wins. `compact` merges the segments into one, e.g., after loading the baseline.
+# Past `max_segments`, applying a file also merges the newest segments, those no bigger
+# than the ones after them, so the daily updates do not pile up and the segments grow
+# geometrically: each paper is rewritten a few times, not on every update.
+#
+#   python mcp/paper_library.py apply --library data/pubmed --source https://ftp.ncbi.nlm.nih.gov/pubmed/updatefiles/
+#   PUBMED_LIBRARY=data/pubmed python mcp/pubmed.py run
+
+UPDATE_FILES_URL = "https://ftp.ncbi.nlm.nih.gov/pubmed/updatefiles/"
+FILE_PATTERN = re.compile(r"pubmed\d+n\d+\.xml(?:\.gz)?")
+
+# how often the servers look for a new manifest
+REFRESH_SECONDS = 1.0
+DEFAULT_MAX_SEGMENTS = 16
+
+_DELETED = object()
+
+
+class Segment:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.store = PaperStore(self.path / "papers")
+        self.facets = FacetIndex(self.path / "facets")
+        # segments written before the author index have none until they are compacted
+        self.authors = AuthorIndex(self.path / "authors") if (self.path / "authors").exists() else None
+        self.deleted = np.load(self.path / "deleted.npy", mmap_mode="r")
+
+    def is_deleted(self, pmid):
+        position = np.searchsorted(self.deleted, pmid)
+        return position < len(self.deleted) and self.deleted[position] == pmid
+
+    def pmids(self):
+        '''
+        :return: The sorted PMIDs this segment adds, revises or deletes.
+        '''
+        return np.union1d(self.store.pmids(), self.deleted)
+
+    def __len__(self):
+        return self.facets.rows + len(self.deleted)
+
+
+def write_segment(path, papers, deleted, compression=None):
+    '''
+    Write a segment under a temporary name and move it into place.
+
+    :return: The number of papers in the segment.
+    '''
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    facets = FacetIndexBuilder(tmp_path / "facets")
+    authors = AuthorIndexBuilder(tmp_path / "authors")
+    with PaperStoreWriter(tmp_path / "papers", compression=compression) as store:
+        for paper in papers:
+            store.add(paper)
+            facets.add(paper)
+            authors.add_paper(paper)
+    facets.build()
+    authors.build()
+    np.save(tmp_path / "deleted.npy", np.unique(np.array(list(deleted), dtype=np.uint32)))
+    os.rename(tmp_path, path)
+    return len(facets.pmid)
+
+
+class PaperLibrary:
+    '''
+    Reads papers by PMID and faceted counts from a library. Safe to share between
+    threads; the library is reloaded when another process applies a file.
+    '''
+
+    def __init__(self, path, refresh_seconds=REFRESH_SECONDS, max_segments=DEFAULT_MAX_SEGMENTS):
+        '''
+        :param path: The library folder.
+        :param refresh_seconds: How often to look for a new manifest.
+        :param max_segments: How many segments applying a file may leave before it merges the newest ones.
+        '''
+        self.path = Path(path)
+        self.refresh_seconds = refresh_seconds
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._checked_at = 0.0
+        self._load()
+
+    @property
+    def manifest_path(self):
+        return self.path / "manifest.json"
+
+    def read_manifest(self):
+        if not self.manifest_path.exists():
+            return dict(version=0, segments=[], applied_files=[])
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _load(self):
+        mtime = self.manifest_path.stat().st_mtime_ns if self.manifest_path.exists() else None
+        manifest = self.read_manifest()
+        segments = [Segment(self.path / name) for name in manifest["segments"]]
+        with self._lock:
+            self.manifest = manifest
+            self.segments = segments
+            self._live = None
+            self._shadowed = None
+            self._manifest_mtime = mtime
+
+    def refresh(self):
+        '''
+        Reload the library if the manifest changed, at most once every refresh_seconds.
+        '''
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_seconds:
+            return
+        self._checked_at = now
+        mtime = self.manifest_path.stat().st_mtime_ns if self.manifest_path.exists() else None
+        if mtime != self._manifest_mtime:
+            self._load()
+            logging.info(f"* reloaded the paper library at version {self.manifest['version']}")
+
+    def __len__(self):
+        return sum(int(live.sum()) if live is not None else segment.facets.rows
+                   for segment, live in zip(self.segments, self.live_masks()))
+
+    def get(self, pmid):
+        '''
+        :return: The newest version of a paper, or None if it is not in the library or deleted.
+        '''
+        self.refresh()
+        try:
+            pmid = int(pmid)
+        except (TypeError, ValueError):
+            return None
+        for segment in reversed(self.segments):
+            if (paper := segment.store.get(pmid)) is not None:
+                return paper
+            if segment.is_deleted(pmid):
+                return None
+        return None
+
+    def shadowed_pmids(self):
+        '''
+        :return: For each segment, the sorted PMIDs revised or deleted by a newer segment.
+        '''
+        with self._lock:
+            if self._shadowed is not None:
+                return self._shadowed
+            segments = self.segments
+        shadowed = []
+        newer = np.zeros(0, dtype=np.uint32)
+        for segment in reversed(segments):
+            shadowed.append(newer)
+            newer = np.union1d(newer, segment.pmids())
+        shadowed.reverse()
+        with self._lock:
+            if segments is self.segments:
+                self._shadowed = shadowed
+        return shadowed
+
+    def live_masks(self):
+        '''
+        :return: For each segment, the mask of its facet rows that are not revised or
+            deleted by a newer segment, or None when they all are live.
+        '''
+        with self._lock:
+            if self._live is not None:
+                return self._live
+            segments = self.segments
+        live = [
+            ~np.isin(np.asarray(segment.facets.pmid), newer) if len(newer) else None
+            for segment, newer in zip(segments, self.shadowed_pmids())
+        ]
+        with self._lock:
+            if segments is self.segments:
+                self._live = live
+        return live
+
+    def aggregate(self, by, top=20, **filters):
+        '''
+        Count the live papers by a facet, like FacetIndex.aggregate(), across the segments.
+        '''
+        self.refresh()
+        total = 0
+        counts = Counter()
+        for segment, live in zip(self.segments, self.live_masks()):
+            mask = segment.facets.match(**filters)
+            if live is not None:
+                mask = live if mask is None else mask & live
+            total += segment.facets.rows if mask is None else int(mask.sum())
+            for value, count in segment.facets.count(by, mask, top=None):
+                counts[value] += count
+
+        if by == "year":
+            return dict(total=total, counts=sorted(counts.items()))
+        return dict(total=total, counts=counts.most_common(top))
+
+    def _author_papers(self, name, prefix=False):
+        for segment, newer in zip(self.segments, self.shadowed_pmids()):
+            if segment.authors is None:
+                continue
+            pmids = segment.authors.papers_by_author(name, prefix=prefix)
+            yield segment, pmids[~np.isin(pmids, newer)] if len(newer) else pmids
+
+    def papers_by_author(self, name, prefix=False):
+        '''
+        The live papers of an author, like AuthorIndex.papers_by_author(), across the segments.
+        '''
+        self.refresh()
+        papers = [pmids for _, pmids in self._author_papers(name, prefix=prefix)]
+        return np.unique(np.concatenate(papers)) if papers else np.zeros(0, dtype=np.uint32)
+
+    def coauthors(self, name, top=20):
+        '''
+        The co-authors of an author on the live papers, like AuthorIndex.coauthors().
+        '''
+        self.refresh()
+        counts = Counter()
+        for segment, pmids in self._author_papers(name):
+            counts.update(segment.authors.coauthor_counts(name, pmids=pmids))
+        return counts.most_common(top)
+
+    def iter_live_papers(self, start=0):
+        for segment, live in list(zip(self.segments, self.live_masks()))[start:]:
+            pmids = np.asarray(segment.facets.pmid)
+            for pmid in pmids if live is None else pmids[live]:
+                yield segment.store.get(int(pmid))
+
+    ###########################################################
+    # Updates
+    ###########################################################
+
+    def _next_segment_name(self):
+        return f"segment-{self.manifest['version'] + 1:06d}"
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path.with_name("manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self._load()
+
+    def _remove_orphans(self):
+        # the segments of an interrupted apply or compaction
+        live = set(self.manifest["segments"])
+        for child in self.path.glob("segment-*"):
+            if child.name not in live:
+                shutil.rmtree(child, ignore_errors=True)
+
+    def apply_file(self, path, compression=None):
+        '''
+        Apply a baseline or update file as one new segment.
+
+        :return: A dict with the number of papers upserted, skipped as older than the
+            library's version, and deleted, or None if the file was already applied.
+        '''
+        name = Path(path).name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load()
+        if name in self.manifest["applied_files"]:
+            return None
+        self._remove_orphans()
+
+        # the last word of the file on each PMID: its newest revision, or its deletion
+        latest = {}
+        for kind, value in iter_records(path):
+            if kind == "delete":
+                latest[value] = _DELETED
+                continue
+            current = latest.get(value["pmid"])
+            if current is None or current is _DELETED or \
+                    (value.get("date_revised") or "") >= (current.get("date_revised") or ""):
+                latest[value["pmid"]] = value
+
+        papers = []
+        deleted = []
+        skipped = 0
+        for pmid, paper in latest.items():
+            if paper is _DELETED:
+                deleted.append(int(pmid))
+                continue
+            existing = self.get(pmid)
+            if existing is not None and (existing.get("date_revised") or "") > (paper.get("date_revised") or ""):
+                skipped += 1
+                continue
+            papers.append(paper)
+
+        segment = self._next_segment_name()
+        write_segment(self.path / segment, papers, deleted, compression=compression)
+        self._write_manifest(dict(
+            version=self.manifest["version"] + 1,
+            segments=self.manifest["segments"] + [segment],
+            applied_files=self.manifest["applied_files"] + [name],
+            last_applied=name,
+            applied_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        ))
+        if len(self.segments) > self.max_segments:
+            self.compact(compression=compression, start=self._merge_start())
+        return dict(upserted=len(papers), skipped=skipped, deleted=len(deleted))
+
+    def _merge_start(self):
+        # the newest segments, extended to an older one while it is no bigger than them, at least two
+        sizes = [len(segment) for segment in self.segments]
+        start, total = len(sizes) - 1, sizes[-1]
+        while start > 0 and sizes[start - 1] <= total:
+            start -= 1
+            total += sizes[start]
+        return min(start, len(sizes) - 2)
+
+    def compact(self, compression=None, start=0):
+        '''
+        Merge the live papers of the segments into one segment.
+
+        :param start: The first segment to merge, the segments before it are kept, so the
+            deletions of the merged segments are kept too.
+        :return: The number of papers.
+        '''
+        self._load()
+        self._remove_orphans()
+        old_segments = self.manifest["segments"][start:]
+        deleted = np.unique(np.concatenate([segment.deleted for segment in self.segments[start:]])) \
+            if start > 0 else []
+        segment = self._next_segment_name()
+        papers = write_segment(self.path / segment, self.iter_live_papers(start), deleted, compression=compression)
+        self._write_manifest(dict(self.manifest, version=self.manifest["version"] + 1,
+                                  segments=self.manifest["segments"][:start] + [segment]))
+        for name in old_segments:
+            shutil.rmtree(self.path / name, ignore_errors=True)
+        return papers
+
+
+###########################################################
+# Update files
+###########################################################
+
+def list_files(source):
+    '''
+    List the PubMed files of a local folder or of an NCBI folder URL, in the order they
+    must be applied.
+    '''
+    if source.startswith(("http://", "https://")):
+        response = requests.get(source)
+        response.raise_for_status()
+        names = set(FILE_PATTERN.findall(response.text))
+    else:
+        names = {path.name for path in Path(source).iterdir() if FILE_PATTERN.fullmatch(path.name)}
+    return sorted(names)
+
+
+def download(source, name, download_dir):
+    '''
+    Download a file from NCBI, checked against its .md5.
+
+    :return: The local path.
+    '''
+    download_dir = Path(download_dir)
+    download_dir.mkdir(parents=True, exist_ok=True)
+    path = download_dir / name
+    if path.exists():
+        return path
+
+    url = source.rstrip("/") + "/" + name
+    expected = requests.get(url + ".md5").text.strip().split()[-1] if name.endswith(".gz") else None
+    md5 = hashlib.md5()
+    tmp_path = path.with_name(name + ".tmp")
+    with requests.get(url, stream=True) as response, open(tmp_path, "wb") as f:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            md5.update(chunk)
+            f.write(chunk)
+    if expected is not None and md5.hexdigest() != expected:
+        tmp_path.unlink()
+        raise ValueError(f"the MD5 of {name} is {md5.hexdigest()}, expected {expected}")
+    os.replace(tmp_path, path)
+    return path
+
+
+def apply_new_files(library, source, download_dir=None, compression=None):
+    '''
+    Apply the files of a source that the library has not applied yet, in order.
+
+    :return: The names of the files applied.
+    '''
+    manifest = library.read_manifest()
+    applied = set(manifest["applied_files"])
+    last_applied = manifest.get("last_applied") or ""
+    is_remote = source.startswith(("http://", "https://"))
+
+    names = [name for name in list_files(source) if name not in applied and name > last_applied]
+    for name in names:
+        started = time.perf_counter()
+        path = download(source, name, download_dir or library.path / "downloads") if is_remote else Path(source) / name
+        result = library.apply_file(path, compression=compression)
+        print(f"* applied {name} in {time.perf_counter() - started:.1f}s: {result}")
+        if is_remote:
+            path.unlink()
+    return names
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["apply", "compact", "status", "bench"])
+    parser.add_argument("--library", type=str, default="data/pubmed")
+    parser.add_argument("--source", type=str, default=UPDATE_FILES_URL,
+                        help="a folder or an NCBI URL of baseline or update files")
+    parser.add_argument("--file", type=str, action="append", default=[], help="apply these files only")
+    parser.add_argument("--download-dir", type=str, default=None)
+    parser.add_argument("--compression", type=str, default=None, choices=["zstd"])
+    parser.add_argument("--max-segments", type=int, default=DEFAULT_MAX_SEGMENTS,
+                        help="merge the newest segments when applying a file leaves more")
+    parser.add_argument("--rows", type=int, default=5_000)
+    args = parser.parse_args()
+
+    if args.action == "apply":
+        library = PaperLibrary(args.library, max_segments=args.max_segments)
+        if args.file:
+            for path in args.file:
+                print(f"* applied {path}: {library.apply_file(path, compression=args.compression)}")
+        else:
+            names = apply_new_files(library, args.source, download_dir=args.download_dir, compression=args.compression)
+            print(f"* applied {len(names)} new files, the library is at {library.manifest.get('last_applied')}")
+    elif args.action == "compact":
+        print(f"* compacted {PaperLibrary(args.library).compact(compression=args.compression)} papers")
+    elif args.action == "status":
+        library = PaperLibrary(args.library)
+        manifest = library.manifest
+        print(f"* version {manifest['version']}, {len(manifest['segments'])} segments, {len(library)} papers, "
+              f"last applied {manifest.get('last_applied')} at {manifest.get('applied_at')}")
+    elif args.action == "bench":
+        from pubmed_files import write_synthetic_file
+
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / "files"
+            source.mkdir()
+            baseline = range(1, args.rows + 1)
+            write_synthetic_file(source / "pubmed25n0001.xml.gz", baseline, rng, revised_year=2023)
+            # a day of updates: revisions of 5% of the papers, new papers and deletions
+            revised = rng.sample(baseline, args.rows // 20)
+            write_synthetic_file(
+                source / "pubmed25n0002.xml.gz",
+                revised + list(range(args.rows + 1, args.rows + args.rows // 20 + 1)),
+                rng,
+                deleted=rng.sample(baseline, args.rows // 100),
+                revised_year=2024,
+            )
+            # a stale revision, applied after the newer one
+            write_synthetic_file(source / "pubmed25n0003.xml.gz", revised[:10], rng, revised_year=2022)
+
+            library = PaperLibrary(Path(tmpdir) / "library")
+            apply_new_files(library, str(source))
+            print(f"* {len(library)} papers in {len(library.segments)} segments")
+            assert library.get(revised[0])["date_revised"].startswith("2024")
+
+            started = time.perf_counter()
+            apply_new_files(library, str(source))
+            print(f"* nothing new to apply in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+            started = time.perf_counter()
+            result = library.aggregate("year", publication_types=["Review"])
+            print(f"* counted {result['total']} reviews by year over the segments "
+                  f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+            started = time.perf_counter()
+            papers = library.compact()
+            print(f"* compacted {papers} papers in {time.perf_counter() - started:.1f}s")
+            assert library.aggregate("year", publication_types=["Review"]) == result
+
+            # daily updates of a few papers spread over the PMIDs: small sparse segments,
+            # merged once there are more than max_segments
+            library = PaperLibrary(Path(tmpdir) / "library", max_segments=4)
+            for day in range(12):
+                pmids = [rng.randint(1, 39_000_000) for _ in range(20)]
+                path = source / f"pubmed25n{day + 10:04d}.xml.gz"
+                write_synthetic_file(path, pmids, rng, deleted=rng.sample(baseline, 2), revised_year=2025)
+                library.apply_file(path)
+            assert len(library.segments) <= library.max_segments
+            assert library.get(pmids[0])["date_revised"].startswith("2025")
+            index_bytes = max((library.path / name / "papers" / "index.npy").stat().st_size
+                              for name in library.manifest["segments"][1:])
+            print(f"* 12 daily updates in {len(library.segments)} segments, {len(library)} papers, "
+                  f"the largest index of an update segment is {index_bytes / 1024:.1f}KB")
@@ -0,0 +1,372 @@
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# A read-only store of parsed papers, as returned by create_paper(), that any number of
+# server processes open memory-mapped and share through the page cache.
+#
+# The store is a folder:
+#   papers.bin     the papers as JSON, packed in blocks, each optionally compressed with zstd
+#   blocks.npy     the start and size of each block in papers.bin
+#   index.npy      one fixed-width entry per PMID from the smallest to the largest:
+#                  the block of the paper, its offset in the block and its length
+#   pmids.npy      only in a sparse store: the sorted PMIDs of the entries of index.npy
+#   meta.json      the smallest PMID, the number of papers, the layout and the compression
+#
+# A lookup reads index[pmid - base], so it is O(1), and the paper is decoded from the
+# mapped file: without compression no copy is made before json.loads. With compression
+# each process keeps a small LRU of decompressed blocks.
+#
+# When the PMIDs are spread out, e.g., the few papers of a daily update file, the index
+# would be mostly empty slots, so it has one entry per paper instead, found by a binary
+# search of pmids.npy.
+#
+#   python mcp/paper_store.py build --papers papers.jsonl --store data/papers --compression zstd
+#   store = PaperStore("data/papers")
+#   paper = store.get("36990608")
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+DEFAULT_CACHED_BLOCKS = 64
+
+INDEX_DTYPE = np.dtype([("block", "<u4"), ("offset", "<u4"), ("length", "<u4")])
+BLOCKS_DTYPE = np.dtype([("start", "<u8"), ("size", "<u8")])
+# the block of the PMIDs that are not in the store
+MISSING = np.iinfo(np.uint32).max
+
+COMPRESSIONS = (None, "zstd")
+
+# the index is sparse when a dense one would take this many times more bytes
+SPARSE_FACTOR = 2
+
+
+def zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is needed for compressed paper stores: uv sync --extra zstd")
+    return zstandard
+
+
+class PaperStoreWriter:
+    '''
+    Packs papers into a new store. The store is written to a temporary folder and moved
+    into place by close(), so readers never see a partial store.
+    '''
+
+    def __init__(self, path, compression=None, block_size=DEFAULT_BLOCK_SIZE, level=3):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression: {compression}, expected one of {COMPRESSIONS}")
+        self.path = Path(path)
+        self.compression = compression
+        self.block_size = block_size
+        self._compressor = zstd().ZstdCompressor(level=level) if compression == "zstd" else None
+
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self._tmp_path.mkdir(parents=True, exist_ok=True)
+        self._blob = open(self._tmp_path / "papers.bin", "wb")
+        self._block = bytearray()
+        self._blocks = array("Q")
+
+        self._pmids = array("I")
+        self._entries = array("I")
+
+    def add(self, paper):
+        '''
+        Add a paper. A paper added again with the same PMID replaces the first one.
+        '''
+        pmid = int(paper["pmid"])
+        record = json.dumps(paper, ensure_ascii=False, separators=(",", ":")).encode()
+        if self._block and len(self._block) + len(record) > self.block_size:
+            self._flush_block()
+        self._pmids.append(pmid)
+        self._entries.extend((len(self._blocks) // 2, len(self._block), len(record)))
+        self._block += record
+
+    def add_papers(self, path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    self.add(json.loads(line))
+
+    def _flush_block(self):
+        data = self._compressor.compress(bytes(self._block)) if self._compressor else self._block
+        self._blocks.extend((self._blob.tell(), len(data)))
+        self._blob.write(data)
+        self._block = bytearray()
+
+    def close(self):
+        '''
+        Write the index and move the store into place.
+
+        :return: The number of papers.
+        '''
+        if self._block:
+            self._flush_block()
+        self._blob.close()
+
+        pmids = np.frombuffer(self._pmids, dtype=np.uint32)
+        entries = np.frombuffer(self._entries, dtype=np.uint32).reshape(-1, 3)
+        base = int(pmids.min()) if len(pmids) else 0
+        size = int(pmids.max()) - base + 1 if len(pmids) else 0
+
+        # the later of two papers with the same PMID wins
+        order = np.argsort(pmids, kind="stable")
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = pmids[order][1:] != pmids[order][:-1]
+        order = order[last]
+        layout = "sparse" if size * INDEX_DTYPE.itemsize > SPARSE_FACTOR * len(order) * (INDEX_DTYPE.itemsize + 4) \
+            else "dense"
+
+        if layout == "sparse":
+            index = np.zeros(len(order), dtype=INDEX_DTYPE)
+            positions = np.arange(len(order))
+            np.save(self._tmp_path / "pmids.npy", pmids[order])
+        else:
+            index = np.zeros(size, dtype=INDEX_DTYPE)
+            index["block"] = MISSING
+            positions = pmids[order] - base
+        index["block"][positions] = entries[order, 0]
+        index["offset"][positions] = entries[order, 1]
+        index["length"][positions] = entries[order, 2]
+        np.save(self._tmp_path / "index.npy", index)
+
+        blocks = np.frombuffer(self._blocks, dtype=np.uint64).reshape(-1, 2)
+        structured = np.zeros(len(blocks), dtype=BLOCKS_DTYPE)
+        structured["start"], structured["size"] = blocks[:, 0], blocks[:, 1]
+        np.save(self._tmp_path / "blocks.npy", structured)
+
+        papers = int((index["block"] != MISSING).sum())
+        with open(self._tmp_path / "meta.json", "w") as f:
+            json.dump(dict(base=base, papers=papers, layout=layout, compression=self.compression,
+                           block_size=self.block_size), f)
+
+        # swap the new store in place of the old one
+        if self.path.exists():
+            old_path = self.path.with_name(self.path.name + ".old")
+            os.rename(self.path, old_path)
+            os.rename(self._tmp_path, self.path)
+            for child in old_path.iterdir():
+                child.unlink()
+            old_path.rmdir()
+        else:
+            os.rename(self._tmp_path, self.path)
+        return papers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._blob.close()
+
+
+class PaperStore:
+    '''
+    Reads papers by PMID from a store, memory-mapped. Safe to share between threads, and
+    to open in any number of processes.
+    '''
+
+    def __init__(self, path, cached_blocks=DEFAULT_CACHED_BLOCKS):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            meta = json.load(f)
+        self.base = meta["base"]
+        self.papers = meta["papers"]
+        self.compression = meta["compression"]
+        # the stores written before the sparse layout are dense
+        self.layout = meta.get("layout", "dense")
+
+        self.index = np.load(self.path / "index.npy", mmap_mode="r")
+        self._pmids = np.load(self.path / "pmids.npy", mmap_mode="r") if self.layout == "sparse" else None
+        self.blocks = np.load(self.path / "blocks.npy", mmap_mode="r")
+        if os.path.getsize(self.path / "papers.bin"):
+            self._blob = np.memmap(self.path / "papers.bin", dtype=np.uint8, mode="r")
+        else:
+            self._blob = np.zeros(0, dtype=np.uint8)
+
+        self._decompressor = zstd().ZstdDecompressor() if self.compression == "zstd" else None
+        self._lock = threading.Lock()
+        self._cached_blocks = cached_blocks
+        self._block_cache = OrderedDict()
+
+    def __len__(self):
+        return self.papers
+
+    def _entry(self, pmid):
+        try:
+            pmid = int(pmid)
+        except (TypeError, ValueError):
+            return None
+        if self._pmids is not None:
+            if not 0 <= pmid <= MISSING:
+                return None
+            position = int(np.searchsorted(self._pmids, pmid))
+            if position == len(self._pmids) or self._pmids[position] != pmid:
+                return None
+            return self.index[position]
+
+        position = pmid - self.base
+        if not 0 <= position < len(self.index):
+            return None
+        entry = self.index[position]
+        return None if entry["block"] == MISSING else entry
+
+    def __contains__(self, pmid):
+        return self._entry(pmid) is not None
+
+    def _block(self, number):
+        start, size = self.blocks[number]
+        data = memoryview(self._blob[start:start + size])
+        if self._decompressor is None:
+            return data
+
+        with self._lock:
+            if (block := self._block_cache.get(number)) is not None:
+                self._block_cache.move_to_end(number)
+                return block
+        # zstd releases the GIL, so threads decompress in parallel
+        block = self._decompressor.decompress(data)
+        with self._lock:
+            self._block_cache[number] = block
+            if len(self._block_cache) > self._cached_blocks:
+                self._block_cache.popitem(last=False)
+        return block
+
+    def get_raw(self, pmid):
+        '''
+        :return: The JSON of a paper, or None if it is not in the store.
+        '''
+        if (entry := self._entry(pmid)) is None:
+            return None
+        offset, length = int(entry["offset"]), int(entry["length"])
+        return self._block(int(entry["block"]))[offset:offset + length]
+
+    def get(self, pmid):
+        '''
+        :return: A paper by its PMID, as returned by create_paper(), or None if it is not in the store.
+        '''
+        raw = self.get_raw(pmid)
+        return None if raw is None else json.loads(bytes(raw) if isinstance(raw, memoryview) else raw)
+
+    def pmids(self):
+        if self._pmids is not None:
+            return np.asarray(self._pmids)
+        return (np.flatnonzero(self.index["block"] != MISSING) + self.base).astype(np.uint32)
+
+    def __iter__(self):
+        '''
+        Iterate over the papers in the order of their PMIDs.
+        '''
+        for pmid in self.pmids():
+            yield self.get(int(pmid))
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+    import random
+    import statistics
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["build", "get", "bench"])
+    parser.add_argument("--store", type=str, default="data/papers")
+    parser.add_argument("--papers", type=str, action="append", default=[],
+                        help="a JSONL file of papers, as returned by create_paper()")
+    parser.add_argument("--compression", type=str, default=None, choices=["zstd"])
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--pmid", type=str, action="append", default=[])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    def rss_mb():
+        # the resident memory of this process, and the part that is shared file pages
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":", 1) for line in f)
+        kb = lambda key: int(status.get(key, "0 kB").split()[0])
+        return kb("VmRSS") / 1024, kb("RssFile") / 1024
+
+    def bench_worker(store_path, pmids, lookups, results):
+        rss_before, _ = rss_mb()
+        if store_path.endswith(".jsonl"):
+            # the baseline: every worker holds its own parsed copy of the papers
+            with open(store_path) as f:
+                papers = {paper["pmid"]: paper for paper in map(json.loads, f)}
+            get = papers.get
+        else:
+            get = PaperStore(store_path).get
+        latencies = []
+        for pmid in random.Random(os.getpid()).choices(pmids, k=lookups):
+            started = time.perf_counter()
+            get(pmid)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        rss, rss_file = rss_mb()
+        results.put((latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], rss - rss_before, rss_file))
+
+    def bench(store_path, pmids, label):
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=bench_worker, args=(str(store_path), pmids, args.lookups, results))
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        measures = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        p50, p99, rss, rss_file = (statistics.mean(values) for values in zip(*measures))
+        print(f"* {label}: p50 {p50 * 1e6:.1f}us p99 {p99 * 1e6:.1f}us per lookup, "
+              f"+{rss:.0f}MB RSS per worker, of which {rss_file:.0f}MB are file pages shared by the workers")
+
+    if args.action == "build":
+        with PaperStoreWriter(args.store, compression=args.compression, block_size=args.block_size) as writer:
+            for path in args.papers:
+                writer.add_papers(path)
+        print(f"* built the paper store {args.store} with {len(PaperStore(args.store))} papers")
+    elif args.action == "get":
+        store = PaperStore(args.store)
+        for pmid in args.pmid:
+            print(json.dumps(store.get(pmid), indent=2))
+    elif args.action == "bench":
+        multiprocessing.set_start_method("fork")
+        random.seed(0)
+        words = [f"word{i}" for i in range(5_000)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            papers_path = Path(tmpdir) / "papers.jsonl"
+            pmids = []
+            with open(papers_path, "w") as f:
+                for i in range(args.rows):
+                    pmid = str(30_000_000 + i * 3)
+                    pmids.append(pmid)
+                    f.write(json.dumps(dict(
+                        pmid=pmid,
+                        title=" ".join(random.choices(words, k=12)),
+                        abstract=" ".join(random.choices(words, k=250)),
+                        authors=[f"Author{random.randint(0, 9999)} A" for _ in range(6)],
+                        mesh_terms=random.choices(words, k=10),
+                        references=[str(random.randint(1, 30_000_000)) for _ in range(20)],
+                    )) + "\n")
+            print(f"* {args.rows} papers, {os.path.getsize(papers_path) / 1e6:.0f}MB of JSONL, "
+                  f"{args.workers} workers, {args.lookups} random lookups each")
+
+            bench(papers_path, pmids, "JSONL loaded in each worker")
+            for compression in COMPRESSIONS:
+                store_path = Path(tmpdir) / f"store-{compression}"
+                started = time.perf_counter()
+                with PaperStoreWriter(store_path, compression=compression, block_size=args.block_size) as writer:
+                    writer.add_papers(papers_path)
+                size = sum(child.stat().st_size for child in store_path.iterdir())
+                print(f"* built the store with compression {compression} in {time.perf_counter() - started:.1f}s, "
+                      f"{size / 1e6:.0f}MB")
+                bench(store_path, pmids, f"paper store, compression {compression}")
@@ -0,0 +1,316 @@
+import itertools
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Speculative prefetching for the PubMed server.
+#
+# Tasks name their papers up front ("PMID: 36990608"), and agents nearly always ask about
+# them first, then about the papers they cite. The prefetcher scans the task text for
+# PMIDs, DOIs and NCT IDs and fetches the papers in the background into the paper cache,
+# so the agent's first get_paper_abstract calls are served hot. It can also fetch the
+# first-hop references of those papers.
+#
+# The prefetches are rate limited, so they leave NCBI's rate limit to the live calls, and
+# references are only fetched while the cache is less than half full, so speculative
+# papers never evict the ones the agents asked for.
+
+PMID_PATTERN = re.compile(r"\bPMID:?\s*(\d{1,9})\b|pubmed\.ncbi\.nlm\.nih\.gov/(\d{1,9})", re.IGNORECASE)
+DOI_PATTERN = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>]+)")
+NCT_PATTERN = re.compile(r"\b(NCT\d{8})\b")
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# how long a call waits for the fetch of the same paper by another call before fetching it itself
+DEFAULT_WAIT_SECONDS = 15.0
+
+# the papers named in a task come before the papers they cite
+PRIORITY_TASK = 0
+PRIORITY_REFERENCE = 1
+
+
+def scan_ids(text):
+    '''
+    Find the PMIDs, DOIs and NCT IDs in a text.
+
+    :return: A dict with the lists of pmids, dois and nct_ids, in order of appearance.
+    '''
+    pmids = [a or b for a, b in PMID_PATTERN.findall(text)]
+    # a DOI at the end of a sentence keeps the period
+    dois = [doi.rstrip(".,;:)]") for doi in DOI_PATTERN.findall(text)]
+    nct_ids = NCT_PATTERN.findall(text)
+    return dict(
+        pmids=list(dict.fromkeys(pmids)),
+        dois=list(dict.fromkeys(dois)),
+        nct_ids=list(dict.fromkeys(nct_ids)),
+    )
+
+
+class PaperCache:
+    '''
+    A thread-safe LRU cache of papers, bounded by their approximate size in bytes.
+
+    Concurrent requests for the same paper share one fetch, so a live call for a paper
+    that is being prefetched waits for the prefetch instead of fetching it again, for at
+    most `wait_seconds`, then it fetches the paper itself.
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, wait_seconds=DEFAULT_WAIT_SECONDS):
+        self.max_bytes = max_bytes
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._papers = OrderedDict()
+        self._fetching = {}
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        # hits on papers that were prefetched before anyone asked for them
+        self.prefetch_hits = 0
+        self.evicted = 0
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._papers or key in self._fetching
+
+    def get(self, key):
+        '''
+        :return: The paper if it is cached, counted as a hit, or None.
+        '''
+        with self._lock:
+            if (entry := self._papers.get(key)) is None:
+                return None
+            self._papers.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, paper):
+        '''
+        Cache a paper fetched some other way, e.g., in a batch.
+        '''
+        self._put(key, paper, prefetched=False)
+
+    def get_or_fetch(self, key, fetch, prefetch=False):
+        '''
+        Get a paper from the cache, or fetch it and cache it. Failed fetches are not cached.
+
+        :param fetch: A function that fetches the paper, called at most once per key at a time.
+        :param prefetch: Whether this is a speculative fetch, which does not count as a hit or miss.
+        '''
+        with self._lock:
+            if (entry := self._papers.get(key)) is not None:
+                self._papers.move_to_end(key)
+                paper, size, prefetched = entry
+                if not prefetch:
+                    self.hits += 1
+                    if prefetched:
+                        self.prefetch_hits += 1
+                        self._papers[key] = (paper, size, False)
+                return paper
+
+            if (event := self._fetching.get(key)) is None:
+                event = self._fetching[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+            if not prefetch:
+                self.misses += 1
+
+        if not owner:
+            # a stalled fetch does not hold the others, they fetch the paper on their own
+            if not event.wait(self.wait_seconds):
+                return fetch()
+            with self._lock:
+                entry = self._papers.get(key)
+                if entry is not None and not prefetch and entry[2]:
+                    # the live call was served by the prefetch it waited for
+                    self.prefetch_hits += 1
+                    self._papers[key] = (entry[0], entry[1], False)
+            return entry[0] if entry is not None else fetch()
+
+        try:
+            paper = fetch()
+            if paper is not None:
+                self._put(key, paper, prefetched=prefetch)
+            return paper
+        finally:
+            with self._lock:
+                del self._fetching[key]
+            event.set()
+
+    def _put(self, key, paper, prefetched):
+        # the JSON size is close enough to the memory the paper takes
+        size = len(json.dumps(paper, default=str))
+        with self._lock:
+            if (old := self._papers.pop(key, None)) is not None:
+                self._bytes -= old[1]
+            self._papers[key] = (paper, size, prefetched)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._papers) > 1:
+                _, (_, evicted_size, _) = self._papers.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+                prefetch_hits=self.prefetch_hits,
+                evicted=self.evicted,
+                papers=len(self._papers),
+                bytes=self._bytes,
+            )
+
+
+class Prefetcher:
+    '''
+    Fetches the papers named in task texts into the paper cache, in a background thread.
+
+    :param fetch_paper: A function that takes a PMID and returns the paper, through the cache.
+        It is called with prefetch=True.
+    :param resolve: A function that takes a DOI or an NCT ID and returns the PMIDs of its
+        papers, or None to skip them.
+    :param cache: The paper cache, to check the memory budget before following references.
+    :param rate: The max number of fetches per second.
+    :param max_pending: The max number of queued prefetches. More are dropped.
+    :param follow_references: Whether to also prefetch the papers cited by the task's papers,
+        unless a prefetch says otherwise.
+    :param max_references: The max number of references to prefetch per paper.
+    '''
+
+    def __init__(
+        self,
+        fetch_paper,
+        resolve=None,
+        cache=None,
+        rate=2.0,
+        max_pending=200,
+        follow_references=False,
+        max_references=10,
+    ):
+        self.fetch_paper = fetch_paper
+        self.resolve = resolve
+        self.cache = cache
+        self.rate = rate
+        self.follow_references = follow_references
+        self.max_references = max_references
+
+        self._queue = queue.PriorityQueue(maxsize=max_pending)
+        self._order = itertools.count()
+        # the queued and in-flight prefetches, to skip duplicates
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+        self.queued = 0
+        self.fetched = 0
+        self.resolved = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def prefetch(self, text, follow_references=None):
+        '''
+        Queue the papers named in a text. Returns at once.
+
+        :param follow_references: Whether to also prefetch the papers they cite, the prefetcher's setting by default.
+        :return: The IDs found in the text.
+        '''
+        if follow_references is None:
+            follow_references = self.follow_references
+        ids = scan_ids(text)
+        for pmid in ids["pmids"]:
+            self._enqueue(PRIORITY_TASK, "pmid", pmid, follow_references)
+        if self.resolve is not None:
+            for other_id in ids["dois"] + ids["nct_ids"]:
+                self._enqueue(PRIORITY_TASK, "resolve", other_id, follow_references)
+        self.start()
+        return ids
+
+    def _enqueue(self, priority, kind, value, follow_references=False):
+        key = (kind, value, follow_references)
+        with self._lock:
+            if key in self._pending:
+                return
+            try:
+                self._queue.put_nowait((priority, next(self._order), kind, value, follow_references))
+            except queue.Full:
+                self.dropped += 1
+                return
+            self._pending.add(key)
+            self.queued += 1
+
+    def _run(self):
+        interval = 1.0 / self.rate if self.rate else 0.0
+        next_at = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                priority, _, kind, value, follow_references = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            # one fetch every `interval` seconds
+            if (delay := next_at - time.monotonic()) > 0:
+                time.sleep(delay)
+            next_at = max(next_at, time.monotonic()) + interval
+
+            try:
+                if kind == "resolve":
+                    for pmid in self.resolve(value) or []:
+                        self._enqueue(priority, "pmid", pmid, follow_references)
+                    self.resolved += 1
+                    continue
+
+                paper = self.fetch_paper(value)
+                self.fetched += 1
+                if paper is not None and follow_references and self._has_room_for_references():
+                    for reference in paper.get("references", [])[:self.max_references]:
+                        if reference.isdigit():
+                            self._enqueue(PRIORITY_REFERENCE, "pmid", reference)
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"* error prefetching {kind} {value}: {e}")
+            finally:
+                # done, a later prefetch of the same ID goes through the cache again
+                with self._lock:
+                    self._pending.discard((kind, value, follow_references))
+
+    def _has_room_for_references(self):
+        return self.cache is None or self.cache.bytes < self.cache.max_bytes / 2
+
+    def stats(self):
+        return dict(
+            queued=self.queued,
+            pending=self._queue.qsize(),
+            fetched=self.fetched,
+            resolved=self.resolved,
+            dropped=self.dropped,
+            errors=self.errors,
+        )
+
+
+if __name__ == "__main__":
+    print(scan_ids(
+        "Please analyze PMID: 36990608 and https://pubmed.ncbi.nlm.nih.gov/36990609/, "
+        "the trial NCT02446405 and doi 10.1016/S0140-6736(23)00123-4."
+    ))
@@ -1,479 +1,550 @@
+import asyncio
+import json
 import logging
-import dateparser
-import xmltodict
+import os
+import threading
 import logging
 import requests
-from mcp.server.fastmcp import FastMCP
+import sys
+from pathlib import Path
+from mcp.server.fastmcp import Context, FastMCP
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from tool_executor import ToolExecutor, offload_fastmcp_tools
+from profiling import MODES, ToolProfiler, profile_fastmcp_tools
+from prefetch import PaperCache, Prefetcher
+from id_index import IdIndex
+from facets import FACETS, FacetIndex
+from authors import AuthorIndex
+from paper_store import PaperStore
+from paper_library import PaperLibrary
+from pubmed_files import iter_xml_stream
+from pubmed_parse import create_paper
+from near_duplicates import DEFAULT_THRESHOLD, NearDuplicateIndex, paper_text, signature
+from embeddings import DEFAULT_NPROBE, EmbeddingStore
 
-def standardize_date(date_str):
-    """
-    Convert a date string into the standard YYYY-MM-DD format.
-
-    :param date_str: A date string (e.g., '2022-1-1', '2022-Jan-1').
-    :return: A standardized date string in the format YYYY-MM-DD.
-    """
-    try:
-        # Parse the date string to a datetime object
-        parsed_date = dateparser.parse(date_str)
-        standardized_date = parsed_date.strftime('%Y-%m-%d')
-        return standardized_date
-    except Exception as e:
-        return None 
-    
 ###########################################################
-# Extractors
+# MCP Server
 ###########################################################
 
-def parse_title(_title):
-    '''
-    Recursively extract the title from a complex nested dictionary.
-    
-    :param _title: A nested dictionary containing title data.
-    :return: Extracted title as a string or None if not found.
-    '''
-    if _title is None:
-        # If _title is None, return None
-        return ''
-    
-    if isinstance(_title, str):
-        # If _title is a string, return it
-        return _title
-    
-    if isinstance(_title, list):
-        # If _title is a list, extract the title from each item
-        extracted_text = []
-        for item in _title:
-            extracted_part = parse_title(item)
-            if extracted_part:
-                extracted_text.append(extracted_part)
-        return " ".join(extracted_text) if extracted_text else None
-    
-    if not isinstance(_title, dict):
-        # If _title is not a dictionary, return None
-        return None
-    
-    extracted_text = []
-    for key, value in _title.items():
-        extracted_part = parse_title(value)
-        if extracted_part:
-            extracted_text.append(extracted_part)
+# Create server
+mcp = FastMCP("PubMed")
+
+
+EFETCH_ENDPOINT = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id={pmid}"
+ESEARCH_ENDPOINT = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&retmode=json&retmax={retmax}&term={term}"
+# the IDs per efetch request, NCBI asks for at most 200 in a GET
+FETCH_BATCH_SIZE = 200
+# the connect and read timeouts of the requests for one paper or one search, in seconds
+REQUEST_TIMEOUT = (10, 30)
+
+# the papers fetched by the tools and by the prefetcher
+paper_cache = PaperCache()
 
-    return " ".join(extracted_text) if extracted_text else None
+# the local papers, built with paper_store.py and shared by all the server processes,
+# or a library kept up to date with paper_library.py
+if os.path.exists(os.getenv("PUBMED_LIBRARY", "")):
+    paper_store = PaperLibrary(os.getenv("PUBMED_LIBRARY"))
+else:
+    paper_store = PaperStore(os.getenv("PUBMED_PAPER_STORE")) if os.path.exists(os.getenv("PUBMED_PAPER_STORE", "")) else None
 
 
-def extract_title(data):
+def fetch_paper(pmid, prefetch=False):
     '''
-    Recursively extract the title from a complex nested dictionary.
-    
-    :param _title: A nested dictionary containing title data.
-    :return: Extracted title as a string or None if not found.
+    Get a paper by its PMID, from the local store, the cache or PubMed.
     '''
-    _title = data['MedlineCitation']['Article']['ArticleTitle']
-    title = parse_title(_title)
+    if paper_store is not None and (paper := paper_store.get(pmid)) is not None:
+        return paper
 
-    return title
+    def fetch():
+        url = EFETCH_ENDPOINT.format(pmid=pmid)
+        logging.info(f"fetch_paper by url: {url}")
+        response = requests.get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return create_paper(response.text)
 
+    return paper_cache.get_or_fetch(pmid, fetch, prefetch=prefetch)
 
 
-def extract_date(data):
+class PaperStream:
     '''
-    Extract the date from a complex nested dictionary.
+    Gets many papers one at a time, as they come: from the local store and the cache
+    first, then from PubMed in batches, each paper parsed as the response streams in.
+    stop() aborts the request in flight from any thread, e.g., when the client cancels.
     '''
-    # all potential dates
-    date_dict = {}
-
-    def make_raw_date(date_obj):
-        year = date_obj['Year']
-        month = date_obj['Month'] if 'Month' in date_obj else None
-        day = date_obj['Day'] if 'Day' in date_obj else None
-        return f"{year}-{month}-{day}"
-
-    # Extract the publication date
-    # the date can be {'Year': '2023', 'Month': 'Dec', 'Day': '11'}
-    # but sometimes it can be {'Year': '2023', 'Month': 'Dec'}
-    # even {'Year': '2023'}
-    # so we need to handle this case, and return a string in the format of 'YYYY-MM-DD'
-    try: date_dict['date_pub'] = make_raw_date(data['MedlineCitation']['Article']['Journal']['JournalIssue']['PubDate'])
-    except: date_dict['date_pub'] = None
-
-    try: date_dict['date_completed'] = make_raw_date(data['MedlineCitation']['DateCompleted'])
-    except: date_dict['date_completed'] = None
-
-    try: date_dict['date_revised'] = make_raw_date(data['MedlineCitation']['DateRevised'])
-    except: date_dict['date_revised'] = None
-    
-    _publication_date = data['PubmedData']['History']['PubMedPubDate']
-    for _pd in _publication_date:
-        pub_status = _pd['@PubStatus']
-        try: date_dict['date_history_%s' % pub_status] = make_raw_date(_pd)
-        except: date_dict['date_revised'] = None
-    
-    for date_key in [
-        'date_history_pubmed',
-        'date_history_medline',
-        'date_completed',
-        'date_revised',
-        'date_pub'
-    ]:
-        if date_key not in date_dict: continue 
-        date = standardize_date(date_dict[date_key])
-
-        # just find the first date that is not None
-        if date is not None:
-            return date
-        
-    return '1701-10-09'
-
 
-def extract_pmid(data):
+    def __init__(self, pmids, batch_size=FETCH_BATCH_SIZE):
+        self.pmids = list(dict.fromkeys(pmid.strip() for pmid in pmids))
+        self.batch_size = batch_size
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+
+    def stop(self):
+        self.stopped.set()
+        with self._lock:
+            if self._response is not None:
+                # unblocks the parse thread reading the socket
+                self._response.close()
+
+    def __iter__(self):
+        '''
+        :return: An iterator of (pmid, paper), the paper is None if PubMed doesn't have it.
+        '''
+        missing = []
+        for pmid in self.pmids:
+            paper = paper_store.get(pmid) if paper_store is not None else None
+            if paper is None:
+                paper = paper_cache.get(pmid)
+            if paper is not None:
+                yield pmid, paper
+            else:
+                missing.append(pmid)
+
+        for start in range(0, len(missing), self.batch_size):
+            if self.stopped.is_set():
+                return
+            batch = missing[start:start + self.batch_size]
+            yield from self._fetch(batch)
+
+    def _fetch(self, batch):
+        url = EFETCH_ENDPOINT.format(pmid=",".join(batch))
+        logging.info(f"fetch_papers by url: {url}")
+        response = requests.get(url, stream=True, timeout=(10, 60))
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with self._lock:
+            if self.stopped.is_set():
+                response.close()
+                return
+            self._response = response
+
+        pending = set(batch)
+        try:
+            for kind, paper in iter_xml_stream(lambda: response.raw, name="efetch", stopped=self.stopped):
+                if kind == "paper" and paper["pmid"] in pending:
+                    pending.discard(paper["pmid"])
+                    paper_cache.put(paper["pmid"], paper)
+                    yield paper["pmid"], paper
+        finally:
+            with self._lock:
+                self._response = None
+            response.close()
+        if not self.stopped.is_set():
+            for pmid in batch:
+                if pmid in pending:
+                    yield pmid, None
+
+
+def search_pmids(term, retmax=5):
     '''
-    Extract the PMID from a complex nested dictionary.
+    Get the PMIDs of the papers that match a PubMed query, e.g., a DOI or an NCT ID.
     '''
-    pmid = data['MedlineCitation']['PMID']['#text']
-    return pmid
+    url = ESEARCH_ENDPOINT.format(term=requests.utils.quote(term), retmax=retmax)
+    response = requests.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["esearchresult"]["idlist"]
 
 
-def extract_doi(data):
+def resolve_to_pmids(identifier):
     '''
-    Extract the DOI from a complex nested dictionary.
+    Get the PMIDs of a DOI, or of the papers about a clinical trial.
     '''
-    doi = ''
-    pmcid = ''
-    if 'ArticleIdList' in data['PubmedData']:
-        _article_id = data['PubmedData']['ArticleIdList']['ArticleId']
-
-        # sometimes ArticleId is a list of objects, sometimes a single object  
-        # need to handle both cases
-        if isinstance(_article_id, list):
-            for article_id in _article_id:
-                if article_id['@IdType'] == 'doi':
-                    doi = article_id['#text'] if '#text' in article_id else ''
-                elif article_id['@IdType'] == 'pmc':
-                    pmcid = article_id['#text'] if '#text' in article_id else ''
-                else:
-                    pass
-        else:
-            # if it's a single object, usually it's a pmid, just skip
-            pass
+    if identifier.upper().startswith("NCT"):
+        # trial registrations are indexed as secondary source IDs
+        return search_pmids(f"{identifier}[si]")
+    return search_pmids(f"{identifier}[doi]", retmax=1)
 
-    # convert doi to lower case
-    doi = doi.lower()
 
-    return doi
+# the local DOI/PMCID/PMID table, built with id_index.py, and the ID converter API for the rest
+id_index = IdIndex(os.getenv("PUBMED_ID_INDEX") if os.path.exists(os.getenv("PUBMED_ID_INDEX", "")) else None)
 
+# the MinHash index of the titles and abstracts, built with near_duplicates.py
+near_duplicate_index = NearDuplicateIndex(os.getenv("PUBMED_DEDUP_INDEX")) if os.path.exists(os.getenv("PUBMED_DEDUP_INDEX", "")) else None
 
-def extract_pmcid(data):
-    '''
-    Extract the PMCID from a complex nested dictionary.
-    '''
-    pmcid = ''
-    if 'ArticleIdList' in data['PubmedData']:
-        _article_id = data['PubmedData']['ArticleIdList']['ArticleId']
-
-        # sometimes ArticleId is a list of objects, sometimes a single object  
-        # need to handle both cases
-        if isinstance(_article_id, list):
-            for article_id in _article_id:
-                if article_id['@IdType'] == 'pmc':
-                    pmcid = article_id['#text'] if '#text' in article_id else ''
-                else:
-                    pass
-        else:
-            # if it's a single object, usually it's a pmid, just skip
-            pass
+# the embeddings of the titles and abstracts, built with embeddings.py
+embedding_store = EmbeddingStore(os.getenv("PUBMED_EMBEDDINGS")) if os.path.exists(os.getenv("PUBMED_EMBEDDINGS", "")) else None
 
-    return pmcid
+# the facet index of the local papers, built with facets.py, or the library's
+if isinstance(paper_store, PaperLibrary):
+    facet_index = paper_store
+else:
+    facet_index = FacetIndex(os.getenv("PUBMED_FACET_INDEX")) if os.path.exists(os.getenv("PUBMED_FACET_INDEX", "")) else None
 
+# the author index of the local papers, built with authors.py, or the library's
+if isinstance(paper_store, PaperLibrary):
+    author_index = paper_store
+else:
+    author_index = AuthorIndex(os.getenv("PUBMED_AUTHOR_INDEX")) if os.path.exists(os.getenv("PUBMED_AUTHOR_INDEX", "")) else None
 
-def extract_paper_type(data):
-    '''
-    Extract the paper type from a complex nested dictionary.
 
-    # e.g., 'Journal Article', 'Review', 'Editorial'
-    # sometimes 'PublicationType' can be a list, sometimes a single object
-    # need to handle both cases
-    '''
-    paper_type = ''
-    try:
-        if isinstance(data['MedlineCitation']['Article']['PublicationTypeList']['PublicationType'], list):
-            _publication_types = data['MedlineCitation']['Article']['PublicationTypeList']['PublicationType']
-            # join all types with '|'
-            paper_type = '|'.join([pt['#text'] for pt in _publication_types])
-        else:
-            paper_type = data['MedlineCitation']['Article']['PublicationTypeList']['PublicationType']['#text']
-
-    except Exception as e:
-        # when parsing a paper in pubmed24n0648.xml.gz, it throws an error
-        paper_type = 'Unknown'
+prefetcher = Prefetcher(
+    lambda pmid: fetch_paper(pmid, prefetch=True),
+    resolve=resolve_to_pmids,
+    cache=paper_cache,
+)
 
-    return paper_type
 
+@mcp.tool()
+def get_paper_abstract(pmid: str) -> str:
+    """Get the abstract of a paper from PubMed
+    
+    Args:
+        pmid: The PubMed ID of the paper, or its DOI or PMCID
 
-def extract_abstract(data):
-    '''
-    Extract the abstract from a complex nested dictionary.
-    '''
-    abstract = ''
-
-    if 'Abstract' in data['MedlineCitation']['Article']:
-        # somethimes abstract is a list of object, sometimes a single object, sometimes a string
-        # need to handle both cases
-        _abstract = data['MedlineCitation']['Article']['Abstract']['AbstractText']
-        if isinstance(_abstract, list):
-            # item in the list can be a string or an object, need to handle both cases
-            tmp = []
-            for at in _abstract:
-                if at is None: continue
-                
-                if '@Label' in at:
-                    tmp.append(at['@Label'])
-                if '#text' in at:
-                    tmp.append(at['#text'])
-            abstract = ' '.join(tmp)
-
-        elif isinstance(_abstract, dict):
-            if '@Label' in _abstract:
-                abstract = _abstract['@Label']
-            if '#text' in _abstract:
-                abstract = _abstract['#text']
-
-        elif _abstract is None:
-            abstract = ''
-
-        else:
-            abstract = str(data['MedlineCitation']['Article']['Abstract']['AbstractText'])
-
-    return abstract
-
-
-def extract_authors(data):
-    '''
-    Extract the authors from a complex nested dictionary.
-    '''
-    authors = []
-
-    def get_name(author):
-        if 'LastName' in author and 'Initials' in author:
-            return f"{author['LastName']} {author['Initials']}"
-        elif 'LastName' in author and 'ForeName' in author:
-            return f"{author['LastName']} {author['ForeName'][0]}"
-        else:
-            return None
-        
+    Returns:
+        The abstract of the paper
+    """
     try:
-        if 'AuthorList' in data['MedlineCitation']['Article']:
-            _authors = data['MedlineCitation']['Article']['AuthorList']['Author']
-            if isinstance(_authors, list):
-                for author in _authors:
-                    _author = get_name(author)
-                    if _author:
-                        authors.append(_author)
-            elif isinstance(_authors, dict):
-                _author = get_name(_authors)
-                if _author:
-                    authors.append(_author)
-            else:
-                pass
-
+        if not pmid.strip().isdigit():
+            # a DOI or a PMCID
+            record = id_index.resolve([pmid])[pmid]
+            if record is None or record['pmid'] is None:
+                return f"Error getting paper abstract: no PubMed ID found for {pmid}"
+            pmid = record['pmid']
+        paper = fetch_paper(pmid)
+        return paper['abstract']
+    
     except Exception as e:
-        logging.error(f"* error extracting authors: {e}")
+        # print the full stack trace
+        import traceback
+        traceback.print_exc()
         
-    return authors
+        logging.error(f"Error getting paper abstract: {e}")
+        return f"Error getting paper abstract: {e}"
 
 
-def extract_references(data):
-    '''
-    Extract the references from a complex nested dictionary.
-    '''
-    references = []
+@mcp.tool()
+async def fetch_papers(pmids: list[str], ctx: Context) -> dict:
+    """Get the title, abstract, authors and details of many papers at once
+
+    Args:
+        pmids: The PubMed IDs of the papers, hundreds at a time are fine
+
+    Returns:
+        The papers, in the order of the PMIDs, and the PMIDs PubMed doesn't have
+    """
+    # Each paper is sent as soon as it is parsed, as a log notification with the paper as
+    # JSON, along with a progress notification, so the first results don't wait for the
+    # last. A cancelled call stops the upstream request right away.
+    stream = PaperStream(pmids)
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+
+    def produce():
+        try:
+            for pmid, paper in stream:
+                loop.call_soon_threadsafe(results.put_nowait, (pmid, paper))
+        except Exception as e:
+            loop.call_soon_threadsafe(results.put_nowait, (None, e))
+        finally:
+            loop.call_soon_threadsafe(results.put_nowait, (None, None))
+
+    papers = {}
+    executor.submit("fetch_papers", produce)
     try:
-        if 'ReferenceList' in data['PubmedData'] and \
-            data['PubmedData']['ReferenceList'] is not None and \
-            'Reference' in data['PubmedData']['ReferenceList']:
-
-            _references = data['PubmedData']['ReferenceList']['Reference']
-
-            if isinstance(_references, list):
-                for _reference in _references:
-                    if 'ArticleIdList' in _reference:
-                        _article_ids = _reference['ArticleIdList']['ArticleId']
-                        if isinstance(_article_ids, dict):
-                            references.append(_article_ids['#text'])
-                        elif isinstance(_article_ids, list):
-                            references.append(_article_ids[0]['#text'])
-
-            elif isinstance(_references, dict):
-                reference = _references
-                if 'ArticleIdList' in reference:
-                    _article_ids = reference['ArticleIdList']['ArticleId']
-                    if isinstance(_article_ids, dict):
-                        references.append(_article_ids['#text'])
-                    elif isinstance(_article_ids, list):
-                        references.append(_article_ids[0]['#text'])
-            else:
-                # what type of data is this? 
-                # I don't know, just skip it
-                pass
-        else:
-            # what??? no references?
-            pass
-        
-    except Exception as e:
-        pmid = extract_pmid(data)
-        logging.error(f"* error extracting references from {pmid}, return []: {e}")
+        while True:
+            pmid, paper = await results.get()
+            if pmid is None:
+                if isinstance(paper, Exception):
+                    logging.error(f"Error fetching papers: {paper}")
+                    return dict(error=f"Error fetching papers: {paper}", papers=list(papers.values()))
+                break
+            papers[pmid] = paper
+            if paper is not None:
+                await ctx.log("info", json.dumps(paper, default=str), logger_name="fetch_papers")
+            await ctx.report_progress(len(papers), len(stream.pmids))
+    finally:
+        stream.stop()
 
-    return references
+    return dict(
+        papers=[papers[pmid] for pmid in stream.pmids if papers.get(pmid) is not None],
+        missing=[pmid for pmid in stream.pmids if papers.get(pmid) is None],
+    )
 
 
-def extract_mesh_terms(data):
-    '''
-    Extract the MeSH terms from a complex nested dictionary.
-    '''
-    mesh_terms = []
+@mcp.tool()
+def resolve_ids(ids: list[str]) -> dict:
+    """Map paper identifiers to each other: PMIDs, PMCIDs (PMC...) and DOIs (10....), in batch
 
-    if 'MeshHeadingList' not in data['MedlineCitation']:
-        return mesh_terms
-    
-    # print('*' * 50)
-    # print(data['MedlineCitation']['MeshHeadingList'])
-    
-    _mesh_terms = data['MedlineCitation']['MeshHeadingList']['MeshHeading']
-    if isinstance(_mesh_terms, list):
-        for mesh_term in _mesh_terms:
-            if 'DescriptorName' in mesh_term:
-                mesh_terms.append(mesh_term['DescriptorName']['#text'])
+    Args:
+        ids: The PMIDs, PMCIDs or DOIs, thousands at a time are fine
 
-    elif isinstance(_mesh_terms, dict):
-        if 'DescriptorName' in _mesh_terms:
-            mesh_terms.append(_mesh_terms['DescriptorName']['#text'])
-    else:
-        pass
+    Returns:
+        Each ID mapped to its pmid, pmcid and doi, or null if it is unknown
+    """
+    return id_index.resolve(ids)
 
-    return mesh_terms
 
+@mcp.tool()
+def find_near_duplicates(pmid: str, threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """Find the papers with nearly the same title and abstract as a paper: errata, duplicate publications, preprints
 
-def create_paper(xml_text):
-    '''
-    Extract basic information from the converted XML data
-    '''
-    xml_dict = xmltodict.parse(xml_text)
-        
-    # Get both article and book article data
-    articles = xml_dict.get("PubmedArticleSet", {}).get("PubmedArticle", [])
-    
-    # Convert to list if not already
-    if articles and not isinstance(articles, list):
-        articles = [articles]
-    else:
-        articles = articles or []
-    
-    if len(articles) == 0:
-        return None
+    Args:
+        pmid: The PubMed ID of the paper
+        threshold: The min estimated similarity of the texts, from 0 to 1
 
-    data = articles[0]
-    
-    pmid = extract_pmid(data)
+    Returns:
+        The PMIDs of the near duplicates and their similarity
+    """
+    if near_duplicate_index is None:
+        return dict(error="no near-duplicate index, set PUBMED_DEDUP_INDEX to the folder built with near_duplicates.py")
+    matches = near_duplicate_index.find(pmid, threshold=threshold)
+    if matches is None:
+        # a paper that is not indexed yet is compared by its text
+        paper = fetch_paper(pmid)
+        matches = near_duplicate_index.query(signature(paper_text(paper)), threshold=threshold, exclude=pmid)
+    return dict(pmid=pmid, duplicates=[dict(pmid=match, similarity=similarity) for match, similarity in matches])
 
-    # Extract the DOI (if available)
-    doi = extract_doi(data)
 
-    # Extract the PMCID (if available)
-    pmcid = extract_pmcid(data)
+@mcp.tool()
+def similar_papers(pmid: str = "", text: str = "", k: int = 10) -> dict:
+    """Find the papers most similar to a paper, or to a text, by the meaning of their title and abstract
 
-    # Extract the title
-    title = extract_title(data)
+    Args:
+        pmid: The PubMed ID of the paper to find similar papers to
+        text: Or a text to find similar papers to, e.g., a research question
+        k: How many papers to return
 
-    # Extract the paper type
-    paper_type = extract_paper_type(data)
+    Returns:
+        The PMIDs of the most similar papers and their cosine similarity
+    """
+    if embedding_store is None:
+        return dict(error="no embeddings, set PUBMED_EMBEDDINGS to the folder built with embeddings.py")
+    if not pmid and not text:
+        return dict(error="give a pmid or a text")
 
-    # Extract the source (e.g., journal name)
-    source = data['MedlineCitation']['Article']['Journal']['Title']
+    matches = embedding_store.similar_to_pmid(pmid, k=k, nprobe=DEFAULT_NPROBE) if pmid else None
+    if matches is None:
+        # a paper that is not embedded yet is embedded on the fly
+        query = text or paper_text(fetch_paper(pmid))
+        matches = embedding_store.similar_to_text(query, k=k, nprobe=DEFAULT_NPROBE, exclude=pmid or None)
+    return dict(papers=[dict(pmid=match, similarity=similarity) for match, similarity in matches])
 
-    # extracct the publication date
-    publication_date = extract_date(data)
-    
-    # extract the abstract
-    abstract = extract_abstract(data)
 
-    # extract the authors
-    authors = extract_authors(data)
+@mcp.tool()
+def papers_by_author(name: str, prefix: bool = False, limit: int = 100) -> dict:
+    """Find the papers of an author
 
-    full_text = ''
-    full_text_type = ''
-    references = extract_references(data)
+    Args:
+        name: The author's name, e.g., Smith JA or John A. Smith
+        prefix: Whether to also match the longer names, e.g., Smith J for Smith JA and Smith JB
+        limit: How many papers to return, the newest first
 
-    # extract the mesh terms
-    mesh_terms = extract_mesh_terms(data)
-    
-    
-    return dict(
-        pmid=pmid,
-        pmcid=pmcid,
-        doi=doi,
-        title=title,
-        type=paper_type,
-        source=source,
-        publication_date=publication_date,
-        authors=authors,
-        abstract=abstract,
-        full_text=full_text,
-        full_text_type=full_text_type,
-        references=references,
-        mesh_terms=mesh_terms,
+    Returns:
+        The number of papers of the author and their PMIDs
+    """
+    if author_index is None:
+        return dict(error="no author index, set PUBMED_LIBRARY or PUBMED_AUTHOR_INDEX to the folder built with authors.py")
+    pmids = author_index.papers_by_author(name, prefix=prefix)
+    return dict(count=len(pmids), pmids=[str(pmid) for pmid in pmids[::-1][:limit]])
 
-    )
 
+@mcp.tool()
+def coauthors(name: str, top: int = 20) -> dict:
+    """Find the co-authors of an author, by the number of papers they wrote together
 
+    Args:
+        name: The author's name, e.g., Smith JA or John A. Smith
+        top: How many co-authors to return
 
+    Returns:
+        The co-authors' names and numbers of shared papers, most first
+    """
+    if author_index is None:
+        return dict(error="no author index, set PUBMED_LIBRARY or PUBMED_AUTHOR_INDEX to the folder built with authors.py")
+    return dict(coauthors=[dict(name=coauthor, papers=count) for coauthor, count in author_index.coauthors(name, top=top)])
 
-###########################################################
-# MCP Server
-###########################################################
 
-# Create server
-mcp = FastMCP("PubMed")
+@mcp.tool()
+def collapse_duplicates(pmids: list[str], threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """Group a list of papers by near duplicates, to read only one paper of each group
+
+    Args:
+        pmids: The PubMed IDs of the papers
+        threshold: The min estimated similarity of the texts, from 0 to 1
+
+    Returns:
+        The PMIDs to keep, the first of each group in order, and the others mapped to the PMID they duplicate
+    """
+    if near_duplicate_index is None:
+        return dict(keep=pmids, duplicate_of={})
+    keep, duplicate_of = near_duplicate_index.collapse(pmids, threshold=threshold)
+    return dict(keep=keep, duplicate_of=duplicate_of)
 
 
 @mcp.tool()
-def get_paper_abstract(pmid: str) -> str:
-    """Get the abstract of a paper from PubMed
-    
+def count_papers(
+    by: str,
+    mesh_terms: list[str] = [],
+    publication_types: list[str] = [],
+    journal: str = "",
+    year_from: int = 0,
+    year_to: int = 0,
+    top: int = 20,
+) -> dict:
+    """Count the papers by year, journal, publication type or MeSH term, e.g., how many randomized controlled trials on a topic per year
+
     Args:
-        pmid: The PubMed ID of the paper
+        by: What to count the papers by: year, journal, type or mesh
+        mesh_terms: Only count the papers with all these MeSH terms
+        publication_types: Only count the papers of any of these types, e.g., Randomized Controlled Trial
+        journal: Only count the papers of this journal
+        year_from: Only count the papers from this year on
+        year_to: Only count the papers up to this year
+        top: How many of the largest counts to return
 
     Returns:
-        The abstract of the paper
+        The number of matching papers, and their counts by the facet
     """
-    endpoint = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id={pmid}"
-    url = endpoint.format(pmid=pmid)
-    logging.info(f"get_paper_abstract by url: {url}")
-    try:
-        response = requests.get(url)
-        paper = create_paper(response.text)
-        return paper['abstract']
-    
-    except Exception as e:
-        # print the full stack trace
-        import traceback
-        traceback.print_exc()
-        
-        logging.error(f"Error getting paper abstract: {e}")
-        return f"Error getting paper abstract: {e}"
+    if facet_index is None:
+        return dict(error="no facet index, set PUBMED_LIBRARY or PUBMED_FACET_INDEX to the folder built with facets.py")
+    if by not in FACETS:
+        return dict(error=f"unknown facet: {by}, expected one of {', '.join(FACETS)}")
+    return facet_index.aggregate(
+        by,
+        top=top,
+        mesh_terms=mesh_terms,
+        publication_types=publication_types,
+        journal=journal or None,
+        year_from=year_from or None,
+        year_to=year_to or None,
+    )
+
+
+@mcp.tool()
+def prefetch_papers(text: str, follow_references: bool = False) -> str:
+    """Start fetching the papers named in a text in the background, so later calls are fast
+
+    Args:
+        text: A task or any text with PMIDs, DOIs or NCT IDs
+        follow_references: Whether to also fetch the papers cited by those papers
+
+    Returns:
+        The IDs found in the text
+    """
+    ids = prefetcher.prefetch(text, follow_references=follow_references)
+    return json.dumps(ids)
+
+
+# off until --profile, PUBMED_PROFILE_RATE or kill -USR1, e.g., to see whether dateparser,
+# xmltodict, the extract_* functions or the network make the tools slow
+profiler = ToolProfiler(os.getenv("PUBMED_PROFILE_DIR", "profiles/pubmed"), rate=float(os.getenv("PUBMED_PROFILE_RATE", 0)))
+profile_fastmcp_tools(mcp, profiler)
+
+# requests.get blocks, so the tools run in a thread pool instead of on the server's
+# event loop, with a few concurrent calls at most to go easy on NCBI
+executor = ToolExecutor(limits={"get_paper_abstract": 4})
+offload_fastmcp_tools(mcp, executor)
 
 
 if __name__ == "__main__":
     import argparse
+    import atexit
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("action", type=str, choices=["run", "test"])
+    parser.add_argument("action", type=str, choices=["run", "test", "bench"])
     parser.add_argument("--port", type=int, default=50002)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="PMIDs per fetch_papers call, for the benchmark")
+    parser.add_argument("--ms-per-paper", type=float, default=5.0, help="how fast the stub efetch streams, for the benchmark")
+    parser.add_argument("--profile", type=float, default=0.0,
+                        help="the fraction of the tool calls to profile, kill -USR1 toggles it at runtime")
+    parser.add_argument("--profile-mode", type=str, default="sample", choices=MODES)
+    parser.add_argument("--profile-dir", type=str, default=None, help="defaults to $PUBMED_PROFILE_DIR or profiles/pubmed")
     args = parser.parse_args()
 
+    if args.profile_dir:
+        profiler.path = Path(args.profile_dir)
+    profiler.mode = args.profile_mode
+    if args.profile:
+        profiler.start(rate=args.profile)
+    profiler.install_signal()
+    atexit.register(profiler.flush)
+
     if args.action == "run":
         mcp.settings.port = args.port
         mcp.run(
             transport="sse",
         )
     elif args.action == "test":
+        print(prefetch_papers("Please analyze PMID: 36990608 and PMID: 36990609", follow_references=True))
         print(get_paper_abstract("36990608"))
-
+        print(paper_cache.stats(), prefetcher.stats())
+    elif args.action == "bench":
+        # fetch_papers against a local efetch that streams synthetic articles, over an
+        # in-memory MCP session: the time to the first paper, the total, and how soon the
+        # upstream stops after the client cancels
+        import random
+        import time
+        from fastapi import FastAPI
+        from fastapi.responses import StreamingResponse
+        from mcp import types
+        from mcp.shared.exceptions import McpError
+        from mcp.shared.memory import create_connected_server_and_client_session
+        from pubmed_files import synthetic_article_xml
+        from stub_model import BackgroundServer
+
+        app = FastAPI()
+        app.state.sent = 0
+
+        @app.get("/efetch")
+        async def efetch(id: str):
+            async def articles():
+                rng = random.Random(0)
+                yield "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<PubmedArticleSet>\n"
+                for pmid in id.split(","):
+                    await asyncio.sleep(args.ms_per_paper / 1000)
+                    app.state.sent += 1
+                    yield synthetic_article_xml(pmid, rng)
+                yield "</PubmedArticleSet>\n"
+
+            return StreamingResponse(articles(), media_type="text/xml")
+
+        async def call(pmids, cancel_after=None):
+            received = []
+            cancel = asyncio.Event()
+
+            async def on_log(params):
+                received.append(time.perf_counter())
+                if cancel_after is not None and len(received) == cancel_after:
+                    cancel.set()
+
+            async with create_connected_server_and_client_session(mcp._mcp_server, logging_callback=on_log) as session:
+                request = types.ClientRequest(types.CallToolRequest(
+                    method="tools/call",
+                    params=types.CallToolRequestParams.model_validate(
+                        {"name": "fetch_papers", "arguments": {"pmids": pmids}, "_meta": {"progressToken": "bench"}}
+                    ),
+                ))
+                request_id = session._request_id
+                started = time.perf_counter()
+                task = asyncio.create_task(session.send_request(request, types.CallToolResult))
+                if cancel_after is None:
+                    await task
+                    return received[0] - started, time.perf_counter() - started, None
+                await cancel.wait()
+                sent = app.state.sent
+                await session.send_notification(types.ClientNotification(types.CancelledNotification(
+                    method="notifications/cancelled",
+                    params=types.CancelledNotificationParams(requestId=request_id, reason="bench"),
+                )))
+                try:
+                    await task
+                except McpError:
+                    pass
+                await asyncio.sleep(0.5)
+                return received[0] - started, time.perf_counter() - started, app.state.sent - sent
+
+        async def bench():
+            offset = 10_000_000
+            for n in args.sizes:
+                first, total, _ = await call([str(offset + i) for i in range(n)])
+                offset += n
+                print(f"* {n} papers: first after {first * 1000:.0f}ms, all after {total * 1000:.0f}ms")
+            n = max(args.sizes)
+            first, _, after_cancel = await call([str(offset + i) for i in range(n)], cancel_after=5)
+            print(f"* cancelled a fetch of {n} papers after 5: the upstream sent {after_cancel} more")
+
+        with BackgroundServer(app, port=8766) as server:
+            EFETCH_ENDPOINT = f"{server.url}/efetch?id={{pmid}}"
+            asyncio.run(bench())
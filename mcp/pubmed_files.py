@@ -0,0 +1,198 @@
+import gzip
+import json
+import logging
+import queue
+import threading
+from pathlib import Path
+
+import xmltodict
+
+from pubmed_parse import extract_paper
+
+# Streaming readers of the PubMed files: the baseline and update files NCBI publishes
+# (pubmed25n0001.xml.gz, ...) and JSONL files of papers as returned by create_paper().
+#
+# A baseline file holds 30k articles, so it is parsed one article at a time: xmltodict
+# streams the <PubmedArticle> elements of the file, and each one goes through the same
+# extract_paper() as the papers fetched by the server. Memory stays flat whatever the size
+# of the file. Update files also carry <DeleteCitation> blocks, read as deletions.
+#
+#   for kind, value in iter_records("pubmed25n1300.xml.gz"):
+#       if kind == "paper": ...          # value is the paper
+#       elif kind == "delete": ...       # value is the PMID
+
+# how many parsed articles may wait for the reader
+MAX_PENDING = 256
+
+_DONE = object()
+
+
+def open_file(path):
+    path = str(path)
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _deleted_pmids(item):
+    pmids = item.get("PMID", []) if item else []
+    if not isinstance(pmids, list):
+        pmids = [pmids]
+    return [pmid["#text"] if isinstance(pmid, dict) else pmid for pmid in pmids]
+
+
+def iter_xml_records(path):
+    '''
+    Stream the articles and the deletions of a PubMed XML file.
+
+    :return: An iterator of ("paper", paper) and ("delete", pmid), in the order of the file.
+    '''
+    return iter_xml_stream(lambda: open_file(path), name=Path(path).name)
+
+
+def iter_xml_stream(open_stream, name="stream", stopped=None):
+    '''
+    Stream the articles and the deletions of PubMed XML, e.g., an efetch response.
+
+    :param open_stream: A function that opens the binary stream, called in the parse thread.
+    :param stopped: An Event that stops the parse, e.g., when the request is cancelled.
+    :return: An iterator of ("paper", paper) and ("delete", pmid), in the order of the stream.
+    '''
+    # xmltodict calls back for each article, so the parse runs in a thread and hands the
+    # records over through a bounded queue
+    records = queue.Queue(maxsize=MAX_PENDING)
+    # set when the reader is gone
+    closed = threading.Event()
+
+    def is_stopped():
+        return closed.is_set() or (stopped is not None and stopped.is_set())
+
+    def on_item(item_path, item):
+        tag = item_path[-1][0]
+        if tag == "PubmedArticle":
+            try:
+                records.put(("paper", extract_paper(item)))
+            except Exception as e:
+                logging.error(f"* error parsing an article of {name}: {e}")
+        elif tag == "DeleteCitation":
+            for pmid in _deleted_pmids(item):
+                records.put(("delete", pmid))
+        # returning False stops the parse
+        return not is_stopped()
+
+    def parse():
+        try:
+            with open_stream() as f:
+                xmltodict.parse(f, item_depth=2, item_callback=on_item)
+        except xmltodict.ParsingInterrupted:
+            pass
+        except Exception as e:
+            # a stream closed to stop the parse is not an error
+            if not is_stopped():
+                records.put(("error", e))
+        finally:
+            records.put(("done", _DONE))
+
+    thread = threading.Thread(target=parse, name=f"parse-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = records.get()
+            if kind == "done":
+                break
+            if kind == "error":
+                raise value
+            yield kind, value
+    finally:
+        closed.set()
+        # unblock the parser if it waits on a full queue
+        while thread.is_alive():
+            try:
+                records.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def iter_jsonl_records(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield "paper", json.loads(line)
+
+
+def iter_records(path):
+    '''
+    Stream the records of a PubMed XML file, gzipped or not, or of a JSONL file of papers.
+    '''
+    if str(path).endswith(".jsonl"):
+        return iter_jsonl_records(path)
+    return iter_xml_records(path)
+
+
+def iter_papers(path):
+    '''
+    Stream the papers of a file, without the deletions.
+    '''
+    for kind, value in iter_records(path):
+        if kind == "paper":
+            yield value
+
+
+###########################################################
+# Synthetic files, for the benchmarks
+###########################################################
+
+def synthetic_article_xml(pmid, rng, revised_year=2024):
+    '''
+    A PubmedArticle with the elements the extractors read, and random content.
+    '''
+    words = [f"word{i}" for i in range(2_000)]
+    journal = f"Journal {rng.randint(0, 999)}"
+    year = rng.randint(1990, 2024)
+    authors = "".join(
+        f"<Author><LastName>Author{rng.randint(0, 99_999)}</LastName><ForeName>Alex</ForeName><Initials>A</Initials></Author>"
+        for _ in range(rng.randint(1, 8))
+    )
+    paper_types = "".join(
+        f"<PublicationType UI=\"D016428\">{paper_type}</PublicationType>"
+        for paper_type in rng.sample(["Journal Article", "Randomized Controlled Trial", "Review", "Meta-Analysis"], 2)
+    )
+    mesh_terms = "".join(
+        f"<MeshHeading><DescriptorName MajorTopicYN=\"N\">Term {rng.randint(0, 9_999)}</DescriptorName></MeshHeading>"
+        for _ in range(rng.randint(3, 15))
+    )
+    references = "".join(
+        f"<Reference><Citation>Ref</Citation><ArticleIdList><ArticleId IdType=\"pubmed\">{rng.randint(1, 30_000_000)}"
+        f"</ArticleId></ArticleIdList></Reference>"
+        for _ in range(rng.randint(0, 30))
+    )
+    return (
+        f"<PubmedArticle><MedlineCitation Status=\"MEDLINE\"><PMID Version=\"1\">{pmid}</PMID>"
+        f"<DateRevised><Year>{revised_year}</Year><Month>01</Month><Day>15</Day></DateRevised>"
+        f"<Article><Journal><JournalIssue><PubDate><Year>{year}</Year><Month>Mar</Month></PubDate></JournalIssue>"
+        f"<Title>{journal}</Title></Journal>"
+        f"<ArticleTitle>{' '.join(rng.choices(words, k=12))}</ArticleTitle>"
+        f"<Abstract><AbstractText>{' '.join(rng.choices(words, k=200))}</AbstractText></Abstract>"
+        f"<AuthorList>{authors}</AuthorList><PublicationTypeList>{paper_types}</PublicationTypeList></Article>"
+        f"<MeshHeadingList>{mesh_terms}</MeshHeadingList></MedlineCitation>"
+        f"<PubmedData><History>"
+        f"<PubMedPubDate PubStatus=\"pubmed\"><Year>{year}</Year><Month>3</Month><Day>2</Day></PubMedPubDate>"
+        f"<PubMedPubDate PubStatus=\"medline\"><Year>{year}</Year><Month>4</Month><Day>2</Day></PubMedPubDate>"
+        f"</History><ArticleIdList><ArticleId IdType=\"pubmed\">{pmid}</ArticleId>"
+        f"<ArticleId IdType=\"doi\">10.1000/{pmid}</ArticleId></ArticleIdList>"
+        f"<ReferenceList>{references}</ReferenceList></PubmedData></PubmedArticle>\n"
+    )
+
+
+def write_synthetic_file(path, pmids, rng, deleted=(), revised_year=2024):
+    '''
+    Write a PubMed XML file, gzipped if the path ends with .gz, with the articles and the
+    deletions of an update file.
+    '''
+    with (gzip.open(path, "wt") if str(path).endswith(".gz") else open(path, "w")) as f:
+        f.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<PubmedArticleSet>\n")
+        for pmid in pmids:
+            f.write(synthetic_article_xml(pmid, rng, revised_year=revised_year))
+        if deleted:
+            f.write("<DeleteCitation>")
+            f.write("".join(f"<PMID Version=\"1\">{pmid}</PMID>" for pmid in deleted))
+            f.write("</DeleteCitation>\n")
+        f.write("</PubmedArticleSet>\n")
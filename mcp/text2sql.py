@@ -0,0 +1,328 @@
+import base64
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import anyio
+from mcp.server.fastmcp import FastMCP
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import QueuePool
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from sql_cache import QueryCache, normalize_sql
+
+# A text2SQL server: the sql_engine tool of huggingface-smolagents/test-text2sql.py as an
+# MCP server that many agents can query concurrently.
+#
+# - the connections come from a bounded pool and are read-only
+# - every query has a timeout and a row cap
+# - the results are returned in pages, with a cursor token to fetch the next page
+# - the schema is introspected once and cached
+# - the results are cached until the tables they read change
+
+DEFAULT_DATABASE_URL = "sqlite:///receipts.db"
+
+# the statements an agent may run, anything else is rejected before it reaches the database,
+# they are run as a subquery of the paged query, which EXPLAIN cannot be
+READ_ONLY_STATEMENT = re.compile(r"^\s*(SELECT|WITH|VALUES)\b", re.IGNORECASE)
+
+
+def is_single_statement(sql):
+    '''
+    Whether a query is one statement: it has no semicolon outside of quotes, after the trailing one is stripped.
+    '''
+    # a statement is complete at a semicolon only if the semicolon is outside of quotes and comments
+    return not any(char == ";" and sqlite3.complete_statement(sql[:i + 1]) for i, char in enumerate(sql))
+
+
+class QueryError(Exception):
+    pass
+
+
+class Database:
+    '''
+    A read-only SQL database behind a bounded connection pool.
+
+    :param url: The SQLAlchemy database URL.
+    :param pool_size: The maximum number of connections. A query waits up to
+        `pool_timeout` seconds for a free one.
+    :param timeout: The maximum number of seconds a query may run.
+    :param page_size: The default number of rows per page.
+    :param max_rows: The maximum number of rows a query may return over all its pages.
+    :param schema_ttl: How many seconds the introspected schema is cached.
+    :param cache_entries: How many query results to cache, 0 to disable the cache.
+    :param cache_ttl: How many seconds a result is cached, None until a table it reads changes.
+    '''
+
+    def __init__(
+        self,
+        url=DEFAULT_DATABASE_URL,
+        pool_size=8,
+        pool_timeout=10,
+        timeout=10,
+        page_size=100,
+        max_rows=10_000,
+        schema_ttl=300,
+        cache_entries=1024,
+        cache_ttl=None,
+    ):
+        self.engine = create_engine(
+            url,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=0,
+            pool_timeout=pool_timeout,
+            pool_pre_ping=True,
+        )
+        event.listen(self.engine, "connect", self._set_read_only)
+
+        self.timeout = timeout
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.schema_ttl = schema_ttl
+        self.schema = None
+        self.schema_loaded = 0
+        self.schema_lock = threading.Lock()
+        self.cache = QueryCache(self.engine, max_entries=cache_entries, ttl=cache_ttl) if cache_entries else None
+
+    def _set_read_only(self, dbapi_connection, connection_record):
+        dialect = self.engine.dialect.name
+        cursor = dbapi_connection.cursor()
+        if dialect == "sqlite":
+            cursor.execute("PRAGMA query_only = ON")
+        elif dialect == "postgresql":
+            cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        elif dialect in ("mysql", "mariadb"):
+            cursor.execute("SET SESSION TRANSACTION READ ONLY")
+        else:
+            logging.warning(f"* cannot make {dialect} connections read-only, relying on the statement check")
+        cursor.close()
+
+    @contextmanager
+    def statement_timeout(self, connection):
+        '''
+        Abort the statements run on the connection after `timeout` seconds.
+        '''
+        dialect = self.engine.dialect.name
+        if dialect == "sqlite":
+            # SQLite has no statement timeout, so the progress handler interrupts the query
+            deadline = time.monotonic() + self.timeout
+            driver_connection = connection.connection.driver_connection
+            driver_connection.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+            try:
+                yield
+            finally:
+                driver_connection.set_progress_handler(None, 0)
+            return
+
+        if dialect == "postgresql":
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.timeout * 1000)}")
+        elif dialect in ("mysql", "mariadb"):
+            connection.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {int(self.timeout * 1000)}")
+        yield
+
+    def describe_schema(self, refresh=False):
+        '''
+        Get the tables and their columns, introspected once every `schema_ttl` seconds.
+        '''
+        with self.schema_lock:
+            if refresh or self.schema is None or time.monotonic() - self.schema_loaded > self.schema_ttl:
+                inspector = inspect(self.engine)
+                lines = []
+                for table_name in inspector.get_table_names():
+                    lines.append(f"Table {table_name}:")
+                    lines.extend(
+                        f"  - {column['name']}: {column['type']}"
+                        for column in inspector.get_columns(table_name)
+                    )
+                self.schema = "\n".join(lines)
+                self.schema_loaded = time.monotonic()
+            return self.schema
+
+    def query(self, sql, offset=0, page_size=None):
+        '''
+        Run a read-only query and get one page of its result.
+
+        Each page runs the query again with a LIMIT and an OFFSET, so no connection is
+        held between pages and the pool is never exhausted by abandoned cursors.
+
+        :return: A dict with the columns, the rows, and the cursor of the next page,
+            or None if this is the last page.
+        '''
+        # without comments, a trailing -- would swallow the end of the paged query
+        sql, _ = normalize_sql(sql)
+        if not READ_ONLY_STATEMENT.match(sql) or not is_single_statement(sql):
+            raise QueryError("only a single SELECT statement is allowed")
+
+        page_size = min(page_size or self.page_size, self.max_rows - offset)
+        if page_size <= 0:
+            raise QueryError(f"the result is capped at {self.max_rows} rows")
+
+        # one extra row tells whether there is a next page
+        paged_sql = f"SELECT * FROM ({sql}) AS page LIMIT :limit OFFSET :offset"
+
+        def run(statement):
+            with self.engine.connect() as connection:
+                with self.statement_timeout(connection):
+                    try:
+                        result = connection.execute(statement, {"limit": page_size + 1, "offset": offset})
+                        return list(result.keys()), [list(row) for row in result.fetchmany(page_size + 1)]
+                    except Exception as e:
+                        if "interrupted" in str(e):
+                            raise QueryError(f"the query took more than {self.timeout}s")
+                        raise QueryError(str(getattr(e, "orig", e)))
+
+        if self.cache is not None:
+            columns, rows = self.cache.get_or_run(paged_sql, run, offset, page_size)
+        else:
+            columns, rows = run(text(paged_sql))
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_offset = offset + len(rows)
+        truncated = has_more and next_offset >= self.max_rows
+        return dict(
+            columns=columns,
+            rows=rows,
+            offset=offset,
+            next_cursor=encode_cursor(sql, next_offset, page_size) if has_more and not truncated else None,
+            truncated=truncated,
+        )
+
+
+    def stats(self):
+        pool = self.engine.pool
+        return dict(
+            pool_size=pool.size(),
+            connections_in_use=pool.checkedout(),
+            cache=self.cache.stats() if self.cache is not None else None,
+        )
+
+
+def encode_cursor(sql, offset, page_size):
+    # the cursor holds all the state, so any server process can serve the next page
+    state = {"sql": sql, "offset": offset, "page_size": page_size}
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def decode_cursor(cursor):
+    '''
+    :return: The query, the offset and the page size of the next page.
+    '''
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return state["sql"], int(state["offset"]), int(state["page_size"])
+    except Exception:
+        raise QueryError("invalid cursor")
+
+
+database = None
+
+
+def get_database():
+    global database
+    if database is None:
+        database = Database(os.getenv("TEXT2SQL_DATABASE_URL", DEFAULT_DATABASE_URL))
+    return database
+
+
+# Create server
+mcp = FastMCP("Text2SQL")
+
+
+@mcp.resource("text2sql://stats")
+def stats() -> dict:
+    """The connection pool usage and the hit rate of the query cache"""
+    return get_database().stats()
+
+
+@mcp.tool()
+async def describe_schema() -> str:
+    """Describe the tables of the database and their columns
+
+    Returns:
+        The tables with the name and type of each column
+    """
+    return await anyio.to_thread.run_sync(get_database().describe_schema)
+
+
+@mcp.tool()
+async def query(sql: str) -> dict:
+    """Run a read-only SQL query on the database and get the first page of the result
+
+    Args:
+        sql: A single SELECT statement. Use describe_schema to see the tables.
+
+    Returns:
+        The columns, the rows of the first page, and a next_cursor to get the next page with fetch_page,
+        or null if there are no more rows
+    """
+    return await anyio.to_thread.run_sync(get_database().query, sql)
+
+
+@mcp.tool()
+async def fetch_page(cursor: str) -> dict:
+    """Get the next page of the result of a query
+
+    Args:
+        cursor: The next_cursor returned by query or fetch_page
+
+    Returns:
+        The columns, the rows of the page, and a next_cursor to get the next page,
+        or null if there are no more rows
+    """
+    return await anyio.to_thread.run_sync(get_database().query, *decode_cursor(cursor))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["run", "test"])
+    parser.add_argument("--port", type=int, default=50003)
+    parser.add_argument("--database", type=str, default=None,
+                        help=f"a SQLAlchemy URL, defaults to $TEXT2SQL_DATABASE_URL or {DEFAULT_DATABASE_URL}")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=10, help="seconds per query")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--max-rows", type=int, default=10_000)
+    parser.add_argument("--cache-entries", type=int, default=1024, help="0 to disable the query cache")
+    args = parser.parse_args()
+
+    database = Database(
+        args.database or os.getenv("TEXT2SQL_DATABASE_URL", DEFAULT_DATABASE_URL),
+        pool_size=args.pool_size,
+        timeout=args.timeout,
+        page_size=args.page_size,
+        max_rows=args.max_rows,
+        cache_entries=args.cache_entries,
+    )
+
+    if args.action == "run":
+        mcp.settings.port = args.port
+        mcp.run(
+            transport="sse",
+        )
+    elif args.action == "test":
+        print(database.describe_schema())
+        page = database.query("SELECT customer_name, price FROM receipts ORDER BY price DESC", page_size=3)
+        print(page)
+        if page["next_cursor"]:
+            print(database.query(*decode_cursor(page["next_cursor"])))
+        for rejected in ("DELETE FROM receipts", "SELECT 1; DELETE FROM receipts", "EXPLAIN SELECT * FROM receipts"):
+            try:
+                database.query(rejected)
+            except QueryError as e:
+                print(f"* rejected {rejected!r}: {e}")
+        # a semicolon in a string, and a trailing one, are fine
+        print(database.query("SELECT customer_name FROM receipts WHERE customer_name != 'a;b';", page_size=1)["rows"])
+        # the same query, written differently, is served from the cache
+        database.query("select customer_name, price\n  from RECEIPTS  order by price desc -- again", page_size=3)
+        print(database.stats())
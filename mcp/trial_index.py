@@ -0,0 +1,375 @@
+import json
+import re
+import zipfile
+from array import array
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from facets import Dictionary
+
+# A search index of the ClinicalTrials.gov registry, for "phase 3 recruiting trials on X".
+#
+# It is built from a bulk export of the registry: the ZIP of one JSON file per study
+# (API v2 format, the "Download" button of clinicaltrials.gov), or JSONL of the studies.
+# The index is a folder of memory-mapped arrays:
+#   records.bin, record_offsets.npy   the summary of each trial as JSON, by row
+#   start.npy                         the start date of each trial, in days, for newest first
+#   phase_bitmaps.npy                 one packed bitmap of the trials per phase, and per status
+#   status_bitmaps.npy
+#   condition_postings.npy, condition_offsets.npy         the trials of each condition word,
+#   intervention_postings.npy, intervention_offsets.npy   and of each intervention word
+#   dictionaries.json                 the phases, statuses and words behind the codes
+# The words of a query intersect their postings, then the facets filter the rows with the
+# bitmaps, so a query over the whole registry (~550k trials) takes milliseconds.
+#
+#   python mcp/trial_index.py build --studies ctg-studies.json.zip --index data/trials
+#   CLINICAL_TRIAL_INDEX=data/trials python mcp/clinical_trial.py run
+
+FACETS = ("phase", "status")
+TEXT_FIELDS = ("condition", "intervention")
+
+WORD = re.compile(r"[a-z0-9]+")
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+UNKNOWN_START = np.iinfo(np.int32).min
+
+
+def words(text):
+    return WORD.findall(text.lower())
+
+
+def normalize_value(value):
+    '''
+    Normalize a phase or a status like the registry writes them, e.g., "not yet
+    recruiting" to NOT_YET_RECRUITING and "Phase 3" or "3" to PHASE3.
+    '''
+    value = re.sub(r"[^A-Z0-9]+", "_", value.upper()).strip("_")
+    if value.isdigit():
+        return f"PHASE{value}"
+    if value == "N_A":
+        return "NA"
+    return value.replace("PHASE_", "PHASE")
+
+
+def parse_start(value):
+    '''
+    :return: The days since 1970 of a date as "2024-03-15" or "2024-03", or UNKNOWN_START.
+    '''
+    parts = (value or "").split("-")
+    try:
+        start = date(int(parts[0]), int(parts[1]) if len(parts) > 1 else 1, int(parts[2]) if len(parts) > 2 else 1)
+    except (ValueError, IndexError):
+        return UNKNOWN_START
+    return (start - date(1970, 1, 1)).days
+
+
+def study_record(study):
+    '''
+    Get the fields the index needs from a study of the registry, in API v2 format.
+    '''
+    protocol = study.get("protocolSection", {})
+    derived = study.get("derivedSection", {})
+    identification = protocol.get("identificationModule", {})
+    status = protocol.get("statusModule", {})
+    design = protocol.get("designModule", {})
+    interventions = protocol.get("armsInterventionsModule", {}).get("interventions", [])
+    return dict(
+        nct_id=identification.get("nctId", ""),
+        title=identification.get("briefTitle", ""),
+        status=status.get("overallStatus", ""),
+        phases=design.get("phases", []),
+        conditions=protocol.get("conditionsModule", {}).get("conditions", []),
+        interventions=[intervention.get("name", "") for intervention in interventions],
+        start_date=status.get("startDateStruct", {}).get("date", ""),
+        enrollment=design.get("enrollmentInfo", {}).get("count"),
+        # the MeSH terms and synonyms are searched, not returned
+        condition_terms=[mesh.get("term", "") for mesh in derived.get("conditionBrowseModule", {}).get("meshes", [])],
+        intervention_terms=[name for intervention in interventions for name in intervention.get("otherNames", [])]
+        + [mesh.get("term", "") for mesh in derived.get("interventionBrowseModule", {}).get("meshes", [])],
+    )
+
+
+def iter_studies(path):
+    '''
+    Stream the studies of a bulk export: a ZIP of JSON files, a JSONL file, or a JSON page
+    of the API ({"studies": [...]}).
+    '''
+    path = str(path)
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith(".json"):
+                    with archive.open(name) as f:
+                        yield json.load(f)
+    elif path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        yield from data["studies"] if isinstance(data, dict) else data
+
+
+class TrialIndexBuilder:
+    '''
+    Collects the trials and writes the index.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dictionaries = {name: Dictionary() for name in FACETS + TEXT_FIELDS}
+        # (row, code) pairs per facet and text field
+        self.rows = {name: array("I") for name in FACETS + TEXT_FIELDS}
+        self.codes = {name: array("I") for name in FACETS + TEXT_FIELDS}
+        self.start = array("i")
+        self.record_offsets = array("Q", [0])
+        self._records = open(self.path / "records.bin", "wb")
+
+    def _add_values(self, name, row, values):
+        dictionary = self.dictionaries[name]
+        for code in {dictionary.code(value) for value in values if value}:
+            self.rows[name].append(row)
+            self.codes[name].append(code)
+
+    def add(self, record):
+        row = len(self.start)
+        self._add_values("phase", row, [normalize_value(phase) for phase in record["phases"]])
+        self._add_values("status", row, [normalize_value(record["status"])])
+        self._add_values("condition", row, words(" ".join(record["conditions"] + record["condition_terms"])))
+        self._add_values("intervention", row, words(" ".join(record["interventions"] + record["intervention_terms"])))
+        self.start.append(parse_start(record["start_date"]))
+
+        summary = {key: record[key] for key in record if not key.endswith("_terms")}
+        self._records.write(json.dumps(summary).encode())
+        self.record_offsets.append(self._records.tell())
+
+    def add_studies(self, path):
+        for study in iter_studies(path):
+            self.add(study_record(study))
+
+    def build(self):
+        '''
+        :return: The number of trials.
+        '''
+        self._records.close()
+        n = len(self.start)
+        np.save(self.path / "record_offsets.npy", np.frombuffer(self.record_offsets, dtype=np.uint64))
+        np.save(self.path / "start.npy", np.frombuffer(self.start, dtype=np.int32))
+
+        for name in FACETS:
+            rows = np.frombuffer(self.rows[name], dtype=np.uint32)
+            codes = np.frombuffer(self.codes[name], dtype=np.uint32)
+            bitmaps = np.zeros((len(self.dictionaries[name]), (n + 7) // 8), dtype=np.uint8)
+            for code in range(len(self.dictionaries[name])):
+                bits = np.zeros(n, dtype=bool)
+                bits[rows[codes == code]] = True
+                bitmaps[code] = np.packbits(bits)
+            np.save(self.path / f"{name}_bitmaps.npy", bitmaps)
+
+        for name in TEXT_FIELDS:
+            rows = np.frombuffer(self.rows[name], dtype=np.uint32)
+            codes = np.frombuffer(self.codes[name], dtype=np.uint32)
+            # the rows come in order, so a stable sort by word keeps each posting list sorted
+            order = np.argsort(codes, kind="stable")
+            offsets = np.zeros(len(self.dictionaries[name]) + 1, dtype=np.uint64)
+            np.cumsum(np.bincount(codes, minlength=len(self.dictionaries[name])), out=offsets[1:])
+            np.save(self.path / f"{name}_postings.npy", rows[order])
+            np.save(self.path / f"{name}_offsets.npy", offsets)
+
+        with open(self.path / "dictionaries.json", "w") as f:
+            json.dump({name: dictionary.names for name, dictionary in self.dictionaries.items()}, f)
+        return n
+
+
+class TrialIndex:
+    '''
+    Searches the trials by condition and intervention words, phase and status.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+        def load(name):
+            return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+        self.record_offsets = load("record_offsets")
+        self.records = np.memmap(self.path / "records.bin", dtype=np.uint8, mode="r") \
+            if self.record_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.start = load("start")
+        self.rows = len(self.start)
+        self.bitmaps = {name: load(f"{name}_bitmaps") for name in FACETS}
+        self.postings = {name: (load(f"{name}_postings"), load(f"{name}_offsets")) for name in TEXT_FIELDS}
+        with open(self.path / "dictionaries.json") as f:
+            self.dictionaries = {name: Dictionary(names) for name, names in json.load(f).items()}
+
+    def _facet_mask(self, name, values):
+        '''
+        :return: The packed bitmap of the trials with any of the values, or None for no filter.
+        '''
+        codes = [self.dictionaries[name].get(normalize_value(value)) for value in values]
+        if not codes:
+            return None
+        mask = np.zeros(self.bitmaps[name].shape[1], dtype=np.uint8)
+        for code in codes:
+            if code is not None:
+                mask |= self.bitmaps[name][code]
+        return mask
+
+    def _text_rows(self, name, text):
+        '''
+        :return: The sorted rows of the trials with all the words of the text, or None for no filter.
+        '''
+        codes = [self.dictionaries[name].get(word) for word in dict.fromkeys(words(text))]
+        if not codes:
+            return None
+        if any(code is None for code in codes):
+            return np.zeros(0, dtype=np.uint32)
+        postings, offsets = self.postings[name]
+        lists = sorted((postings[offsets[code]:offsets[code + 1]] for code in codes), key=len)
+        rows = np.asarray(lists[0])
+        for other in lists[1:]:
+            rows = rows[np.isin(rows, other, assume_unique=True)]
+        return rows
+
+    def match(self, condition="", intervention="", phases=(), statuses=()):
+        '''
+        :return: The sorted rows of the matching trials, or None when there is no filter.
+        '''
+        rows = None
+        for name, text in (("condition", condition), ("intervention", intervention)):
+            if (text_rows := self._text_rows(name, text)) is not None:
+                rows = text_rows if rows is None else rows[np.isin(rows, text_rows, assume_unique=True)]
+
+        mask = None
+        for name, values in (("phase", phases), ("status", statuses)):
+            if (facet_mask := self._facet_mask(name, values)) is not None:
+                mask = facet_mask if mask is None else mask & facet_mask
+
+        if mask is None:
+            return rows
+        if rows is None:
+            return np.flatnonzero(np.unpackbits(mask, count=self.rows)).astype(np.uint32)
+        return rows[(mask[rows >> 3] >> (7 - (rows & 7)).astype(np.uint8)) & 1 == 1]
+
+    def facet_counts(self, rows):
+        '''
+        :return: The number of the trials of each phase and status, among the rows.
+        '''
+        if rows is None:
+            mask = None
+        else:
+            bits = np.zeros(self.rows, dtype=bool)
+            bits[rows] = True
+            mask = np.packbits(bits)
+        counts = {}
+        for name in FACETS:
+            bitmaps = self.bitmaps[name]
+            totals = POPCOUNT[bitmaps if mask is None else bitmaps & mask].sum(axis=1, dtype=np.int64)
+            counts[name] = {
+                value: int(total)
+                for value, total in sorted(zip(self.dictionaries[name].names, totals), key=lambda item: -item[1])
+                if total
+            }
+        return counts
+
+    def record(self, row):
+        return json.loads(bytes(self.records[self.record_offsets[row]:self.record_offsets[row + 1]]))
+
+    def search(self, condition="", intervention="", phases=(), statuses=(), limit=20):
+        '''
+        :return: The number of matching trials, their counts by phase and status, and the
+            `limit` most recently started.
+        '''
+        rows = self.match(condition=condition, intervention=intervention, phases=phases, statuses=statuses)
+        starts = np.asarray(self.start) if rows is None else self.start[rows]
+        total = len(starts)
+        limit = max(limit, 0)
+        top = np.argpartition(-starts.astype(np.int64), limit - 1)[:limit] if 0 < limit < total else np.arange(total)[:limit]
+        top = top[np.argsort(-starts[top].astype(np.int64), kind="stable")]
+        return dict(
+            total=total,
+            facets=self.facet_counts(rows),
+            trials=[self.record(int(row if rows is None else rows[row])) for row in top],
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["build", "search", "bench"])
+    parser.add_argument("--index", type=str, default="data/trials")
+    parser.add_argument("--studies", type=str, action="append", default=[],
+                        help="a bulk export of ClinicalTrials.gov: a ZIP of JSON studies, JSONL, or a JSON page")
+    parser.add_argument("--condition", type=str, default="")
+    parser.add_argument("--intervention", type=str, default="")
+    parser.add_argument("--phase", type=str, action="append", default=[])
+    parser.add_argument("--status", type=str, action="append", default=[])
+    parser.add_argument("--rows", type=int, default=550_000, help="trials, for the benchmark")
+    args = parser.parse_args()
+
+    if args.action == "build":
+        builder = TrialIndexBuilder(args.index)
+        for path in args.studies:
+            builder.add_studies(path)
+        print(f"* built the index of {builder.build()} trials in {args.index}")
+    elif args.action == "search":
+        result = TrialIndex(args.index).search(args.condition, args.intervention, args.phase, args.status, limit=10)
+        print(json.dumps(result, indent=2))
+    elif args.action == "bench":
+        random.seed(0)
+        # a few conditions on many trials, and a long tail
+        conditions = ["Breast Cancer", "Diabetes Mellitus, Type 2", "Hypertension", "COVID-19", "Obesity", "Asthma"] \
+            + [f"Condition {i} Syndrome" for i in range(30_000)]
+        interventions = ["Placebo", "Metformin", "Pembrolizumab", "Exercise", "Aspirin"] \
+            + [f"Drug {i}" for i in range(50_000)]
+        phases = [[], ["EARLY_PHASE1"], ["PHASE1"], ["PHASE1", "PHASE2"], ["PHASE2"], ["PHASE2", "PHASE3"], ["PHASE3"], ["PHASE4"], ["NA"]]
+        statuses = ["COMPLETED", "RECRUITING", "UNKNOWN", "NOT_YET_RECRUITING", "TERMINATED", "WITHDRAWN", "ACTIVE_NOT_RECRUITING"]
+
+        def pick(values, common):
+            return random.choice(values[:common]) if random.random() < 0.3 else random.choice(values)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            started = time.perf_counter()
+            builder = TrialIndexBuilder(tmpdir)
+            for i in range(args.rows):
+                builder.add(dict(
+                    nct_id=f"NCT{i:08d}",
+                    title=f"A study {i}",
+                    status=random.choice(statuses),
+                    phases=random.choice(phases),
+                    conditions=[pick(conditions, 6) for _ in range(random.randint(1, 3))],
+                    interventions=[pick(interventions, 5) for _ in range(random.randint(1, 3))],
+                    start_date=f"{random.randint(1999, 2025)}-{random.randint(1, 12):02d}",
+                    enrollment=random.randint(10, 5000),
+                    condition_terms=[],
+                    intervention_terms=[],
+                ))
+            builder.build()
+            size = sum(child.stat().st_size for child in Path(tmpdir).iterdir())
+            print(f"* built {args.rows} trials in {time.perf_counter() - started:.1f}s, {size / 1e6:.0f}MB")
+
+            index = TrialIndex(tmpdir)
+            queries = [
+                dict(statuses=["recruiting"]),
+                dict(condition="breast cancer", phases=["3"], statuses=["recruiting"]),
+                dict(condition="diabetes", intervention="metformin"),
+                dict(condition="condition 123 syndrome", statuses=["completed", "terminated"]),
+                dict(intervention="placebo", phases=["phase 2", "phase 3"]),
+                dict(condition="covid 19"),
+            ]
+            for query in queries:
+                seconds = []
+                for _ in range(20):
+                    started = time.perf_counter()
+                    result = index.search(limit=20, **query)
+                    seconds.append(time.perf_counter() - started)
+                seconds.sort()
+                print(f"* {query}: {result['total']} trials, p50 {seconds[10] * 1000:.1f}ms, max {seconds[-1] * 1000:.1f}ms")
@@ -0,0 +1,343 @@
+#%% load libs
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
+from autogen_agentchat.messages import TextMessage
+from autogen_core import CancellationToken
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+from autogen_ext.tools.mcp import SseServerParams, create_mcp_server_session, mcp_server_tools
+
+from research_paper_analysis import create_team
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from llm_cache import ResponseCache
+
+print("* loaded libs")
+
+
+TASK_TEMPLATE = """
+Please analyze the following research paper and provide a summary of its findings:
+PMID: {pmid}
+
+Focus on:
+- Study design and methodology
+- Key findings and outcomes
+- Clinical implications
+- Any limitations or gaps in the research
+"""
+
+DEFAULT_MCP_URLS = [
+    "http://localhost:50001/sse",
+    "http://localhost:50002/sse",
+]
+
+
+def read_pmids(path):
+    '''
+    Read the PMIDs from a file, one per line. Blank lines, comments and duplicates are skipped.
+    '''
+    pmids = []
+    seen = set()
+    with open(path) as f:
+        for line in f:
+            pmid = line.strip()
+            if not pmid or pmid.startswith("#") or pmid in seen:
+                continue
+            seen.add(pmid)
+            pmids.append(pmid)
+    return pmids
+
+
+def read_checkpoint(path):
+    '''
+    Get the PMIDs that were already analyzed successfully.
+
+    The JSONL output is the checkpoint: every finished paper is appended and
+    flushed right away, so a rerun skips them. Failed papers are retried.
+    '''
+    completed = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be truncated if the previous run was killed
+                    continue
+                if "error" not in record:
+                    completed.add(record["pmid"])
+    except FileNotFoundError:
+        pass
+    return completed
+
+
+async def load_tools(stack, urls):
+    '''
+    Get the tools of all MCP servers over one persistent session per server.
+
+    The sessions are shared by every agent in the batch and closed with the stack.
+    '''
+    tools = []
+    for url in urls:
+        server_params = SseServerParams(url=url)
+        session = await stack.enter_async_context(create_mcp_server_session(server_params))
+        await session.initialize()
+        tools += await mcp_server_tools(server_params, session=session)
+    return tools
+
+
+# the PubMed server's tools that the runner calls itself, the agents don't need them
+RUNNER_TOOLS = ("prefetch_papers", "collapse_duplicates")
+
+
+def split_runner_tools(tools):
+    '''
+    Take the runner's tools out of the agents' tools: prefetch_papers, called for the
+    papers coming up, and collapse_duplicates, called on the list of papers.
+
+    :return: The agents' tools, and a dict of the runner's tools by name.
+    '''
+    agent_tools = []
+    runner_tools = {}
+    for tool in tools:
+        # the gateway namespaces them, e.g., pubmed__prefetch_papers
+        name = next((name for name in RUNNER_TOOLS if tool.name.endswith(name)), None)
+        if name is None:
+            agent_tools.append(tool)
+        else:
+            runner_tools[name] = tool
+    return agent_tools, runner_tools
+
+
+async def collapse_duplicates(pmids, collapse_tool, output):
+    '''
+    Keep one paper of each group of near duplicates (errata, duplicate publications,
+    preprints), so the same study is not analyzed twice. The others are recorded in
+    `output` with the PMID they duplicate.
+
+    :return: The PMIDs to analyze.
+    '''
+    # the content of the MCP result, the tool's dict as JSON text
+    content = await collapse_tool.run_json({"pmids": pmids}, CancellationToken())
+    result = json.loads("".join(item.text for item in content if hasattr(item, "text")))
+    with open(output, "a") as fout:
+        for pmid, duplicate_of in result["duplicate_of"].items():
+            fout.write(json.dumps(dict(pmid=pmid, duplicate_of=duplicate_of)) + "\n")
+    print(f"* {len(result['duplicate_of'])} near duplicates skipped")
+    return result["keep"]
+
+
+class BatchStats:
+    '''
+    Throughput and per-stage timing of a batch run.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.latencies = []
+        self.stage_seconds = defaultdict(list)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, record):
+        if "error" in record:
+            self.failed += 1
+            return
+
+        self.completed += 1
+        self.latencies.append(record["seconds"])
+        for stage, seconds in record["stages"].items():
+            self.stage_seconds[stage].append(seconds)
+        self.prompt_tokens += record["prompt_tokens"]
+        self.completion_tokens += record["completion_tokens"]
+
+    def papers_per_minute(self):
+        elapsed = time.perf_counter() - self.started
+        return self.completed / elapsed * 60 if elapsed > 0 else 0.0
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"* analyzed {self.completed} papers ({self.failed} failed) in {elapsed:.1f}s")
+        print(f"* throughput: {self.papers_per_minute():.1f} papers/min")
+        print(f"* tokens: {self.prompt_tokens} prompt, {self.completion_tokens} completion")
+        if not self.latencies:
+            return
+
+        latencies = sorted(self.latencies)
+        print(f"* latency per paper: mean {statistics.mean(latencies):.2f}s, "
+              f"p50 {latencies[len(latencies) // 2]:.2f}s, "
+              f"p95 {latencies[int(len(latencies) * 0.95)]:.2f}s")
+        for stage, seconds in self.stage_seconds.items():
+            print(f"  - {stage}: mean {statistics.mean(seconds):.2f}s, total {sum(seconds):.1f}s")
+
+
+async def analyze_paper(pmid, model_client, tools, max_messages=10):
+    '''
+    Run the extractor/summarizer team on one paper.
+
+    :return: A result record, with the time spent in each agent's turns as the stages.
+    '''
+    termination = TextMentionTermination("SUMMARY_COMPLETE") | MaxMessageTermination(max_messages)
+    team = create_team(model_client, tools, termination=termination)
+
+    outputs = {}
+    stages = defaultdict(float)
+    prompt_tokens = 0
+    completion_tokens = 0
+
+    started = last = time.perf_counter()
+    async for message in team.run_stream(task=TASK_TEMPLATE.format(pmid=pmid)):
+        if isinstance(message, TaskResult) or message.source == "user":
+            continue
+
+        # the time since the previous message was spent producing this one
+        now = time.perf_counter()
+        stages[message.source] += now - last
+        last = now
+
+        if message.models_usage is not None:
+            prompt_tokens += message.models_usage.prompt_tokens
+            completion_tokens += message.models_usage.completion_tokens
+        if isinstance(message, TextMessage):
+            outputs[message.source] = message.content
+
+    return dict(
+        pmid=pmid,
+        extraction=outputs.get("extractor", ""),
+        summary=outputs.get("summarizer", ""),
+        seconds=time.perf_counter() - started,
+        stages=dict(stages),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+    )
+
+
+async def run_batch(
+    pmids,
+    output,
+    model_client,
+    tools,
+    concurrency=8,
+    timeout=300,
+    max_messages=10,
+    log_every=100,
+    prefetch_tool=None,
+):
+    '''
+    Analyze the papers with at most `concurrency` of them in flight and append the results to `output`.
+
+    The model client and the tools are shared by all papers. With a `prefetch_tool`, each
+    paper is prefetched by the PubMed server when it is queued, so it is in the server's
+    cache by the time an agent asks for it.
+    '''
+    stats = BatchStats()
+    # a bounded queue keeps memory flat no matter how many PMIDs there are
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    with open(output, "a") as fout:
+        async def worker():
+            while True:
+                pmid = await queue.get()
+                if pmid is None:
+                    return
+
+                try:
+                    record = await asyncio.wait_for(
+                        analyze_paper(pmid, model_client, tools, max_messages=max_messages),
+                        timeout,
+                    )
+                except Exception as e:
+                    logging.error(f"* error analyzing {pmid}: {e}")
+                    record = dict(pmid=pmid, error=f"{type(e).__name__}: {e}")
+
+                fout.write(json.dumps(record) + "\n")
+                fout.flush()
+                stats.add(record)
+
+                done = stats.completed + stats.failed
+                if done % log_every == 0:
+                    print(f"* {done}/{len(pmids)} papers, {stats.papers_per_minute():.1f} papers/min")
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        for pmid in pmids:
+            # the queue is `concurrency * 2` deep, so that is how far ahead the prefetch runs
+            if prefetch_tool is not None:
+                try:
+                    await prefetch_tool.run_json({"text": TASK_TEMPLATE.format(pmid=pmid)}, CancellationToken())
+                except Exception as e:
+                    logging.warning(f"* error prefetching {pmid}: {e}")
+            await queue.put(pmid)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    return stats
+
+
+async def main(args):
+    completed = read_checkpoint(args.output)
+    pmids = [pmid for pmid in read_pmids(args.pmids) if pmid not in completed]
+    print(f"* {len(pmids)} papers to analyze, {len(completed)} already done")
+
+    async with AsyncExitStack() as stack:
+        tools, runner_tools = split_runner_tools(await load_tools(stack, args.mcp_url or DEFAULT_MCP_URLS))
+        if args.collapse_duplicates and "collapse_duplicates" in runner_tools:
+            pmids = await collapse_duplicates(pmids, runner_tools["collapse_duplicates"], args.output)
+        cache = None
+        client_kwargs = {}
+        if args.cache_dir:
+            # reruns of the same papers are served from the cache
+            cache = ResponseCache(args.cache_dir)
+            client_kwargs["http_client"] = cache.async_http_client()
+        model_client = OpenAIChatCompletionClient(model=args.model, **client_kwargs)
+        try:
+            stats = await run_batch(
+                pmids,
+                args.output,
+                model_client,
+                tools,
+                concurrency=args.concurrency,
+                timeout=args.timeout,
+                max_messages=args.max_messages,
+                prefetch_tool=None if args.no_prefetch else runner_tools.get("prefetch_papers"),
+            )
+        finally:
+            await model_client.close()
+
+    stats.report()
+    if cache is not None:
+        print(f"* response cache: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pmids", type=str, help="a file with one PMID per line")
+    parser.add_argument("--output", type=str, default="research_analysis.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per paper")
+    parser.add_argument("--max-messages", type=int, default=10)
+    parser.add_argument("--model", type=str, default="gpt-4.1-nano")
+    parser.add_argument("--mcp-url", type=str, action="append",
+                        help="an MCP server SSE URL, e.g., the gateway at http://localhost:50000/sse")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="don't prefetch the papers coming up on the PubMed server")
+    parser.add_argument("--collapse-duplicates", action="store_true",
+                        help="analyze one paper of each group of near duplicates, with the PubMed server's index")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="cache the model responses in this folder")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
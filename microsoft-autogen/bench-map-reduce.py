@@ -0,0 +1,117 @@
+#%% load libs
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
+from autogen_agentchat.teams import RoundRobinGroupChat
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from map_reduce_team import MapReduceTeam
+from research_paper_analysis import create_extractor, create_summarizer
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from stub_model import StubServer
+
+print("* loaded libs")
+
+
+# the MCP tool is replaced by a local one with a fixed latency,
+# so the benchmark runs without the MCP servers or the network
+TOOL_LATENCY = 0.05
+
+
+async def get_paper_abstract(pmid: str) -> str:
+    """Get the abstract of a paper from PubMed
+
+    Args:
+        pmid: The PubMed ID of the paper
+
+    Returns:
+        The abstract of the paper
+    """
+    await asyncio.sleep(TOOL_LATENCY)
+    return f"A randomized controlled trial (NCT0{pmid}) of {pmid} patients, the primary outcome improved."
+
+
+def make_task(pmids):
+    papers = "\n".join(f"{i + 1}. PMID: {pmid}" for i, pmid in enumerate(pmids))
+    return f"Please analyze the following research papers and provide a summary of their findings:\n{papers}"
+
+
+async def run_round_robin(model_client, tools, pmids):
+    # same as create_team(), but the extractor writes up the tool results like in the map step,
+    # otherwise the round-robin extractor would skip a model call and hand over the raw abstracts
+    termination = TextMentionTermination("SUMMARY_COMPLETE") | MaxMessageTermination(10)
+    team = RoundRobinGroupChat(
+        [create_extractor(model_client, tools, reflect_on_tool_use=True), create_summarizer(model_client)],
+        termination_condition=termination,
+    )
+    await team.run(task=make_task(pmids))
+
+
+async def run_map_reduce(model_client, tools, pmids, concurrency):
+    team = MapReduceTeam(model_client, tools, concurrency=concurrency)
+    await team.run(pmids)
+
+
+async def bench(server, model_client, sizes, repeats, concurrency):
+    tools = [get_paper_abstract]
+    rows = []
+    for n in sizes:
+        pmids = [str(36990608 + i) for i in range(n)]
+        for mode in ["round_robin", "map_reduce"]:
+            server.stats.reset()
+            seconds = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                if mode == "round_robin":
+                    await run_round_robin(model_client, tools, pmids)
+                else:
+                    await run_map_reduce(model_client, tools, pmids, concurrency)
+                seconds.append(time.perf_counter() - started)
+
+            stats = server.stats.to_dict()
+            rows.append(dict(
+                papers=n,
+                mode=mode,
+                seconds=statistics.median(seconds),
+                model_calls=stats["requests"] // repeats,
+                prompt_tokens=stats["prompt_tokens"] // repeats,
+            ))
+            print(f"* {mode} with {n} papers: {rows[-1]['seconds']:.2f}s")
+
+    print()
+    print(f"{'papers':>6} {'mode':<12} {'seconds':>8} {'speedup':>8} {'model calls':>12} {'prompt tokens':>14}")
+    baseline = {}
+    for row in rows:
+        if row["mode"] == "round_robin":
+            baseline[row["papers"]] = row["seconds"]
+        speedup = baseline[row["papers"]] / row["seconds"]
+        print(f"{row['papers']:>6} {row['mode']:<12} {row['seconds']:>8.2f} {speedup:>7.1f}x "
+              f"{row['model_calls']:>12} {row['prompt_tokens']:>14}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 10, 50])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.05)
+    parser.add_argument("--ms-per-token", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with StubServer(
+        port=args.port,
+        latency_ms=args.latency_ms,
+        ms_per_prompt_token=args.ms_per_prompt_token,
+        ms_per_token=args.ms_per_token,
+    ) as server:
+        model_client = OpenAIChatCompletionClient(model="gpt-4.1-nano", base_url=server.base_url, api_key="stub")
+        asyncio.run(bench(server, model_client, args.sizes, args.repeats, args.concurrency))
@@ -0,0 +1,148 @@
+#%% load libs
+import asyncio
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from autogen_agentchat.messages import BaseChatMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from team_selector import create_team
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from stub_model import StubPolicy, StubServer, message_text, read_conversation
+
+print("* loaded libs")
+
+
+# The speaker selections of the planning team, with the model on every turn or the rules
+# first. The agents and the selection get two stub models, so the selection calls and their
+# tokens are counted apart. The planner writes its plan in one of three styles:
+#   agents   "1. WebSearchAgent : Find ...", the format its system message asks for
+#   tools    "1. Search the web for ...", the tasks are routed by the agents' tools
+#   prose    no numbered plan, so the model picks every speaker but the first
+
+TASK = """Who was the Miami Heat player with the highest points in the 2006-2007 season, \n
+and what was the percentage change in his total rebounds between the 2007-2008 and 2008-2009 seasons?"""
+
+SEARCHES = [
+    "Miami Heat player with the highest points in the 2006-2007 season",
+    "total rebounds of Dwayne Wade in the Miami Heat season 2007-2008",
+    "total rebounds of Dwayne Wade in the Miami Heat season 2008-2009",
+]
+
+PLANS = dict(
+    agents="\n".join([f"{i + 1}. WebSearchAgent : Find the {search}" for i, search in enumerate(SEARCHES)]
+                     + ["4. DataAnalystAgent : Calculate the percentage change in his total rebounds"]),
+    tools="\n".join([f"{i + 1}. Search the web for the {search}" for i, search in enumerate(SEARCHES)]
+                    + ["4. Calculate the percentage change in his total rebounds between the two seasons"]),
+    prose="We need the points of the 2006-2007 season first, then the rebounds of the top scorer "
+          "in the next two seasons, and finally the percentage change between them.",
+)
+
+
+class TeamPolicy(StubPolicy):
+    '''
+    Plays the planner, the search agent, the analyst and the speaker selection.
+    '''
+
+    def __init__(self, plan_style):
+        super().__init__()
+        self.plan_style = plan_style
+
+    def tool_calls(self, messages, tools):
+        available = {tool["function"]["name"] for tool in tools}
+        user_text, called, _ = read_conversation(messages)
+        if "search_web_tool" in available:
+            searches = sum(name == "search_web_tool" for name, _ in called)
+            return [("search_web_tool", {"query": SEARCHES[searches]})] if searches < len(SEARCHES) else []
+        if "percentage_change_tool" in available and not called:
+            rebounds = re.findall(r"is (\d+)\.", user_text)
+            if len(rebounds) >= 2:
+                return [("percentage_change_tool", {"start": float(rebounds[-2]), "end": float(rebounds[-1])})]
+        return []
+
+    def answer(self, messages):
+        system_text = " ".join(message_text(m) for m in messages if m.get("role") == "system")
+        if system_text.startswith("Select an agent"):
+            return self.select(system_text)
+        if "planning agent" in system_text:
+            if any(m.get("name") == "DataAnalystAgent" for m in messages):
+                return "Dwayne Wade scored the most points, his rebounds changed by 86%.\nTERMINATE"
+            return PLANS[self.plan_style]
+        return "Please give me the data first?"
+
+    def select(self, prompt):
+        # the speaker after the last one, from the history in the prompt
+        roles, history = prompt.split("Current conversation context:", 1)
+        history = history.split("Read the above conversation", 1)[0]
+        names = re.findall(r"^(\w+): ", roles, re.MULTILINE)
+        blocks = re.split(rf"^({'|'.join(names)}): ", history, flags=re.MULTILINE)
+        last, text = (blocks[-2], blocks[-1]) if len(blocks) > 1 else ("user", "")
+        if last == "PlanningAgent":
+            return "WebSearchAgent"
+        if last == "WebSearchAgent":
+            return "DataAnalystAgent" if "2008-2009" in text else "WebSearchAgent"
+        return "PlanningAgent"
+
+
+async def run_task(model_client, selector_model_client, rules):
+    team, selector = create_team(model_client, selector_model_client, rules=rules)
+    started = time.perf_counter()
+    result = await team.run(task=TASK)
+    seconds = time.perf_counter() - started
+    speakers = [message.source for message in result.messages if isinstance(message, BaseChatMessage)]
+    return seconds, speakers, selector.stats if selector else {}
+
+
+async def bench(args):
+    rows = []
+    for style in PLANS:
+        for rules in (False, True):
+            with StubServer(port=args.port, latency_ms=args.latency_ms, ms_per_prompt_token=args.ms_per_prompt_token,
+                            ms_per_token=args.ms_per_token, policy=TeamPolicy(style)) as agent_server, \
+                    StubServer(port=args.port + 1, latency_ms=args.latency_ms, ms_per_prompt_token=args.ms_per_prompt_token,
+                               ms_per_token=args.ms_per_token, policy=TeamPolicy(style)) as selector_server:
+                model_client = OpenAIChatCompletionClient(model="gpt-4.1-nano", base_url=agent_server.base_url, api_key="stub")
+                selector_client = OpenAIChatCompletionClient(model="gpt-4.1-nano", base_url=selector_server.base_url, api_key="stub")
+                seconds = []
+                for _ in range(args.repeats):
+                    task_seconds, speakers, selections = await run_task(model_client, selector_client, rules)
+                    seconds.append(task_seconds)
+                stats = selector_server.stats.to_dict()
+            rows.append(dict(
+                style=style,
+                selector="rules" if rules else "model",
+                turns=len(speakers) - 1,
+                seconds=statistics.median(seconds),
+                calls=stats["requests"] / args.repeats,
+                tokens=(stats["prompt_tokens"] + stats["completion_tokens"]) / args.repeats,
+                selections=dict(selections),
+            ))
+            print(f"* {style} plan, {rows[-1]['selector']} selector: {' > '.join(speakers[1:])}")
+
+    print()
+    print(f"{'plan':<7} {'selector':<8} {'turns':>5} {'seconds':>8} {'selection calls':>16} {'tokens':>7} {'saved':>6}  rules")
+    baseline = {}
+    for row in rows:
+        baseline.setdefault(row["style"], row["tokens"])
+        saved = 1 - row["tokens"] / baseline[row["style"]]
+        rules = ", ".join(f"{rule} {count}" for rule, count in row["selections"].items() if not rule.startswith("model_"))
+        print(f"{row['style']:<7} {row['selector']:<8} {row['turns']:>5} {row['seconds']:>8.2f} {row['calls']:>16.1f} "
+              f"{row['tokens']:>7.0f} {saved:>6.0%}  {rules}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765, help="the agents' stub model, and the next port the selection's")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.05)
+    parser.add_argument("--ms-per-token", type=float, default=5.0)
+    args = parser.parse_args()
+
+    asyncio.run(bench(args))
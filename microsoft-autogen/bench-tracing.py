@@ -0,0 +1,115 @@
+#%% load libs
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from research_paper_analysis import create_team
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from stub_model import StubServer
+from tracing import MODES, RotatingFileSpanExporter, setup_tracing
+
+print("* loaded libs")
+
+
+# The per-turn cost of tracing the research team: each mode runs in its own process, since
+# OpenTelemetry takes one global tracer provider per process, against the stub model with
+# no latency, so what is left is the framework and the tracing. The autogen runtime traces
+# every message it delivers on top of the spans of the script. The spans are written to
+# files, like when no collector runs.
+
+TASK = """
+Please analyze the following research paper and provide a summary of its findings:
+PMID: {pmid}
+"""
+
+
+async def get_paper_abstract(pmid: str) -> str:
+    """Get the abstract of a paper from PubMed
+
+    Args:
+        pmid: The PubMed ID of the paper
+
+    Returns:
+        The abstract of the paper
+    """
+    return f"A randomized controlled trial (NCT0{pmid}) of {pmid} patients, the primary outcome improved."
+
+
+async def run_turns(model_client, tracer, turns, warmup=3):
+    seconds = []
+    for turn in range(warmup + turns):
+        pmid = str(36990608 + turn)
+        termination = TextMentionTermination("SUMMARY_COMPLETE") | MaxMessageTermination(10)
+        team = create_team(model_client, [get_paper_abstract], termination=termination)
+        started = time.perf_counter()
+        with tracer.start_as_current_span("analyze_paper") as span:
+            span.set_attribute("pmid", pmid)
+            await team.run(task=TASK.format(pmid=pmid))
+        if turn >= warmup:
+            seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def run_mode(args):
+    '''
+    Run the turns with one tracing mode, and print the result as JSON.
+    '''
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tracing = setup_tracing(
+            "bench-tracing",
+            mode=args.mode,
+            ratio=args.ratio,
+            exporter=None if args.mode == "off" else RotatingFileSpanExporter(tmpdir, "bench-tracing"),
+        )
+        with StubServer(port=args.port, latency_ms=0.0, ms_per_token=0.0) as server:
+            model_client = OpenAIChatCompletionClient(model="gpt-4.1-nano", base_url=server.base_url, api_key="stub")
+            seconds = asyncio.run(run_turns(model_client, tracing.tracer("bench-tracing"), args.turns))
+        tracing.shutdown()
+        print(json.dumps(dict(
+            mean=statistics.mean(seconds),
+            p50=statistics.median(seconds),
+            p95=sorted(seconds)[int(len(seconds) * 0.95)],
+            **tracing.stats(),
+        )))
+
+
+def bench(args):
+    rows = []
+    for mode in MODES:
+        command = [sys.executable, __file__, "--mode", mode, "--turns", str(args.turns),
+                   "--ratio", str(args.ratio), "--port", str(args.port)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+        print(f"* {mode}: {rows[-1]['mean'] * 1000:.1f}ms per turn")
+
+    baseline = rows[0]["mean"]
+    print()
+    print(f"{'mode':<6} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'overhead':>9} {'exported':>9} {'dropped':>8}")
+    for row in rows:
+        print(f"{row['mode']:<6} {row['mean'] * 1000:>8.1f} {row['p50'] * 1000:>8.1f} {row['p95'] * 1000:>8.1f} "
+              f"{row['mean'] / baseline - 1:>+8.1%} {row.get('exported', 0):>9} {row.get('dropped', 0):>8}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", type=str, default=None, choices=MODES, help="run one mode, by default all of them")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--ratio", type=float, default=0.1, help="the traces kept in head and tail modes")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+    else:
+        bench(args)
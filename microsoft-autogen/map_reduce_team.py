@@ -0,0 +1,164 @@
+#%% load libs
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from autogen_agentchat.messages import TextMessage, ToolCallSummaryMessage
+
+from research_paper_analysis import create_extractor, create_summarizer
+
+
+EXTRACT_TASK = """
+Please extract the key information from the research paper PMID: {pmid}
+
+Focus on:
+- Study design and methodology
+- Clinical trial IDs
+- Key findings and outcomes
+- Any limitations or gaps in the research
+"""
+
+REDUCE_TASK = """
+Please summarize the findings of the following {n} research papers.
+The information below was extracted from each paper separately.
+
+{extractions}
+"""
+
+
+@dataclass
+class PaperExtraction:
+    pmid: str
+    content: str = ""
+    error: str = ""
+    seconds: float = 0.0
+
+
+@dataclass
+class MapReduceResult:
+    extractions: list
+    summary: str
+    map_seconds: float
+    reduce_seconds: float
+
+
+def strip_marker(content, marker):
+    return content.replace(marker, "").strip()
+
+
+class MapReduceTeam:
+    '''
+    Analyze papers by fanning out one extractor per paper, then summarizing once.
+
+    Unlike the RoundRobinGroupChat, the extractors run concurrently and each one
+    only sees its own paper, and the summarizer only sees the final extractions
+    (not the tool calls), so its context grows with the number of papers only.
+    '''
+
+    def __init__(self, model_client, tools, concurrency=8, timeout=120):
+        '''
+        :param model_client: The model client shared by all agents.
+        :param tools: The MCP tools for the extractors.
+        :param concurrency: The max number of extractors running at once.
+        :param timeout: The max seconds per paper, a paper that times out is reported as failed.
+        '''
+        self.model_client = model_client
+        self.tools = tools
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    async def extract(self, pmid, semaphore):
+        async with semaphore:
+            started = time.perf_counter()
+            # agents keep the conversation in their state, so each paper gets its own
+            extractor = create_extractor(self.model_client, self.tools, reflect_on_tool_use=True)
+            try:
+                result = await asyncio.wait_for(
+                    extractor.run(task=EXTRACT_TASK.format(pmid=pmid)),
+                    self.timeout,
+                )
+                message = result.messages[-1]
+                if isinstance(message, (TextMessage, ToolCallSummaryMessage)):
+                    content = strip_marker(message.content, "EXTRACTION_COMPLETE")
+                else:
+                    content = message.to_text()
+                return PaperExtraction(pmid=pmid, content=content, seconds=time.perf_counter() - started)
+
+            except asyncio.TimeoutError:
+                logging.warning(f"* extraction of {pmid} timed out after {self.timeout}s")
+                error = f"timed out after {self.timeout}s"
+            except Exception as e:
+                logging.error(f"* error extracting {pmid}: {e}")
+                error = f"{type(e).__name__}: {e}"
+
+            return PaperExtraction(pmid=pmid, error=error, seconds=time.perf_counter() - started)
+
+    async def summarize(self, extractions):
+        sections = []
+        for extraction in extractions:
+            content = extraction.content or f"(extraction failed: {extraction.error})"
+            sections.append(f"## PMID: {extraction.pmid}\n{content}")
+
+        summarizer = create_summarizer(self.model_client)
+        result = await summarizer.run(task=REDUCE_TASK.format(
+            n=len(extractions),
+            extractions="\n\n".join(sections),
+        ))
+        return strip_marker(result.messages[-1].to_text(), "SUMMARY_COMPLETE")
+
+    async def run(self, pmids):
+        '''
+        Analyze the papers.
+
+        :param pmids: The PMIDs of the papers.
+        :return: A MapReduceResult with the extraction of every paper and the summary.
+        '''
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        # map
+        started = time.perf_counter()
+        extractions = await asyncio.gather(*[self.extract(pmid, semaphore) for pmid in pmids])
+        map_seconds = time.perf_counter() - started
+
+        # reduce
+        started = time.perf_counter()
+        summary = await self.summarize(extractions)
+        reduce_seconds = time.perf_counter() - started
+
+        return MapReduceResult(
+            extractions=list(extractions),
+            summary=summary,
+            map_seconds=map_seconds,
+            reduce_seconds=reduce_seconds,
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    from contextlib import AsyncExitStack
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
+    from batch_research_analysis import DEFAULT_MCP_URLS, load_tools
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pmids", type=str, nargs="+")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per paper")
+    parser.add_argument("--model", type=str, default="gpt-4.1-nano")
+    parser.add_argument("--mcp-url", type=str, action="append")
+    args = parser.parse_args()
+
+    async def main():
+        async with AsyncExitStack() as stack:
+            tools = await load_tools(stack, args.mcp_url or DEFAULT_MCP_URLS)
+            model_client = OpenAIChatCompletionClient(model=args.model)
+            team = MapReduceTeam(model_client, tools, concurrency=args.concurrency, timeout=args.timeout)
+            result = await team.run(args.pmids)
+            await model_client.close()
+
+        for extraction in result.extractions:
+            print(f"* {extraction.pmid} ({extraction.seconds:.1f}s): {extraction.content or extraction.error}")
+        print(f"\nSummary Results:\n{result.summary}")
+        print(f"\n* map {result.map_seconds:.1f}s, reduce {result.reduce_seconds:.1f}s")
+
+    asyncio.run(main())
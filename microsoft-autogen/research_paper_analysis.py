@@ -12,6 +12,102 @@ from autogen_ext.tools.mcp import SseServerParams, mcp_server_tools
 nest_asyncio.apply()
 print("* loaded libs")
 
+
+EXTRACTOR_SYSTEM_MESSAGE = """
+You are an expert in extracting information from research papers and clinical trials.
+Your role is to:
+1. Extract key information from papers using the provided tools
+2. Identify relevant clinical trial IDs, study designs, and outcomes
+3. Organize the extracted information in a structured format
+4. Pass the extracted information to the summarizer agent
+
+When you have completed extracting information, end your message with "EXTRACTION_COMPLETE".
+"""
+
+SUMMARIZER_SYSTEM_MESSAGE = """
+You are an expert in summarizing research findings and drawing conclusions.
+Your role is to:
+1. Review the extracted information from papers
+2. Identify key findings and patterns
+3. Draw meaningful conclusions
+4. Provide clear explanations of the findings
+5. Highlight any limitations or gaps in the research
+
+When you have completed the summary, end your message with "SUMMARY_COMPLETE".
+"""
+
+
+def create_extractor(model_client, tools, name="extractor", **kwargs):
+    """
+    Create the extractor agent - specialized in extracting information from papers.
+
+    Args:
+        model_client: The model client for the agent
+        tools: The MCP tools for the agent
+        name: The name of the agent, must be unique within a team
+        kwargs: Other options of the AssistantAgent
+    """
+    return AssistantAgent(
+        name=name,
+        model_client=model_client,
+        tools=tools,
+        system_message=EXTRACTOR_SYSTEM_MESSAGE,
+        **kwargs,
+    )
+
+
+def create_summarizer(model_client, name="summarizer", **kwargs):
+    """
+    Create the summarizer agent - specialized in summarizing and drawing conclusions.
+
+    Args:
+        model_client: The model client for the agent
+        name: The name of the agent, must be unique within a team
+        kwargs: Other options of the AssistantAgent
+    """
+    return AssistantAgent(
+        name=name,
+        model_client=model_client,
+        system_message=SUMMARIZER_SYSTEM_MESSAGE,
+        **kwargs,
+    )
+
+
+def create_agents(model_client, tools):
+    """
+    Create the extractor and summarizer agents.
+
+    Args:
+        model_client: The model client shared by both agents
+        tools: The MCP tools for the extractor
+    """
+    return create_extractor(model_client, tools), create_summarizer(model_client)
+
+
+def create_team(model_client, tools, termination=None):
+    """
+    Create the extractor/summarizer team.
+
+    Args:
+        model_client: The model client shared by both agents
+        tools: The MCP tools for the extractor
+        termination: The termination condition, stops at either agent's completion marker by default
+    """
+    extractor_agent, summarizer_agent = create_agents(model_client, tools)
+
+    # Define termination conditions
+    if termination is None:
+        extraction_termination = TextMentionTermination("EXTRACTION_COMPLETE")
+        summary_termination = TextMentionTermination("SUMMARY_COMPLETE")
+        termination = extraction_termination | summary_termination
+
+    # Create the team
+    return RoundRobinGroupChat(
+        [extractor_agent, summarizer_agent],
+        termination_condition=termination,
+    )
+
+
 async def main():
     #%% define MCP servers
     # Clinical Trial MCP server
@@ -30,51 +126,7 @@ async def main():
 
     #%% define the agents
     model_client = OpenAIChatCompletionClient(model="gpt-4.1-nano")
-
-    # Extractor Agent - Specialized in extracting information from papers
-    extractor_agent = AssistantAgent(
-        name="extractor",
-        model_client=model_client,
-        tools=clinical_trial_tools + pubmed_tools,
-        system_message="""
-        You are an expert in extracting information from research papers and clinical trials.
-        Your role is to:
-        1. Extract key information from papers using the provided tools
-        2. Identify relevant clinical trial IDs, study designs, and outcomes
-        3. Organize the extracted information in a structured format
-        4. Pass the extracted information to the summarizer agent
-        
-        When you have completed extracting information, end your message with "EXTRACTION_COMPLETE".
-        """,
-    )
-
-    # Summarizer Agent - Specialized in summarizing and drawing conclusions
-    summarizer_agent = AssistantAgent(
-        name="summarizer",
-        model_client=model_client,
-        system_message="""
-        You are an expert in summarizing research findings and drawing conclusions.
-        Your role is to:
-        1. Review the extracted information from papers
-        2. Identify key findings and patterns
-        3. Draw meaningful conclusions
-        4. Provide clear explanations of the findings
-        5. Highlight any limitations or gaps in the research
-        
-        When you have completed the summary, end your message with "SUMMARY_COMPLETE".
-        """,
-    )
-
-    # Define termination conditions
-    extraction_termination = TextMentionTermination("EXTRACTION_COMPLETE")
-    summary_termination = TextMentionTermination("SUMMARY_COMPLETE")
-    termination = extraction_termination | summary_termination
-
-    # Create the team
-    team = RoundRobinGroupChat(
-        [extractor_agent, summarizer_agent],
-        termination_condition=termination,
-    )
+    team = create_team(model_client, clinical_trial_tools + pubmed_tools)
 
     #%% example usage
     async def analyze_research_papers(task: str):
@@ -0,0 +1,280 @@
+#%% load libs
+import logging
+import re
+from collections import Counter
+
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
+from autogen_agentchat.messages import BaseChatMessage, ToolCallExecutionEvent
+from autogen_agentchat.teams import SelectorGroupChat
+from autogen_core.models import ModelFamily, SystemMessage, UserMessage
+
+
+# Speaker selection for SelectorGroupChat without a model call per turn.
+#
+# By default, the team asks the model who speaks next on every turn, with the whole
+# conversation in the prompt, so each selection costs more than the one before. Most turns
+# follow from the conversation itself, so a few rules pick the speaker first:
+#   first        nobody has spoken yet: the planner
+#   tool_error   the last speaker's tool call failed: the same agent, to retry
+#   question     the last speaker asked a question: ambiguous, see below
+#   assignment   the planner's latest plan, "1. <agent> : <task>" per line, gives the tasks
+#                in order, each one is done when its agent has spoken after the plan
+#   tool         a task of the plan that names no agent goes to the agent with the tool
+#                for it, e.g., "Search the web for ..." to the agent with search_web_tool
+#   plan_done    every task of the plan is done, or an agent wrote the termination text:
+#                the planner, to sum up and terminate
+# When no rule applies, the model picks the speaker, from the task and the last
+# `history_window` messages only.
+#
+#   selector = RuleBasedSelector(agents, planner="PlanningAgent", model_client=model_client,
+#                                selector_prompt=SELECTOR_PROMPT, tools={"WebSearchAgent": [search_web_tool]})
+#   team = SelectorGroupChat(agents, model_client=model_client, selector_func=selector.select_speaker)
+
+SELECTOR_PROMPT = """Select an agent to perform task.
+
+{roles}
+
+Current conversation context:
+{history}
+
+Read the above conversation, then select an agent from {participants} to perform the next task.
+Make sure the planner agent has assigned tasks before other agents start working.
+Only select one agent.
+"""
+
+DEFAULT_HISTORY_WINDOW = 6
+
+PLAN_LINE = re.compile(r"^\s*\d+[.)]\s*(.+?)\s*$", re.MULTILINE)
+ASSIGNMENT = re.compile(r"^\**([\w ]+?)\**\s*:\s*(.+)$")
+WORD = re.compile(r"[a-z]+")
+
+
+def tool_words(tool):
+    '''
+    The words of a tool's name that a task needing it mentions, e.g., search and web for search_web_tool.
+    '''
+    name = getattr(tool, "name", None) or getattr(tool, "__name__", None) or str(tool)
+    return set(WORD.findall(name.lower())) - {"tool", "get"}
+
+
+class RuleBasedSelector:
+    '''
+    A selector function for SelectorGroupChat: cheap rules pick the next speaker, and the
+    model only when they are ambiguous, with a truncated history.
+    '''
+
+    def __init__(
+        self,
+        agents,
+        planner,
+        model_client,
+        selector_prompt=SELECTOR_PROMPT,
+        tools=None,
+        termination_text="TERMINATE",
+        history_window=DEFAULT_HISTORY_WINDOW,
+    ):
+        '''
+        :param agents: The agents of the team.
+        :param planner: The name of the agent that assigns the tasks.
+        :param model_client: The model client for the ambiguous turns.
+        :param selector_prompt: The prompt for the model, with {roles}, {history} and {participants}.
+        :param tools: The tools of each agent, {agent name: [tool or tool name]}, to route the tasks with no agent.
+        :param termination_text: The text that ends the conversation.
+        :param history_window: The number of last messages the model sees, besides the task.
+        '''
+        self.names = [agent.name for agent in agents]
+        self.roles = "\n".join(re.sub(r"\s+", " ", f"{agent.name}: {agent.description}").strip() for agent in agents)
+        self.planner = planner
+        self.model_client = model_client
+        self.selector_prompt = selector_prompt
+        self.tool_words = {name: [tool_words(tool) for tool in agent_tools] for name, agent_tools in (tools or {}).items()}
+        self.termination_text = termination_text
+        self.history_window = history_window
+        # the selections by rule, and the model calls and their tokens
+        self.stats = Counter()
+
+    async def select_speaker(self, thread):
+        '''
+        The selector_func of the team: the next speaker, by the rules or the model.
+        '''
+        speaker, rule = self.select(thread)
+        if speaker is None:
+            speaker, rule = await self.select_with_model(thread), "model"
+        self.stats[rule] += 1
+        logging.debug(f"* selected {speaker} ({rule})")
+        return speaker
+
+    def route_task(self, task):
+        '''
+        :return: The agent of a plan's task: the one it names, or the only one with a tool for it.
+        '''
+        if (assignment := ASSIGNMENT.match(task)) is not None and assignment.group(1).strip() in self.names:
+            return assignment.group(1).strip(), "assignment"
+        words = set(WORD.findall(task.lower()))
+        agents = [name for name, tools in self.tool_words.items() if any(tool and tool <= words for tool in tools)]
+        if len(agents) == 1:
+            return agents[0], "tool"
+        return None, None
+
+    def select(self, thread):
+        '''
+        :return: The next speaker and the rule that picked it, or (None, None) when no rule applies.
+        '''
+        messages = [message for message in thread if isinstance(message, BaseChatMessage) and message.source in self.names]
+        if not messages:
+            return self.planner, "first"
+        last = messages[-1]
+
+        # the events of the last turn come after the previous chat message
+        for event in reversed(thread):
+            if event is last:
+                continue
+            if isinstance(event, BaseChatMessage):
+                break
+            if isinstance(event, ToolCallExecutionEvent) and any(result.is_error for result in event.content):
+                return last.source, "tool_error"
+
+        text = last.to_model_text()
+        if self.termination_text in text and last.source != self.planner:
+            return self.planner, "plan_done"
+        if text.rstrip().endswith("?"):
+            return None, None
+
+        # the latest plan, and the turns taken since
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].source == self.planner and (tasks := PLAN_LINE.findall(messages[index].to_model_text())):
+                break
+        else:
+            return None, None
+        done = 0
+        for message in messages[index + 1:]:
+            if done == len(tasks):
+                break
+            agent, _ = self.route_task(tasks[done])
+            if message.source == agent:
+                done += 1
+        if done == len(tasks):
+            return self.planner, "plan_done"
+        return self.route_task(tasks[done])
+
+    async def select_with_model(self, thread):
+        '''
+        Ask the model for the next speaker, with the task and the last messages of the conversation.
+        '''
+        messages = [message for message in thread if isinstance(message, BaseChatMessage)]
+        window = messages[:1] + messages[1:][-self.history_window:]
+        history = "\n".join(f"{message.source}: {message.to_model_text()}".rstrip() + "\n\n" for message in window)
+        prompt = self.selector_prompt.format(roles=self.roles, participants=str(self.names), history=history)
+        if ModelFamily.is_openai(self.model_client.model_info["family"]):
+            request = [SystemMessage(content=prompt)]
+        else:
+            request = [UserMessage(content=prompt, source="user")]
+
+        response = await self.model_client.create(messages=request)
+        self.stats["model_prompt_tokens"] += response.usage.prompt_tokens
+        self.stats["model_completion_tokens"] += response.usage.completion_tokens
+        content = response.content if isinstance(response.content, str) else ""
+        mentioned = [name for name in self.names if re.search(rf"(?<!\w){re.escape(name)}(?!\w)", content)]
+        # one attempt only, the planner can get the conversation back on track
+        return mentioned[0] if len(mentioned) == 1 else self.planner
+
+
+#%% the planning team of test-team-selector.py
+
+# Note: This example uses mock tools instead of real APIs for demonstration purposes
+def search_web_tool(query: str) -> str:
+    if "2006-2007" in query:
+        return """Here are the total points scored by Miami Heat players in the 2006-2007 season:
+        Udonis Haslem: 844 points
+        Dwayne Wade: 1397 points
+        James Posey: 550 points
+        ...
+        """
+    elif "2007-2008" in query:
+        return "The number of total rebounds for Dwayne Wade in the Miami Heat season 2007-2008 is 214."
+    elif "2008-2009" in query:
+        return "The number of total rebounds for Dwayne Wade in the Miami Heat season 2008-2009 is 398."
+    return "No data found."
+
+
+def percentage_change_tool(start: float, end: float) -> float:
+    return ((end - start) / start) * 100
+
+
+def create_agents(model_client):
+    planning_agent = AssistantAgent(
+        "PlanningAgent",
+        description="An agent for planning tasks, this agent should be the first to engage when given a new task.",
+        model_client=model_client,
+        system_message="""
+        You are a planning agent.
+        Your job is to break down complex tasks into smaller, manageable subtasks.
+        Your team members are:
+            WebSearchAgent: Searches for information
+            DataAnalystAgent: Performs calculations
+
+        You only plan and delegate tasks - you do not execute them yourself.
+
+        When assigning tasks, use this format:
+        1. <agent> : <task>
+
+        After all tasks are complete, summarize the findings and end with "TERMINATE".
+        """,
+    )
+
+    web_search_agent = AssistantAgent(
+        "WebSearchAgent",
+        description="An agent for searching information on the web.",
+        tools=[search_web_tool],
+        model_client=model_client,
+        system_message="""
+        You are a web search agent.
+        Your only tool is search_tool - use it to find information.
+        You make only one search call at a time.
+        Once you have the results, you never do calculations based on them.
+        """,
+    )
+
+    data_analyst_agent = AssistantAgent(
+        "DataAnalystAgent",
+        description="An agent for performing calculations.",
+        model_client=model_client,
+        tools=[percentage_change_tool],
+        system_message="""
+        You are a data analyst.
+        Given the tasks you have been assigned, you should analyze the data and provide results using the tools provided.
+        If you have not seen the data, ask for it.
+        """,
+    )
+    return [planning_agent, web_search_agent, data_analyst_agent]
+
+
+def create_team(model_client, selector_model_client=None, rules=True, history_window=DEFAULT_HISTORY_WINDOW):
+    '''
+    Create the planning team.
+
+    :param model_client: The model client of the agents.
+    :param selector_model_client: The model client for the speaker selection, the agents' by default.
+    :param rules: Whether the rules pick the speakers when they can, or the model on every turn.
+    :param history_window: The number of last messages the model sees, with the rules.
+    :return: The team, and its RuleBasedSelector or None.
+    '''
+    selector_model_client = selector_model_client or model_client
+    agents = create_agents(model_client)
+    selector = RuleBasedSelector(
+        agents,
+        planner="PlanningAgent",
+        model_client=selector_model_client,
+        tools={"WebSearchAgent": [search_web_tool], "DataAnalystAgent": [percentage_change_tool]},
+        history_window=history_window,
+    ) if rules else None
+    team = SelectorGroupChat(
+        agents,
+        model_client=selector_model_client,
+        termination_condition=TextMentionTermination("TERMINATE") | MaxMessageTermination(max_messages=10),
+        selector_prompt=SELECTOR_PROMPT,
+        allow_repeated_speaker=True,  # Allow an agent to speak multiple turns in a row.
+        selector_func=selector.select_speaker if selector else None,
+    )
+    return team, selector
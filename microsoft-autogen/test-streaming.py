@@ -4,9 +4,18 @@ from autogen_ext.tools.mcp import StdioServerParams, mcp_server_tools
 from autogen_agentchat.messages import TextMessage
 from autogen_core import CancellationToken
 import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from step_metrics import StepMetrics, report
+
+# the time to first token, tokens and overhead of each step go to a local store,
+# compare the runs with `python common/step_metrics.py report --name streaming`
+metrics = StepMetrics("~/.cache/mcp-quick-start/metrics")
 
 # Create an agent that can use the fetch tool.
-model_client = OpenAIChatCompletionClient(model="gpt-4.1-nano")
+model_client = OpenAIChatCompletionClient(model="gpt-4.1-nano", http_client=metrics.async_http_client())
 agent = AssistantAgent(
     name="assistant",
     model_client=model_client,
@@ -16,11 +25,13 @@ agent = AssistantAgent(
 )  # type: ignore
 
 async def run():
-    async for message in agent.on_messages_stream(  # type: ignore
-        [TextMessage(content="Name two cities in South America", source="user")],
-        cancellation_token=CancellationToken(),
-    ):
-        print(message)
+    with metrics.run("streaming", framework="autogen"):
+        async for message in agent.on_messages_stream(  # type: ignore
+            [TextMessage(content="Name two cities in South America", source="user")],
+            cancellation_token=CancellationToken(),
+        ):
+            print(message)
+    report(metrics, metrics.runs(name="streaming", last=5))
 
 if __name__ == "__main__":
-    asyncio.run(run())
\ No newline at end of file
+    asyncio.run(run())
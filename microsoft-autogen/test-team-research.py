@@ -1,5 +1,8 @@
 #%% load libs
 import asyncio
+import sys
+from pathlib import Path
+
 import nest_asyncio
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.conditions import TextMentionTermination
@@ -9,28 +12,19 @@ from autogen_core.tools import FunctionTool
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from autogen_ext.tools.mcp import SseServerParams, mcp_server_tools
 
-# OpenTelemetry imports
-from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-
-otel_exporter = OTLPSpanExporter(endpoint="http://localhost:4317", insecure=True)
-tracer_provider = TracerProvider(resource=Resource({"service.name": "autogen-test-agentchat"}))
-span_processor = BatchSpanProcessor(otel_exporter)
-tracer_provider.add_span_processor(span_processor)
-trace.set_tracer_provider(tracer_provider)
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from tracing import setup_tracing
 
-# we will get reference this tracer later using its service name
-# tracer = trace.get_tracer("autogen-test-agentchat")
+# OTLP gRPC to localhost:4317, or files under traces/ when no collector runs.
+# TRACING_MODE=off|head|tail|full picks how much is traced, e.g., tail for batch runs
+tracing = setup_tracing("autogen-test-agentchat")
 
 
 print("* loaded libs")
 
 
 async def main():
-    tracer = trace.get_tracer("autogen-test-agentchat")
+    tracer = tracing.tracer("autogen-test-agentchat")
     
     with tracer.start_as_current_span("research_analysis") as main_span:
         #%% define MCP servers
@@ -115,4 +109,5 @@ async def main():
         # Run the analysis
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
+    tracing.shutdown() 
\ No newline at end of file